@@ -0,0 +1,462 @@
+"""Offline benchmarks for the streaming simulator.
+
+Times value generation, per-tick row assembly, write coercion and a full
+generate-and-write loop against a recording stand-in for the Snowpark
+session, so no warehouse is needed. Results are written as JSON and can be
+compared against an earlier run:
+
+    python sim_bench.py --machines 10 --measures 8 --ticks 500 --output bench.json
+    python sim_bench.py --settings-file mill_settings.json --compare bench.json
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import time as time_module
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from sim_engine import (
+    apply_coercion_plan,
+    build_backfill_frame,
+    build_batch_frame,
+    backfill_timestamps,
+    compile_coercion_plan,
+    compile_fleet,
+    generate_fleet_block,
+    generate_measure_value,
+    write_frame,
+)
+from sim_runner import load_settings_file, prepare_run, run_simulator
+from sim_scheduler import MISSED_CATCH_UP, RATE_TICKS_PER_SECOND
+
+BENCHMARK_TABLE = ('BENCH_DB', 'BENCH', 'MACHINE_TBL')
+
+# The pre-change path each benchmark replaced; the report's ``speedups`` are baseline time / benchmark time
+BASELINES = {
+    'generate_block_per_tick': 'generate_measure_value',
+    'generate_block': 'generate_measure_value',
+    'generate_block_correlated_per_tick': 'generate_measure_value',
+    'coercion_compiled_plan': 'coercion_legacy',
+    'write_frame_compiled_plan': 'write_legacy',
+}
+BASELINE_NOTES = {
+    'generate_block_per_tick': "one vectorized call per live tick has a fixed cost of tens of microseconds, "
+                               "so at small fleet sizes (a few machines) it is slower than the baseline",
+    'generate_block_correlated_per_tick': "draws correlated values, which the uncorrelated per-value baseline doesn't; "
+                                          "it is typically slower than the baseline until fleets reach tens of machines",
+}
+
+
+class RecordingSession:
+    """Stand-in for a Snowpark session that counts the rows it is asked to write."""
+
+    def __init__(self):
+        self.rows = 0
+        self.writes = 0
+        self.file = self
+
+    def write_pandas(self, df, table_name, database=None, schema=None, **kwargs):
+        self._record(df)
+
+    def create_dataframe(self, data):
+        session = self
+
+        class Writer:
+            def mode(self, mode):
+                return self
+
+            def save_as_table(self, table_name):
+                session._record(data)
+
+        class Frame:
+            write = Writer()
+
+        return Frame()
+
+    def sql(self, query):
+        class Result:
+            def collect(self):
+                return []
+
+        return Result()
+
+    def put(self, local_path, stage_location, **kwargs):
+        return []
+
+    def _record(self, df):
+        self.rows += len(df)
+        self.writes += 1
+
+
+def synthetic_settings(n_machines=10, n_measures=8):
+    """Saved-settings dict (SETTINGS_TABLE.DATA layout) for a synthetic fleet.
+
+    Measures alternate between random FLOAT, random NUMBER(38,2) and additive
+    FLOAT columns so every generation and coercion branch is exercised.
+    """
+    measures = [f"MEASURE_{i + 1}" for i in range(n_measures)]
+    columns = [['MACHINE_NAME', 'TEXT'], ['BATCH_ID', 'TEXT'], ['TIMESTAMP', 'TIMESTAMP_NTZ']]
+    settings = {}
+    for i, measure in enumerate(measures):
+        if i % 3 == 2:
+            data_type = 'FLOAT'
+            settings[measure] = {'include': True, 'mode': 'additive', 'initial_value': 0.0,
+                                 'increment': 0.5, 'max_value': 100.0, 'data_type': data_type}
+        else:
+            data_type = 'NUMBER(38,2)' if i % 3 == 1 else 'FLOAT'
+            settings[measure] = {'include': True, 'mode': 'random', 'nominal_min': 100, 'nominal_max': 120,
+                                 'total_min': 90, 'total_max': 130, 'percent_outside': 10, 'data_type': data_type}
+        columns.append([measure, data_type])
+
+    machine_names = [f"MACHINE_{i + 1:03d}" for i in range(n_machines)]
+    database, schema, table = BENCHMARK_TABLE
+    return {
+        'table_info': {
+            'db': database,
+            'schema': schema,
+            'table': table,
+            'columns': columns,
+            'column_types': dict(columns),
+        },
+        'machine_configs': {
+            name: {'measure_columns': list(measures), 'settings': {m: dict(s) for m, s in settings.items()}}
+            for name in machine_names
+        },
+        'config': {
+            'write_frequency': 1,
+            'batch_id': 'BENCH_001',
+            'machine_names': machine_names,
+            'timestamp_data_type': 'TIMESTAMP_NTZ',
+            'current_timestamp': '2026-01-01T00:00:00',
+        },
+        'special_columns': {
+            'machine_name_column': 'MACHINE_NAME',
+            'batch_id_column': 'BATCH_ID',
+            'timestamp_column': 'TIMESTAMP',
+            'timestamp_mode': 'Custom',
+        },
+    }
+
+
+def measure(fn, repeat=5, rows=None):
+    """Time ``fn`` ``repeat`` times; returns seconds per run and rows/second when ``rows`` is given."""
+    timings = []
+    for _ in range(repeat):
+        started = time_module.perf_counter()
+        fn()
+        timings.append(time_module.perf_counter() - started)
+    result = {
+        'repeat': repeat,
+        'min_seconds': min(timings),
+        'median_seconds': statistics.median(timings),
+        'mean_seconds': statistics.mean(timings),
+    }
+    if rows:
+        result['rows'] = rows
+        result['rows_per_second'] = rows / result['median_seconds']
+    return result
+
+
+def bench_generate_measure_value(config, machine_configs, n_ticks):
+    # The per-value path the simulator used before settings were compiled into arrays
+    slots = [
+        (machine_configs[m]['settings'][measure], machine_configs[m]['settings'][measure].get('data_type', 'FLOAT'))
+        for m in config['machine_names']
+        for measure, s in machine_configs[m]['settings'].items() if s.get('include')
+    ]
+
+    def run():
+        current = [None] * len(slots)
+        for _ in range(n_ticks):
+            for i, (settings, data_type) in enumerate(slots):
+                current[i] = generate_measure_value(settings, data_type, current[i])
+    return run
+
+
+def bench_generate_block(config, machine_configs, n_ticks, per_tick):
+    def run():
+        fleet = compile_fleet(machine_configs, config['machine_names'])
+        if per_tick:
+            for _ in range(n_ticks):
+                generate_fleet_block(fleet, 1)
+        else:
+            generate_fleet_block(fleet, n_ticks)
+    return run
+
+
+def correlated_configs(machine_configs, rho=0.5):
+    """``machine_configs`` with each random measure correlated to the next one on every machine."""
+    configs = {}
+    for name, machine_config in machine_configs.items():
+        measures = [m for m, s in machine_config['settings'].items() if s.get('include') and s.get('mode') == 'random']
+        configs[name] = dict(machine_config, correlations={a: {b: rho} for a, b in zip(measures, measures[1:])})
+    return configs
+
+
+def bench_tick_assembly(config, machine_configs, columns, n_ticks):
+    def run():
+        fleet = compile_fleet(machine_configs, config['machine_names'])
+        timestamp = config['current_timestamp']
+        for _ in range(n_ticks):
+            build_batch_frame(config, fleet, columns, timestamp)
+    return run
+
+
+def bench_block_assembly(config, machine_configs, columns, n_ticks, compact=True):
+    config = dict(config, compact_dtypes=compact)
+    timestamps = backfill_timestamps(config['current_timestamp'],
+                                     config['current_timestamp'] + pd.Timedelta(seconds=n_ticks * config['write_frequency']),
+                                     config['write_frequency'])
+
+    def run():
+        fleet = compile_fleet(machine_configs, config['machine_names'])
+        build_backfill_frame(config, fleet, columns, timestamps)
+    return run
+
+
+def batch_footprint(config, machine_configs, columns, n_ticks):
+    """In-memory bytes per row of an ``n_ticks`` block with full and compact dtypes."""
+    timestamps = backfill_timestamps(config['current_timestamp'],
+                                     config['current_timestamp'] + pd.Timedelta(seconds=n_ticks * config['write_frequency']),
+                                     config['write_frequency'])
+    footprint = {}
+    for name, compact in (('full', False), ('compact', True)):
+        fleet = compile_fleet(machine_configs, config['machine_names'])
+        df = build_backfill_frame(dict(config, compact_dtypes=compact), fleet, columns, timestamps)
+        footprint[f'{name}_bytes_per_row'] = int(df.memory_usage(index=False, deep=True).sum()) / len(df)
+    footprint['ratio'] = footprint['compact_bytes_per_row'] / footprint['full_bytes_per_row']
+    return footprint
+
+
+def legacy_coercion(df, column_types):
+    """The row-wise type coercion of streaming_sim.py's original ``write_to_snowflake``, verbatim."""
+    preview_df = df.copy()
+
+    for col in preview_df.columns:
+        if col in column_types:
+            data_type = column_types[col].upper()
+
+            if any(int_type in data_type for int_type in ['INT', 'INTEGER', 'BIGINT', 'SMALLINT', 'TINYINT', 'BYTEINT']):
+                preview_df[col] = preview_df[col].astype('Int64')
+                preview_df[col] = preview_df[col].apply(lambda x: f"{int(x)}" if pd.notnull(x) else None)
+
+            elif 'DECIMAL' in data_type or 'NUMERIC' in data_type:
+                if '(' in data_type:
+                    scale = int(data_type.split(',')[1].split(')')[0])
+                    preview_df[col] = preview_df[col].round(scale)
+
+            elif 'FLOAT' in data_type or 'REAL' in data_type or 'DOUBLE' in data_type:
+                preview_df[col] = preview_df[col].round(6)
+
+            elif any(ts_type in data_type for ts_type in ['TIMESTAMP', 'DATETIME', 'DATE', 'TIME']):
+                if preview_df[col].dtype == 'datetime64[ns]':
+                    preview_df[col] = preview_df[col].dt.strftime('%Y-%m-%d %H:%M:%S')
+    return preview_df
+
+
+def legacy_write_to_snowflake(session, df, database, schema, table, column_types):
+    """The original ``write_to_snowflake`` without its Streamlit output, as the baseline for the write benchmarks."""
+    preview_df = legacy_coercion(df, column_types)
+    preview_df.head()
+
+    timestamp_columns = df.select_dtypes(include=['datetime64[ns]']).columns
+    for col in timestamp_columns:
+        df[col] = df[col].dt.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+    snowpark_df = session.create_dataframe(df)
+    table_name = f"{database}.{schema}.{table}"
+    snowpark_df.write.mode("append").save_as_table(table_name)
+    return True
+
+
+def legacy_frames(config, machine_configs, columns, n_ticks):
+    # Batches as the original main() built them: object strings, float64 values and nanosecond timestamps
+    fleet = compile_fleet(machine_configs, config['machine_names'])
+    frames = [build_batch_frame(dict(config, compact_dtypes=False), fleet, columns, config['current_timestamp'])
+              for _ in range(n_ticks)]
+    for df in frames:
+        for col in df.select_dtypes(include=['datetime64']).columns:
+            df[col] = df[col].astype('datetime64[ns]')
+    return frames
+
+
+def bench_coercion(config, machine_configs, columns, n_ticks, legacy):
+    column_types = config['column_types']
+    if legacy:
+        frames = legacy_frames(config, machine_configs, columns, n_ticks)
+
+        def run():
+            for df in frames:
+                legacy_coercion(df, column_types)
+        return run
+
+    fleet = compile_fleet(machine_configs, config['machine_names'])
+    frames = [build_batch_frame(config, fleet, columns, config['current_timestamp']) for _ in range(n_ticks)]
+
+    def run():
+        plan = compile_coercion_plan(column_types)
+        for df in frames:
+            apply_coercion_plan(df.copy(), plan)
+    return run
+
+
+def bench_write_frame(config, machine_configs, columns, n_ticks, legacy):
+    session = RecordingSession()
+    table = (config['selected_db'], config['selected_schema'], config['selected_table'])
+    if legacy:
+        frames = legacy_frames(config, machine_configs, columns, n_ticks)
+
+        def run():
+            for df in frames:
+                legacy_write_to_snowflake(session, df.copy(), *table, config['column_types'])
+        return run
+
+    fleet = compile_fleet(machine_configs, config['machine_names'])
+    frames = [build_batch_frame(config, fleet, columns, config['current_timestamp']) for _ in range(n_ticks)]
+    plan = compile_coercion_plan(config['column_types'])
+
+    def run():
+        for df in frames:
+            write_frame(session, df.copy(), *table, plan)
+    return run
+
+
+def bench_end_to_end(config, machine_configs, columns, n_ticks, sink_config=None):
+    def run():
+        session = RecordingSession()
+        # An unreachable rate with catch_up emits every tick separately as fast as the loop can go
+        run_config = dict(config, rate_mode=RATE_TICKS_PER_SECOND, target_rate=1e9,
+                          missed_deadline_policy=MISSED_CATCH_UP, **(sink_config or {}))
+        stats = run_simulator(session, run_config, machine_configs, columns, max_ticks=n_ticks, log=lambda message: None)
+        if stats['state'] == 'Failed':
+            raise RuntimeError(stats['last_error'])
+    return run
+
+
+def run_benchmarks(saved_data, n_ticks=200, repeat=5, only=None):
+    """Run every benchmark (or those named in ``only``) and return the JSON-ready results."""
+    config, machine_configs, columns = prepare_run(saved_data)
+    n_machines = len(config['machine_names'])
+    n_values = sum(
+        1 for m in config['machine_names'] for s in machine_configs[m]['settings'].values() if s.get('include')
+    )
+    rows = n_ticks * n_machines
+
+    benchmarks = {
+        'generate_measure_value': (bench_generate_measure_value(config, machine_configs, n_ticks), n_ticks * n_values),
+        'generate_block_per_tick': (bench_generate_block(config, machine_configs, n_ticks, True), n_ticks * n_values),
+        'generate_block': (bench_generate_block(config, machine_configs, n_ticks, False), n_ticks * n_values),
+        'generate_block_correlated_per_tick': (bench_generate_block(config, correlated_configs(machine_configs), n_ticks, True),
+                                               n_ticks * n_values),
+        'tick_assembly': (bench_tick_assembly(config, machine_configs, columns, n_ticks), rows),
+        'block_assembly': (bench_block_assembly(config, machine_configs, columns, n_ticks), rows),
+        'block_assembly_full_dtypes': (bench_block_assembly(config, machine_configs, columns, n_ticks, False), rows),
+        'coercion_legacy': (bench_coercion(config, machine_configs, columns, n_ticks, True), rows),
+        'coercion_compiled_plan': (bench_coercion(config, machine_configs, columns, n_ticks, False), rows),
+        'write_legacy': (bench_write_frame(config, machine_configs, columns, n_ticks, True), rows),
+        'write_frame_compiled_plan': (bench_write_frame(config, machine_configs, columns, n_ticks, False), rows),
+        'end_to_end': (bench_end_to_end(config, machine_configs, columns, n_ticks), rows),
+        'end_to_end_coalesced': (bench_end_to_end(config, machine_configs, columns, n_ticks,
+                                                  {'flush_rows': max(rows // 10, 1)}), rows),
+    }
+
+    results = {}
+    for name, (fn, n) in benchmarks.items():
+        if only and name not in only:
+            continue
+        results[name] = measure(fn, repeat, n)
+        # Values rather than rows for the generation benchmarks
+        if name.startswith('generate'):
+            results[name]['values'] = results[name].pop('rows')
+            results[name]['values_per_second'] = results[name].pop('rows_per_second')
+    speedups = {}
+    for name, baseline in BASELINES.items():
+        if name in results and baseline in results:
+            speedups[name] = {'baseline': baseline,
+                              'speedup': results[baseline]['median_seconds'] / results[name]['median_seconds']}
+            if name in BASELINE_NOTES:
+                speedups[name]['note'] = BASELINE_NOTES[name]
+    return {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'params': {'machines': n_machines, 'values_per_tick': n_values, 'ticks': n_ticks, 'repeat': repeat},
+        'results': results,
+        'speedups': speedups,
+        'footprint': batch_footprint(config, machine_configs, columns, n_ticks),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline):
+    """Median time ratio (current / baseline) per benchmark present in both runs."""
+    ratios = {}
+    for name, result in current['results'].items():
+        previous = baseline.get('results', {}).get(name)
+        if previous:
+            ratios[name] = result['median_seconds'] / previous['median_seconds']
+    return ratios
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark simulator generation, coercion and write paths offline")
+    parser.add_argument("--settings-file", help="Benchmark a saved settings JSON instead of a synthetic fleet")
+    parser.add_argument("--machines", type=int, default=10, help="Machines in the synthetic fleet")
+    parser.add_argument("--measures", type=int, default=8, help="Measures per machine in the synthetic fleet")
+    parser.add_argument("--ticks", type=int, default=200, help="Ticks generated per benchmark run")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per benchmark; the median is reported")
+    parser.add_argument("--only", nargs="+", help="Run only these benchmarks")
+    parser.add_argument("--output", help="Write results to this JSON file (default: print them)")
+    parser.add_argument("--compare", help="Earlier results JSON to compare median times against")
+    args = parser.parse_args(argv)
+
+    if args.settings_file:
+        saved_data = load_settings_file(args.settings_file)
+    else:
+        saved_data = synthetic_settings(args.machines, args.measures)
+    report = run_benchmarks(saved_data, args.ticks, args.repeat, args.only)
+
+    if args.compare:
+        with open(args.compare) as f:
+            report['compared_to'] = args.compare
+            report['ratios'] = compare(report, json.load(f))
+
+    for name, result in report['results'].items():
+        rate = result.get('rows_per_second') or result.get('values_per_second')
+        unit = 'rows/s' if 'rows_per_second' in result else 'values/s'
+        ratio = report.get('ratios', {}).get(name)
+        speedup = report['speedups'].get(name)
+        print(f"{name:<34} {result['median_seconds'] * 1000:>10.2f} ms {rate:>14,.0f} {unit}"
+              + (f"  x{speedup['speedup']:.2f} vs {speedup['baseline']}"
+                 + (" (slower)" if speedup['speedup'] < 1 else "") if speedup else "")
+              + (f"  x{ratio:.2f} vs baseline" if ratio else ""), flush=True)
+        if speedup and speedup.get('note'):
+            print(f"{'':<34} note: {speedup['note']}", flush=True)
+
+    footprint = report['footprint']
+    print(f"{'batch bytes per row':<34} {footprint['full_bytes_per_row']:>10.1f} full "
+          f"{footprint['compact_bytes_per_row']:>10.1f} compact (x{footprint['ratio']:.2f})", flush=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,958 @@
+import contextlib
+import hashlib
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+# Generation modes as stored in the compiled slot arrays
+MODE_RANDOM = 0
+MODE_ADDITIVE = 1
+
+_rng = np.random.default_rng()
+
+# Draws per slot per tick: outside-nominal roll, side coin flip, position in range
+DRAWS_PER_TICK = 3
+_GOLDEN_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+
+
+def is_truncated_type(data_type):
+    # Matches the 'INT' check generate_measure_value has always used
+    return 'INT' in (data_type or '').upper()
+
+
+def is_timestamp_type(data_type):
+    timestamp_types = [
+        'TIMESTAMP_NTZ', 'TIMESTAMP_LTZ', 'TIMESTAMP_TZ',
+        'TIMESTAMP', 'DATETIME', 'DATE', 'TIME'
+    ]
+    return any(ts_type in data_type.upper() for ts_type in timestamp_types)
+
+
+def format_timestamp_for_snowflake(timestamp_value, data_type):
+    if timestamp_value is None:
+        return None
+
+    data_type = data_type.upper()
+    if 'TIME' in data_type and 'TIMESTAMP' not in data_type and 'DATETIME' not in data_type:
+        return timestamp_value.time()
+    elif 'DATE' in data_type and 'TIME' not in data_type:
+        return timestamp_value.date()
+    else:
+        return timestamp_value
+
+
+def generate_measure_value(settings, data_type, current_value=None, rng=None):
+    # rng is a random.Random for reproducible values; the module-level generator otherwise
+    rng = rng or random
+    if settings['mode'] == 'random':
+        outside_nominal = rng.uniform(0, 100) < settings['percent_outside']
+
+        if outside_nominal:
+            can_go_below = settings['total_min'] < settings['nominal_min']
+            can_go_above = settings['total_max'] > settings['nominal_max']
+
+            if can_go_above and not can_go_below:
+                value = rng.uniform(settings['nominal_max'], settings['total_max'])
+            elif can_go_below and not can_go_above:
+                value = rng.uniform(settings['total_min'], settings['nominal_min'])
+            elif can_go_above and can_go_below:
+                if rng.choice([True, False]):
+                    value = rng.uniform(settings['total_min'], settings['nominal_min'])
+                else:
+                    value = rng.uniform(settings['nominal_max'], settings['total_max'])
+            else:
+                value = rng.uniform(settings['nominal_min'], settings['nominal_max'])
+        else:
+            value = rng.uniform(settings['nominal_min'], settings['nominal_max'])
+
+        if 'INT' in data_type.upper():
+            value = int(value)
+
+        return value
+
+    elif settings['mode'] == 'additive':
+        if current_value is None:
+            value = settings['initial_value']
+        else:
+            value = current_value + settings['increment']
+            value = min(value, settings['max_value'])
+
+        if 'INT' in data_type.upper():
+            value = int(value)
+
+        return value
+
+
+def build_slot_params(machine_configs, machine_names, measures=None):
+    """Flatten the included (machine, measure) settings into parallel arrays.
+
+    Each included measure of each machine becomes one "slot". ``measures``
+    fixes the measure axis order; by default it is every included measure in
+    first-seen order.
+    """
+    slots = []
+    for machine_index, machine_name in enumerate(machine_names):
+        machine_config = machine_configs.get(machine_name, {})
+        for measure in machine_config.get('measure_columns', []):
+            settings = machine_config.get('settings', {}).get(measure, {})
+            if settings.get('include', False) and settings.get('mode') in ('random', 'additive'):
+                slots.append((machine_index, machine_name, measure, settings))
+
+    if measures is None:
+        measures = []
+        for _, _, measure, _ in slots:
+            if measure not in measures:
+                measures.append(measure)
+    else:
+        measures = list(measures)
+        slots = [slot for slot in slots if slot[2] in measures]
+    measure_lookup = {measure: i for i, measure in enumerate(measures)}
+
+    def column(key, default=0.0):
+        return np.array([float(s.get(key, default) or 0.0) for _, _, _, s in slots], dtype=np.float64)
+
+    correlation, correlation_row = _correlation_params(machine_configs, machine_names, measures, slots)
+    params = {
+        'machine_names': list(machine_names),
+        'measures': measures,
+        'keys': [f"{machine_name}_{measure}" for _, machine_name, measure, _ in slots],
+        'machine_index': np.array([m for m, _, _, _ in slots], dtype=np.intp),
+        'measure_index': np.array([measure_lookup[measure] for _, _, measure, _ in slots], dtype=np.intp),
+        'mode': np.array([MODE_ADDITIVE if s['mode'] == 'additive' else MODE_RANDOM for _, _, _, s in slots], dtype=np.int8),
+        'is_int': np.array([is_truncated_type(s.get('data_type', '')) for _, _, _, s in slots], dtype=bool),
+        'nominal_min': column('nominal_min'),
+        'nominal_max': column('nominal_max'),
+        'total_min': column('total_min'),
+        'total_max': column('total_max'),
+        'percent_outside': column('percent_outside'),
+        'initial_value': column('initial_value'),
+        'increment': column('increment'),
+        'max_value': column('max_value'),
+        'correlation': correlation,
+        'correlation_row': correlation_row,
+    }
+    params['layout'] = _slot_layout(params)
+    return params
+
+
+def _slot_layout(params):
+    # Index arrays generate_block needs on every call; they depend only on modes, types and correlations
+    additive = params['mode'] == MODE_ADDITIVE
+    correlated = np.flatnonzero(params['correlation_row'] >= 0)
+    return {
+        'additive': np.flatnonzero(additive),
+        'additive_int': params['is_int'][additive],
+        'random_int': np.flatnonzero(params['is_int'] & ~additive),
+        'correlated': correlated,
+        'correlated_rows': params['correlation_row'][correlated],
+        'correlated_cols': params['measure_index'][correlated],
+    }
+
+
+def correlation_matrix(correlations, measures):
+    """Symmetric correlation matrix over ``measures`` from ``{measure: {other: rho}}``.
+
+    A pair can be given either way round; unset pairs are uncorrelated and
+    pairs naming a measure outside ``measures`` are ignored.
+    """
+    lookup = {measure: i for i, measure in enumerate(measures)}
+    matrix = np.eye(len(measures))
+    for measure, others in (correlations or {}).items():
+        for other, rho in (others or {}).items():
+            if measure not in lookup or other not in lookup or measure == other:
+                continue
+            rho = float(rho)
+            if not -1.0 <= rho <= 1.0:
+                raise ValueError(f"Correlation of {measure} and {other} must be between -1 and 1, got {rho}")
+            i, j = lookup[measure], lookup[other]
+            if matrix[i, j] != 0.0 and matrix[i, j] != rho:
+                raise ValueError(f"Correlation of {measure} and {other} is given twice ({matrix[i, j]} and {rho})")
+            matrix[i, j] = matrix[j, i] = rho
+    return matrix
+
+
+def correlation_factor(correlations, measures):
+    """``A`` with ``A @ A.T`` equal to the correlation matrix, to mix independent normals.
+
+    Raises ValueError when the correlations can't hold together (e.g. A and
+    B strongly correlated, B and C too, but A and C strongly anti-correlated).
+    """
+    eigenvalues, eigenvectors = np.linalg.eigh(correlation_matrix(correlations, measures))
+    if eigenvalues.min() < -1e-9:
+        raise ValueError(f"Correlations between {', '.join(measures)} are inconsistent (not a valid correlation matrix)")
+    return eigenvectors * np.sqrt(np.clip(eigenvalues, 0.0, None))
+
+
+def _correlation_params(machine_configs, machine_names, measures, slots):
+    # One (measures x measures) mixing matrix per machine with correlations, over its random-mode measures;
+    # additive measures follow their own ramp and take no draws, so they stay out
+    measure_lookup = {measure: j for j, measure in enumerate(measures)}
+    correlation_row = np.full(len(slots), -1, dtype=np.intp)
+    factors = []
+    for machine_index, machine_name in enumerate(machine_names):
+        correlations = machine_configs.get(machine_name, {}).get('correlations')
+        if not correlations:
+            continue
+        members = [(i, measure_lookup[measure]) for i, (m, _, measure, settings) in enumerate(slots)
+                   if m == machine_index and settings['mode'] == 'random']
+        if len(members) < 2:
+            continue
+        present = [j for _, j in members]
+        try:
+            factor = correlation_factor(correlations, [measures[j] for j in present])
+        except ValueError as e:
+            raise ValueError(f"{machine_name}: {e}") from None
+        full = np.zeros((len(measures), len(measures)))
+        full[np.ix_(present, present)] = factor
+        correlation_row[[i for i, _ in members]] = len(factors)
+        factors.append(full)
+    return (np.array(factors) if factors else None), correlation_row
+
+
+def slot_seeds(seed, keys):
+    """One 64-bit stream key per slot, derived from the run ``seed`` and the slot's name.
+
+    Keys depend only on the seed and ``f"{machine}_{measure}"``, never on slot
+    order, so any subset of the fleet (a shard) gets the same streams.
+    """
+    seeds = np.empty(len(keys), dtype=np.uint64)
+    for i, key in enumerate(keys):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+        spawn_key = (int.from_bytes(digest[:4], 'little'), int.from_bytes(digest[4:], 'little'))
+        seeds[i] = np.random.SeedSequence(int(seed), spawn_key=spawn_key).generate_state(1, dtype=np.uint64)[0]
+    return seeds
+
+
+def counter_draws(seeds, first_tick, n_ticks):
+    """Uniform draws in [0, 1) of shape (n_ticks, n_slots, DRAWS_PER_TICK).
+
+    Draw ``k`` of tick ``t`` for a slot is element ``t * DRAWS_PER_TICK + k``
+    of that slot's SplitMix64 stream, computed directly from the counter, so
+    the values for a tick are the same however ticks are chunked, sharded or
+    ordered. ``first_tick`` is one number, or one per slot when slots have
+    emitted different numbers of rows (machines on their own cadence).
+    """
+    first = np.asarray(first_tick, dtype=np.uint64) * np.uint64(DRAWS_PER_TICK)
+    counters = np.arange(n_ticks * DRAWS_PER_TICK, dtype=np.uint64).reshape(n_ticks, DRAWS_PER_TICK, 1) + first + np.uint64(1)
+    z = seeds[None, None, :] + counters * _GOLDEN_GAMMA
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    z = z ^ (z >> np.uint64(31))
+    return (z >> np.uint64(11)).transpose(0, 2, 1) * (1.0 / (1 << 53))
+
+
+def _random_block(params, n_ticks, rng, draws=None):
+    n_slots = len(params['mode'])
+    nominal_min = params['nominal_min']
+    nominal_max = params['nominal_max']
+    can_go_below = params['total_min'] < nominal_min
+    can_go_above = params['total_max'] > nominal_max
+
+    if draws is None:
+        draws = rng.random((n_ticks, n_slots, DRAWS_PER_TICK))
+    outside = draws[..., 0] * 100 < params['percent_outside']
+    # Same above/below rule as generate_measure_value; a coin flip only matters when both sides are open
+    below = outside & can_go_below & (~can_go_above | (draws[..., 1] < 0.5))
+    above = outside & can_go_above & ~below
+
+    low = np.where(below, params['total_min'], np.where(above, nominal_max, nominal_min))
+    high = np.where(below, nominal_min, np.where(above, params['total_max'], nominal_max))
+    return low + (high - low) * draws[..., 2]
+
+
+def _additive_block(increment, max_value, is_int, n_ticks, state):
+    # v[k] = min(v[k-1] + increment, max_value), truncated every step for INT columns
+    start = state
+    if n_ticks == 1 or increment.ndim == 2 or max_value.ndim == 2:
+        # A single tick, or per-tick settings from a scenario: walk the ticks, still vectorized across slots
+        values = np.empty((n_ticks, len(start)))
+        current = start.copy()
+        for tick in range(n_ticks):
+            current = np.minimum(current + (increment[tick] if increment.ndim == 2 else increment),
+                                 max_value[tick] if max_value.ndim == 2 else max_value)
+            current[is_int] = np.trunc(current[is_int])
+            values[tick] = current
+        return values
+    steps = np.arange(1, n_ticks + 1, dtype=np.float64)[:, None]
+
+    rising = np.minimum(start + steps * increment, max_value)
+    # A negative increment can only be capped on the first step
+    falling = np.minimum(start + increment, max_value) + (steps - 1) * increment
+    values = np.where(increment >= 0, rising, falling)
+
+    if is_int.any():
+        integral = is_int & (start == np.trunc(start)) & (increment == np.trunc(increment))
+        values[:, is_int & integral & (increment >= 0)] = np.trunc(values[:, is_int & integral & (increment >= 0)])
+        # Truncating the capped first value shifts the whole falling sequence
+        falling_int = is_int & integral & (increment < 0)
+        if falling_int.any():
+            first = np.trunc(np.minimum(start[falling_int] + increment[falling_int], max_value[falling_int]))
+            values[:, falling_int] = first + (steps - 1) * increment[falling_int]
+        # Fractional starts or increments truncate differently each step, so walk those slots tick by tick
+        stepwise = np.flatnonzero(is_int & ~integral)
+        if len(stepwise):
+            current = start[stepwise].copy()
+            for tick in range(n_ticks):
+                current = np.trunc(np.minimum(current + increment[stepwise], max_value[stepwise]))
+                values[tick, stepwise] = current
+    return values
+
+
+def _normal_cdf(z):
+    # Abramowitz & Stegun 7.1.26 (error below 1.5e-7), vectorized since numpy has no erf
+    x = np.abs(z) / np.sqrt(2.0)
+    t = 1.0 / (1.0 + 0.3275911 * x)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    half_tail = 0.5 * poly * np.exp(-x * x)
+    return np.where(z >= 0, 1.0 - half_tail, half_tail)
+
+
+def _range_quantile(params, slots, u):
+    """Value at quantile ``u`` of each slot's random-mode distribution.
+
+    The same distribution ``_random_block`` samples: ``percent_outside`` of
+    the mass split between the open sides of the total range (evenly when
+    both are open) and the rest uniform over the nominal range, so the
+    values keep their ranges and out-of-range rate whatever ``u`` is drawn
+    from.
+    """
+    nominal_min = params['nominal_min'][..., slots]
+    nominal_max = params['nominal_max'][..., slots]
+    total_min = params['total_min'][..., slots]
+    total_max = params['total_max'][..., slots]
+    outside = np.clip(params['percent_outside'][..., slots] / 100.0, 0.0, 1.0)
+    can_go_below = total_min < nominal_min
+    can_go_above = total_max > nominal_max
+
+    below_mass = outside * np.where(can_go_below, np.where(can_go_above, 0.5, 1.0), 0.0)
+    above_mass = outside * np.where(can_go_above, np.where(can_go_below, 0.5, 1.0), 0.0)
+    nominal_mass = 1.0 - below_mass - above_mass
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(
+            u < below_mass,
+            total_min + (nominal_min - total_min) * (u / below_mass),
+            np.where(
+                u >= 1.0 - above_mass,
+                nominal_max + (total_max - nominal_max) * ((u - nominal_mass - below_mass) / above_mass),
+                nominal_min + (nominal_max - nominal_min) * ((u - below_mass) / nominal_mass)
+            )
+        )
+
+
+def _correlated_block(params, n_ticks, rng, draws=None, layout=None):
+    """Values for the slots of machines with correlations, shape (n_ticks, n_correlated).
+
+    A Gaussian copula: independent normals are mixed by each machine's
+    correlation factor in one batched matmul over (ticks, machines,
+    measures), turned into quantiles and mapped into each measure's ranges.
+    """
+    layout = layout or _slot_layout(params)
+    slots = layout['correlated']
+    rows = layout['correlated_rows']
+    cols = layout['correlated_cols']
+    if draws is None:
+        normals = rng.standard_normal((n_ticks, len(rows)))
+    else:
+        # Box-Muller on the slot's own counter draws keeps seeded runs reproducible across shards
+        draws = draws[:, slots]
+        normals = np.sqrt(-2.0 * np.log1p(-draws[..., 0])) * np.cos(2.0 * np.pi * draws[..., 1])
+
+    factors = params['correlation']
+    grid = np.zeros((n_ticks,) + factors.shape[:2])
+    grid[:, rows, cols] = normals
+    mixed = np.matmul(factors, grid[..., None])[..., 0]
+    return _range_quantile(params, slots, _normal_cdf(mixed[:, rows, cols]))
+
+
+def generate_block(params, n_ticks, state, rng=None, draws=None):
+    """Generate ``n_ticks`` values for every slot in one vectorized pass.
+
+    ``state`` holds the last additive value per slot (the initial value for
+    slots that have not emitted yet). ``draws`` (from ``counter_draws``)
+    replaces ``rng`` for seeded runs. Returns ``(values, new_state)`` where
+    ``values`` has shape (n_ticks, n_slots).
+    """
+    rng = rng if rng is not None else _rng
+    n_slots = len(params['mode'])
+    if n_ticks <= 0 or n_slots == 0:
+        return np.empty((max(n_ticks, 0), n_slots)), state
+
+    layout = params.get('layout') or _slot_layout(params)
+    values = _random_block(params, n_ticks, rng, draws)
+    if params.get('correlation') is not None:
+        values[:, layout['correlated']] = _correlated_block(params, n_ticks, rng, draws, layout)
+    random_int = layout['random_int']
+    if len(random_int):
+        values[:, random_int] = np.trunc(values[:, random_int])
+
+    new_state = state.copy()
+    additive = layout['additive']
+    if len(additive):
+        values[:, additive] = _additive_block(params['increment'][..., additive], params['max_value'][..., additive],
+                                              layout['additive_int'], n_ticks, state[additive])
+        new_state[additive] = values[-1, additive]
+    return values, new_state
+
+
+def compile_fleet(machine_configs, machine_names, current_measure_values=None, measures=None, seed=None):
+    """Compile the fleet configuration into the arrays the generator runs on.
+
+    Done once when a run starts: the result is the slot arrays from
+    ``build_slot_params`` plus ``state`` (the additive value of every slot,
+    seeded from ``current_measure_values`` or the initial value) and
+    ``slot_lookup`` mapping ``(machine_name, measure)`` to its slot. With a
+    ``seed`` every slot draws from its own reproducible stream (see
+    ``seed_fleet``).
+    """
+    fleet = build_slot_params(machine_configs, machine_names, measures)
+    current_measure_values = current_measure_values or {}
+    fleet['state'] = np.array([
+        current_measure_values.get(key, initial)
+        for key, initial in zip(fleet['keys'], fleet['initial_value'])
+    ], dtype=np.float64)
+    fleet['slot_lookup'] = {
+        (fleet['machine_names'][m], fleet['measures'][j]): i
+        for i, (m, j) in enumerate(zip(fleet['machine_index'], fleet['measure_index']))
+    }
+    if seed is not None:
+        seed_fleet(fleet, seed)
+    return fleet
+
+
+def seed_fleet(fleet, seed, first_tick=0):
+    """Give every slot of ``fleet`` its own stream derived from ``seed``.
+
+    Values then depend only on the seed, the machine and measure names and
+    the tick number (counted from ``first_tick``), so the same seed
+    reproduces the same data across reruns, shards and chunk sizes.
+    """
+    fleet['seed'] = int(seed)
+    fleet['slot_seeds'] = slot_seeds(seed, fleet['keys'])
+    fleet['tick'] = first_tick
+    return fleet
+
+
+def update_fleet_setting(fleet, machine_name, measure, key, value):
+    """Apply a live settings change (e.g. ``percent_outside`` or ``increment``) to a compiled fleet."""
+    slot = fleet['slot_lookup'].get((machine_name, measure))
+    if slot is not None and key in fleet:
+        fleet[key][slot] = value
+
+
+def fleet_measure_values(fleet):
+    """Current additive values keyed ``f"{machine_name}_{measure}"``, for display."""
+    return {
+        fleet['keys'][i]: int(fleet['state'][i]) if fleet['is_int'][i] else float(fleet['state'][i])
+        for i in np.flatnonzero(fleet['mode'] == MODE_ADDITIVE)
+    }
+
+
+def fleet_state(fleet):
+    """Unrounded additive values keyed like ``fleet_measure_values``, for seeding ``compile_fleet``."""
+    return {fleet['keys'][i]: float(fleet['state'][i]) for i in np.flatnonzero(fleet['mode'] == MODE_ADDITIVE)}
+
+
+def scenario_ticks(fleet, n_ticks, timestamps=None):
+    """Scenario timeline ticks of the next ``n_ticks`` rows.
+
+    Tick k falls k intervals after the scenario's ``scenario_start``, so
+    rows are placed by their ``timestamps`` when both are known; otherwise
+    they count on from ``fleet['scenario_tick']``.
+    """
+    start = fleet.get('scenario_start')
+    if timestamps is not None and start is not None:
+        seconds = (pd.DatetimeIndex(timestamps) - pd.Timestamp(start)).total_seconds()
+        return np.floor(np.asarray(seconds) / fleet['scenario']['interval'] + 1e-9).astype(np.int64)
+    return np.arange(fleet['scenario_tick'], fleet['scenario_tick'] + n_ticks)
+
+
+def scenario_values(entry, ticks):
+    """Values of one compiled scenario param (see sim_scenarios) for its slots at ``ticks``.
+
+    ``ticks`` broadcasts against the slots: a column ``(T, 1)`` gives a row
+    per tick, one tick per slot gives a single row. The events are replayed
+    in order at just those ticks.
+    """
+    ticks = np.asarray(ticks)
+    shape = np.broadcast_shapes(ticks.shape, entry['base'].shape)
+    values = np.array(np.broadcast_to(entry['base'], shape), dtype=np.float64)
+    ticks = np.broadcast_to(ticks, shape)
+    for columns, op, value, start, end, hold in entry['events']:
+        if not len(columns):
+            continue
+        tick = ticks[..., columns]
+        current = values[..., columns]
+        active = tick >= start if end is None else (tick >= start) & (tick < end)
+        if op == 'set':
+            changed = np.full_like(current, value)
+        elif op == 'scale':
+            changed = current * value
+        elif op == 'add':
+            changed = current + value
+        else:
+            # Linear from 1 at the first tick of the ramp to ``value`` at its last
+            steps = end - start
+            changed = current * (1.0 + (value - 1.0) * (tick - start) / (steps - 1)) if steps > 1 else current
+        current = np.where(active, changed, current)
+        if hold and end is not None:
+            if op == 'set':
+                held = np.full_like(current, value)
+            elif op == 'add':
+                held = current + value
+            else:
+                held = current * value
+            current = np.where(tick >= end, held, current)
+        values[..., columns] = current
+    return values
+
+
+def _scenario_params(fleet, ticks):
+    # Evaluate the scenario at the given ticks; ticks past the horizon keep its final state
+    scenario = fleet['scenario']
+    ticks = np.clip(ticks, 0, scenario['horizon'])
+    params = dict(fleet)
+    for key, entry in scenario['params'].items():
+        values = np.repeat(np.asarray(fleet[key], dtype=np.float64)[None, :], len(ticks), axis=0)
+        values[:, entry['slots']] = scenario_values(entry, ticks[:, None])
+        params[key] = values
+    return params
+
+
+def generate_fleet_block(fleet, n_ticks, rng=None, timestamps=None):
+    """Generate a (ticks x machines x measures) block for a compiled fleet.
+
+    Additive progress advances ``fleet['state']`` in place. Measures a
+    machine does not include are NaN. A compiled scenario (see
+    sim_scenarios) supplies per-tick settings for the slots it controls,
+    at the ticks the rows' ``timestamps`` fall on (see ``scenario_ticks``).
+    """
+    params = fleet
+    if fleet.get('scenario') and n_ticks:
+        ticks = scenario_ticks(fleet, n_ticks, timestamps)
+        params = _scenario_params(fleet, ticks)
+        fleet['scenario_tick'] = int(ticks[-1]) + 1
+    draws = None
+    if fleet.get('slot_seeds') is not None:
+        draws = counter_draws(fleet['slot_seeds'], fleet['tick'], n_ticks)
+        fleet['tick'] += n_ticks
+    values, fleet['state'] = generate_block(params, n_ticks, fleet['state'], rng, draws)
+    block = np.full((max(n_ticks, 0), len(fleet['machine_names']), len(fleet['measures'])), np.nan)
+    block[:, fleet['machine_index'], fleet['measure_index']] = values
+    return block
+
+
+# Compiled arrays with one entry per slot, as built by build_slot_params
+_SLOT_ARRAYS = ['machine_index', 'measure_index', 'mode', 'is_int', 'nominal_min', 'nominal_max', 'total_min', 'total_max',
+               'percent_outside', 'initial_value', 'increment', 'max_value', 'correlation_row']
+
+
+def _slot_subset(params, slots):
+    # The per-slot arrays restricted to ``slots``; fleet-wide entries (correlation factors) are shared
+    subset = dict(params, **{key: params[key][slots] for key in _SLOT_ARRAYS})
+    subset['layout'] = _slot_layout(subset)
+    return subset
+
+
+def generate_event_rows(fleet, machine_index, offsets=None, rng=None):
+    """Values for one row per event, shape (events x measures), for machines on their own cadence.
+
+    ``machine_index`` gives each event's machine, in time order. The k-th
+    event of each machine is generated in round k, so a batch takes as many
+    vectorized passes as its busiest machine has rows (usually one).
+    Additive state and seeded streams advance per machine, by the rows that
+    machine emitted. ``offsets`` (seconds since start) place each event on a
+    compiled scenario's tick timeline.
+    """
+    machine_index = np.asarray(machine_index, dtype=np.intp)
+    n_events = len(machine_index)
+    rows = np.full((n_events, len(fleet['measures'])), np.nan)
+    if not n_events:
+        return rows
+    seeded = fleet.get('slot_seeds') is not None
+    if seeded and fleet.get('slot_ticks') is None:
+        fleet['slot_ticks'] = np.full(len(fleet['mode']), fleet['tick'], dtype=np.int64)
+    scenario = fleet.get('scenario') if offsets is not None else None
+    if scenario:
+        # Tick k of the scenario timeline falls k intervals after start; each
+        # param's slots are evaluated once for the whole batch, (events x slots)
+        event_ticks = np.clip(np.floor(np.asarray(offsets) / scenario['interval'] + 1e-9).astype(np.int64),
+                              0, scenario['horizon'])
+        event_values = {key: scenario_values(entry, event_ticks[:, None]) for key, entry in scenario['params'].items()}
+
+    order = np.argsort(machine_index, kind='stable')
+    rank = np.empty(n_events, dtype=np.intp)
+    rank[order] = np.arange(n_events) - np.searchsorted(machine_index[order], machine_index[order])
+    for k in range(rank.max() + 1):
+        events = np.flatnonzero(rank == k)
+        event_of_machine = np.full(len(fleet['machine_names']), -1, dtype=np.intp)
+        event_of_machine[machine_index[events]] = events
+        slot_events = event_of_machine[fleet['machine_index']]
+        slots = np.flatnonzero(slot_events >= 0)
+        if not len(slots):
+            continue
+
+        params = _slot_subset(fleet, slots)
+        if scenario:
+            for key, entry in scenario['params'].items():
+                touched = np.flatnonzero(entry['mask'][slots])
+                if not len(touched):
+                    continue
+                # Each touched slot at its own event's tick
+                columns = np.searchsorted(entry['slots'], slots[touched])
+                values = np.array(params[key], dtype=np.float64)
+                values[touched] = event_values[key][slot_events[slots[touched]], columns]
+                params[key] = values
+        draws = None
+        if seeded:
+            draws = counter_draws(fleet['slot_seeds'][slots], fleet['slot_ticks'][slots], 1)
+            fleet['slot_ticks'][slots] += 1
+        values, state = generate_block(params, 1, fleet['state'][slots], rng, draws)
+        fleet['state'][slots] = state
+        rows[slot_events[slots], fleet['measure_index'][slots]] = values[0]
+    return rows
+
+
+def advance_timestamp(config, current_timestamp, interval=None):
+    """Return the timestamp for the next batch under the configured timestamp mode.
+
+    Custom timestamps move forward by ``interval`` seconds (``write_frequency``
+    unless given).
+    """
+    mode = config.get('timestamp_mode')
+    if mode == 'Current':
+        return datetime.now()
+    if mode == 'Custom':
+        if isinstance(current_timestamp, str):
+            current_timestamp = datetime.fromisoformat(current_timestamp)
+        return current_timestamp + timedelta(seconds=interval if interval is not None else config['write_frequency'])
+    return current_timestamp
+
+
+def advance_timestamps(config, current_timestamp, n_ticks, interval=None):
+    """Timestamps for ``n_ticks`` consecutive ticks, the last of which is the next batch.
+
+    Used when several due ticks are emitted together: Custom timestamps keep
+    their spacing and Current timestamps are spaced back from now.
+    """
+    interval = interval if interval is not None else config['write_frequency']
+    if not config.get('timestamp_column'):
+        return [current_timestamp] * n_ticks
+    if config.get('timestamp_mode') == 'Current':
+        now = datetime.now()
+        return [now - timedelta(seconds=(n_ticks - 1 - k) * interval) for k in range(n_ticks)]
+    timestamps = []
+    for _ in range(n_ticks):
+        current_timestamp = advance_timestamp(config, current_timestamp, interval)
+        timestamps.append(current_timestamp)
+    return timestamps
+
+
+def event_timestamps(config, start_timestamp, offsets):
+    """Timestamps ``offsets`` seconds after ``start_timestamp``, for rows from a ``CadenceScheduler``.
+
+    ``start_timestamp`` is when the run started: the Custom start timestamp,
+    or the wall clock at Start for Current timestamps.
+    """
+    if not config.get('timestamp_column'):
+        return [start_timestamp] * len(offsets)
+    if isinstance(start_timestamp, str):
+        start_timestamp = datetime.fromisoformat(start_timestamp)
+    return pd.Timestamp(start_timestamp) + pd.to_timedelta(np.asarray(offsets, dtype=np.float64), unit='s')
+
+
+def timed(timer, stage):
+    """``timer.time(stage)`` for a sim_metrics ``StageTimer``, or a no-op without one."""
+    return timer.time(stage) if timer is not None else contextlib.nullcontext()
+
+
+def build_batch_frame(config, fleet, columns, current_timestamp, rng=None, timer=None):
+    """Generate one tick for every machine of a compiled fleet as a DataFrame.
+
+    Columns follow ``columns`` (the table's column order); columns that are
+    neither special columns nor included measures are left as None.
+    """
+    with timed(timer, 'generate'):
+        block = generate_fleet_block(fleet, 1, rng, [current_timestamp] if config.get('timestamp_column') else None)
+    with timed(timer, 'assemble'):
+        return assemble_frame(config, fleet, columns, block, [current_timestamp])
+
+
+def compile_coercion_plan(column_types):
+    """Compile the per-column write rules for a table once.
+
+    Returns a list of ``(column, kind, arg)`` steps for
+    ``apply_coercion_plan``: ``int`` columns (and ``NUMBER(p,0)``) become
+    nullable Int64, ``NUMBER``/``DECIMAL``/``NUMERIC`` columns with a scale
+    are rounded to it and ``float`` columns to 6 places, and ``timestamp``
+    columns stay native datetime64.
+    """
+    plan = []
+    for col, data_type in column_types.items():
+        data_type = (data_type or '').upper()
+        scale = column_scale(data_type)
+        if any(int_type in data_type for int_type in ['INT', 'INTEGER', 'BIGINT', 'SMALLINT', 'TINYINT', 'BYTEINT']):
+            plan.append((col, 'int', None))
+        elif scale is not None:
+            plan.append((col, 'int', None) if scale == 0 else (col, 'round', scale))
+        elif 'FLOAT' in data_type or 'REAL' in data_type or 'DOUBLE' in data_type:
+            plan.append((col, 'round', 6))
+        elif 'TIMESTAMP' in data_type or 'DATETIME' in data_type:
+            plan.append((col, 'timestamp', None))
+    return plan
+
+
+def apply_coercion_plan(df, plan):
+    """Apply a compiled plan to ``df`` in place with vectorized casts and return it."""
+    for col, kind, arg in plan:
+        if col not in df.columns:
+            continue
+        series = df[col]
+        if kind == 'int':
+            # Narrow integer columns from compact batches are already exact
+            if not pd.api.types.is_integer_dtype(series.dtype):
+                df[col] = np.trunc(pd.to_numeric(series).astype('Float64')).astype('Int64')
+        elif kind == 'round':
+            if series.dtype == object:
+                series = pd.to_numeric(series)
+            df[col] = series.round(arg)
+        elif kind == 'timestamp':
+            if not pd.api.types.is_datetime64_any_dtype(series.dtype):
+                df[col] = pd.to_datetime(series)
+    return df
+
+
+def write_frame(session, df, database, schema, table, plan=None):
+    """Append ``df`` to ``database.schema.table`` through Snowpark.
+
+    With a coercion ``plan`` the frame is cast once with vectorized rules and
+    loaded with ``write_pandas`` keeping native types; without one
+    timestamps are sent as text as they always have been.
+    """
+    if plan is not None:
+        apply_coercion_plan(df, plan)
+        session.write_pandas(df, table, database=database, schema=schema, use_logical_type=True)
+        return
+
+    # Snowpark infers column types from plain values, so categorical columns go as their labels
+    for col in df.select_dtypes(include=['category']).columns:
+        df[col] = df[col].astype(object)
+    timestamp_columns = df.select_dtypes(include=['datetime64[ns]']).columns
+    for col in timestamp_columns:
+        df[col] = df[col].dt.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+    snowpark_df = session.create_dataframe(df)
+    table_name = f"{database}.{schema}.{table}"
+    snowpark_df.write.mode("append").save_as_table(table_name)
+
+
+def backfill_timestamps(start, end, write_frequency):
+    """Timestamps from ``start`` (inclusive) to ``end`` (exclusive) every ``write_frequency`` seconds."""
+    if isinstance(start, str):
+        start = datetime.fromisoformat(start)
+    if isinstance(end, str):
+        end = datetime.fromisoformat(end)
+    return pd.date_range(start=start, end=end, freq=pd.Timedelta(seconds=write_frequency), inclusive='left')
+
+
+def format_timestamp_column(timestamps, data_type):
+    # Vectorized counterpart of format_timestamp_for_snowflake
+    data_type = (data_type or '').upper()
+    timestamps = pd.DatetimeIndex(timestamps)
+    if 'TIME' in data_type and 'TIMESTAMP' not in data_type and 'DATETIME' not in data_type:
+        return np.array(timestamps.time, dtype=object)
+    elif 'DATE' in data_type and 'TIME' not in data_type:
+        return np.array(timestamps.date, dtype=object)
+    return timestamps.values
+
+
+def column_scale(data_type):
+    """Decimal places a ``NUMBER(p,s)``/``DECIMAL(p,s)`` column keeps, or None when the type doesn't say."""
+    data_type = (data_type or '').upper()
+    if any(t in data_type for t in ('NUMBER', 'DECIMAL', 'NUMERIC')) and '(' in data_type and ',' in data_type:
+        return int(data_type.split(',')[1].split(')')[0])
+    return None
+
+
+_INT_DTYPES = [np.int8, np.int16, np.int32, np.int64]
+
+
+def narrowest_int_dtype(low, high):
+    """Smallest signed integer dtype holding every value in ``[low, high]``."""
+    for dtype in _INT_DTYPES:
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return dtype
+    return np.int64
+
+
+def _column_plan(config, fleet, columns):
+    # How each table column is filled, resolved once per fleet and column layout
+    column_types = config.get('column_types') or {}
+    key = (tuple(columns), config.get('machine_name_column'), config.get('batch_id_column'), config.get('timestamp_column'),
+           tuple(column_types.get(col) for col in columns))
+    cached = fleet.get('column_plan')
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    plan = []
+    for col in columns:
+        if col == config.get('machine_name_column'):
+            plan.append((col, 'machine', None, False, None))
+        elif col == config.get('batch_id_column'):
+            plan.append((col, 'batch', None, False, None))
+        elif col == config.get('timestamp_column'):
+            plan.append((col, 'timestamp', None, False, None))
+        elif col in fleet['measures']:
+            measure_index = fleet['measures'].index(col)
+            is_int = bool(fleet['is_int'][fleet['measure_index'] == measure_index].any())
+            plan.append((col, 'measure', measure_index, is_int, column_scale(column_types.get(col))))
+        else:
+            plan.append((col, 'empty', None, False, None))
+    fleet['column_plan'] = (key, plan)
+    fleet['machine_name_array'] = np.array(fleet['machine_names'], dtype=object)
+    fleet['machine_dtype'] = pd.CategoricalDtype(fleet['machine_names'])
+    fleet['machine_codes'] = np.arange(len(fleet['machine_names']),
+                                       dtype=narrowest_int_dtype(-1, len(fleet['machine_names'])))
+    # Compact dtypes only ever widen, so consecutive batches (and the files they land in) keep one schema
+    fleet['compact_dtypes'] = {}
+    return plan
+
+
+def _compact_measure(fleet, col, values, is_int, scale):
+    # Narrowest dtype that writes the same values as float64/int64 would
+    compact = fleet['compact_dtypes']
+    if is_int:
+        present = values[~np.isnan(values)]
+        if not len(present):
+            return None
+        dtype = narrowest_int_dtype(present.min(), present.max())
+        if col in compact and np.dtype(compact[col]).itemsize > np.dtype(dtype).itemsize:
+            dtype = compact[col]
+        compact[col] = dtype
+        return dtype
+    # float32 only where the column's own rounding hides the difference; FLOAT columns would store the float32 error
+    if scale is None or compact.get(col) is np.float64:
+        return None
+    narrow = values.astype(np.float32)
+    if np.array_equal(np.round(narrow.astype(np.float64), scale), np.round(values, scale), equal_nan=True):
+        compact[col] = np.float32
+        return np.float32
+    compact[col] = np.float64
+    return None
+
+
+def assemble_frame(config, fleet, columns, block, timestamps, machine_index=None):
+    """Build a tick-major frame straight from a generated block, one typed column at a time.
+
+    ``block`` is (ticks x machines x measures) from ``generate_fleet_block``
+    and ``timestamps`` has one entry per tick. With ``machine_index`` the
+    block is instead (rows x measures) from ``generate_event_rows``, with a
+    machine and a timestamp per row. Measures are float64, or
+    int64 for INT columns (nullable Int64 when some machine doesn't include
+    the measure); nothing is built row by row.
+
+    With ``compact_dtypes`` (the default) the machine name and batch id are
+    categorical, INT measures use the narrowest integer width their values
+    need, and measures bound for ``NUMBER(p,s)``/``DECIMAL(p,s)`` columns
+    are float32 when that rounds to the same stored values.
+    """
+    plan = _column_plan(config, fleet, columns)
+    compact = config.get('compact_dtypes', True)
+    n_ticks = len(timestamps)
+    n_machines = len(fleet['machine_names'])
+    n_rows = n_ticks * n_machines if machine_index is None else len(machine_index)
+
+    data = {}
+    for col, kind, measure_index, is_int, scale in plan:
+        if kind == 'measure':
+            values = block[:, :, measure_index].reshape(-1) if machine_index is None else block[:, measure_index]
+            dtype = _compact_measure(fleet, col, values, is_int, scale) if compact else None
+            if is_int:
+                dtype = dtype or np.int64
+                missing = np.isnan(values)
+                if missing.any():
+                    data[col] = pd.arrays.IntegerArray(np.where(missing, 0, values).astype(dtype), missing)
+                else:
+                    data[col] = values.astype(dtype)
+            else:
+                data[col] = values if dtype is None else values.astype(dtype)
+        elif kind == 'machine':
+            if machine_index is not None:
+                codes = fleet['machine_codes'][machine_index]
+                data[col] = (pd.Categorical.from_codes(codes, dtype=fleet['machine_dtype']) if compact
+                             else fleet['machine_name_array'][machine_index])
+            elif compact:
+                codes = fleet['machine_codes']
+                data[col] = pd.Categorical.from_codes(codes if n_ticks == 1 else np.tile(codes, n_ticks),
+                                                      dtype=fleet['machine_dtype'])
+            else:
+                names = fleet['machine_name_array']
+                data[col] = names if n_ticks == 1 else np.tile(names, n_ticks)
+        elif kind == 'batch':
+            if compact:
+                data[col] = pd.Categorical.from_codes(np.zeros(n_rows, dtype=np.int8), categories=[config['batch_id']])
+            else:
+                data[col] = np.full(n_rows, config['batch_id'], dtype=object)
+        elif kind == 'timestamp':
+            formatted = format_timestamp_column(timestamps, config.get('timestamp_data_type'))
+            data[col] = formatted if machine_index is not None else np.repeat(formatted, n_machines)
+        else:
+            data[col] = np.full(n_rows, None, dtype=object)
+    # data is already in column order, which saves pandas a reindex per batch
+    return pd.DataFrame(data, copy=False)
+
+
+def build_backfill_frame(config, fleet, columns, timestamps, rng=None, timer=None):
+    """Generate one row per machine for every timestamp in ``timestamps``.
+
+    Rows are tick-major, matching what the live loop writes one tick at a
+    time, and additive state carries through the fleet's ``state`` so
+    consecutive chunks (or a later live run) continue the same progression.
+    """
+    with timed(timer, 'generate'):
+        block = generate_fleet_block(fleet, len(timestamps), rng, timestamps if config.get('timestamp_column') else None)
+    with timed(timer, 'assemble'):
+        return assemble_frame(config, fleet, columns, block, timestamps)
+
+
+def build_tick_frame(config, fleet, columns, timestamps, rng=None, timer=None):
+    """Frame for one or more due ticks; several ticks are assembled as a single batch."""
+    if len(timestamps) == 1:
+        return build_batch_frame(config, fleet, columns, timestamps[0], rng, timer)
+    return build_backfill_frame(config, fleet, columns, timestamps, rng, timer)
+
+
+def build_event_frame(config, fleet, columns, machine_index, timestamps, offsets=None, rng=None, timer=None):
+    """One row per due event from a ``CadenceScheduler``, all written as one batch."""
+    with timed(timer, 'generate'):
+        rows = generate_event_rows(fleet, machine_index, offsets, rng)
+    with timed(timer, 'assemble'):
+        return assemble_frame(config, fleet, columns, rows, timestamps, machine_index)
+
+
+def run_backfill(session, config, fleet, columns, start, end, chunk_rows=100000, write=write_frame, on_chunk=None):
+    """Generate ``[start, end)`` at the configured cadence as fast as possible.
+
+    The range is written in chunks of about ``chunk_rows`` rows. On return
+    ``config['current_timestamp']`` is the last timestamp written, so a live
+    Custom run started afterwards continues where the backfill stopped.
+    Returns a stats dict.
+    """
+    timestamps = backfill_timestamps(start, end, config['write_frequency'])
+    ticks_per_chunk = max(1, chunk_rows // max(1, len(fleet['machine_names'])))
+    stats = {'ticks': 0, 'total_rows': 0, 'chunks': 0, 'total_ticks': len(timestamps), 'last_timestamp': None}
+
+    for offset in range(0, len(timestamps), ticks_per_chunk):
+        chunk_timestamps = timestamps[offset:offset + ticks_per_chunk]
+        df = build_backfill_frame(config, fleet, columns, chunk_timestamps)
+        write(session, df, config['selected_db'], config['selected_schema'], config['selected_table'])
+
+        stats['ticks'] += len(chunk_timestamps)
+        stats['total_rows'] += len(df)
+        stats['chunks'] += 1
+        stats['last_timestamp'] = chunk_timestamps[-1].to_pydatetime()
+        config['current_timestamp'] = stats['last_timestamp']
+        if on_chunk:
+            on_chunk(stats)
+    return stats
@@ -0,0 +1,280 @@
+"""Whole-fleet machine settings as one table: one row per (machine, measure).
+
+The table is what the Configuration tab's bulk editor shows and what fleet
+files hold, so a 200-machine setup is one upload instead of thousands of
+widgets:
+
+- CSV: the table itself, one row per machine and measure
+- YAML: ``{"machines": {name: {"measures": {measure: settings}, "cadence": ..., "correlations": ...}}}``,
+  which also carries each machine's cadence and correlations
+
+``table_configs`` turns a table back into the ``machine_configs`` layout
+saved in SETTINGS_TABLE, and ``validate_table`` checks only the rows it is
+given, so an edit revalidates just the rows that changed (``changed_rows``).
+
+Usage from the command line (see sim_runner.py ``--fleet-file``):
+    python sim_fleet_table.py --settings-file settings.json --output fleet.csv
+"""
+import argparse
+import io
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from sim_engine import is_truncated_type
+
+MEASURE_MODES = ['random', 'additive']
+SETTING_COLUMNS = ['include', 'mode', 'nominal_min', 'nominal_max', 'total_min', 'total_max', 'percent_outside',
+                   'initial_value', 'max_value', 'increment']
+TABLE_COLUMNS = ['machine', 'measure'] + SETTING_COLUMNS
+FLEET_FORMATS = {'.csv': 'csv', '.yaml': 'yaml', '.yml': 'yaml'}
+
+_RANDOM_SETTINGS = ['nominal_min', 'nominal_max', 'total_min', 'total_max', 'percent_outside']
+_ADDITIVE_SETTINGS = ['initial_value', 'max_value', 'increment']
+# Machine-level settings carried alongside the measure rows
+_MACHINE_SETTINGS = ['cadence', 'correlations']
+
+
+def fleet_measures(config, columns):
+    """The table's measure columns: every column but the machine name, batch id and timestamp."""
+    special = [config.get('machine_name_column'), config.get('batch_id_column'), config.get('timestamp_column')]
+    return [col for col in columns if col not in special]
+
+
+def fleet_table(machine_configs, machine_names, measures):
+    """One row per machine and measure in ``measures``, in machine order.
+
+    Measures a machine doesn't include get ``include`` False and the
+    settings it last had (or none).
+    """
+    rows = []
+    for machine in machine_names:
+        settings = (machine_configs.get(machine) or {}).get('settings') or {}
+        for measure in measures:
+            measure_settings = settings.get(measure) or {}
+            row = {'machine': machine, 'measure': measure, 'include': bool(measure_settings.get('include', False)),
+                   'mode': measure_settings.get('mode') or MEASURE_MODES[0]}
+            for key in _RANDOM_SETTINGS + _ADDITIVE_SETTINGS:
+                row[key] = measure_settings.get(key, np.nan)
+            rows.append(row)
+    table = pd.DataFrame(rows, columns=TABLE_COLUMNS)
+    table[_RANDOM_SETTINGS + _ADDITIVE_SETTINGS] = table[_RANDOM_SETTINGS + _ADDITIVE_SETTINGS].astype(np.float64)
+    return table
+
+
+def changed_rows(before, after):
+    """Boolean mask of the rows of ``after`` that differ from ``before`` (all rows if the layout changed)."""
+    if before is None or len(before) != len(after) or not before.index.equals(after.index) \
+            or not before[['machine', 'measure']].equals(after[['machine', 'measure']]):
+        return np.ones(len(after), dtype=bool)
+    changed = np.zeros(len(after), dtype=bool)
+    for col in SETTING_COLUMNS:
+        old = before[col].to_numpy()
+        new = after[col].to_numpy()
+        same = old == new
+        if new.dtype.kind == 'f' or old.dtype.kind == 'f' or new.dtype == object:
+            same |= pd.isna(old) & pd.isna(new)
+        changed |= ~same
+    return changed
+
+
+def validate_table(table, rows=None):
+    """``{(machine, measure): message}`` for invalid included rows among ``rows`` (a mask; default all)."""
+    subset = table if rows is None else table[rows]
+    subset = subset[subset['include'].fillna(False).astype(bool)]
+    errors = {}
+
+    def flag(mask, message):
+        for machine, measure in subset.loc[mask, ['machine', 'measure']].itertuples(index=False):
+            errors.setdefault((machine, measure), message)
+
+    flag(~subset['mode'].isin(MEASURE_MODES), f"mode must be one of {MEASURE_MODES}")
+    random = subset['mode'] == 'random'
+    additive = subset['mode'] == 'additive'
+    flag(random & subset[_RANDOM_SETTINGS].isna().any(axis=1), f"random mode needs {', '.join(_RANDOM_SETTINGS)}")
+    flag(random & (subset['nominal_min'] > subset['nominal_max']), "nominal_min is above nominal_max")
+    flag(random & ((subset['total_min'] > subset['nominal_min']) | (subset['total_max'] < subset['nominal_max'])),
+         "the total range must contain the nominal range")
+    flag(random & ((subset['percent_outside'] < 0) | (subset['percent_outside'] > 100)),
+         "percent_outside must be between 0 and 100")
+    flag(additive & subset[_ADDITIVE_SETTINGS].isna().any(axis=1), f"additive mode needs {', '.join(_ADDITIVE_SETTINGS)}")
+    return errors
+
+
+def table_configs(table, column_types, previous=None):
+    """``(machine_names, machine_configs)`` from a fleet table.
+
+    Each machine's ``measure_columns`` are its included measures, and INT
+    measures get integer settings as the per-machine inputs produce.
+    Cadence and correlations are kept from ``previous`` configs.
+    """
+    previous = previous or {}
+    machine_names = list(dict.fromkeys(table['machine']))
+    machine_configs = {}
+    for machine in machine_names:
+        machine_configs[machine] = {'measure_columns': [], 'settings': {}}
+        for key in _MACHINE_SETTINGS:
+            if (previous.get(machine) or {}).get(key):
+                machine_configs[machine][key] = previous[machine][key]
+
+    for row in table.to_dict('records'):
+        machine_config = machine_configs[row['machine']]
+        if not row['include'] or pd.isna(row['include']):
+            machine_config['settings'][row['measure']] = {'include': False}
+            continue
+        data_type = column_types.get(row['measure'], 'FLOAT')
+        cast = int if is_truncated_type(data_type) else float
+        keys = _RANDOM_SETTINGS if row['mode'] == 'random' else _ADDITIVE_SETTINGS
+        settings = {'mode': row['mode']}
+        settings.update({key: cast(row[key]) for key in keys})
+        settings.update({'include': True, 'data_type': data_type})
+        machine_config['measure_columns'].append(row['measure'])
+        machine_config['settings'][row['measure']] = settings
+    return machine_names, machine_configs
+
+
+def resize_table(table, machine_names, template=None):
+    """The table for ``machine_names``: rows of removed machines dropped, new machines copied from ``template``.
+
+    ``template`` defaults to the first machine already in the table.
+    """
+    existing = list(dict.fromkeys(table['machine']))
+    template = template or (existing[0] if existing else None)
+    if template is None:
+        raise ValueError("Can't add machines to an empty fleet table; import one or add measures first")
+    template_rows = table[table['machine'] == template]
+    parts = []
+    for machine in machine_names:
+        if machine in existing:
+            parts.append(table[table['machine'] == machine])
+        else:
+            parts.append(template_rows.assign(machine=machine))
+    return pd.concat(parts, ignore_index=True) if parts else table.iloc[:0]
+
+
+def copy_down(table, machine, measures=None, columns=None):
+    """Copy ``machine``'s settings for ``measures`` (default all) to every machine after it in the table."""
+    columns = columns or SETTING_COLUMNS
+    table = table.copy()
+    machines = list(dict.fromkeys(table['machine']))
+    if machine not in machines:
+        raise ValueError(f"{machine!r} is not in the fleet table")
+    below = table['machine'].isin(machines[machines.index(machine) + 1:])
+    source = table[table['machine'] == machine].set_index('measure')[columns]
+    if measures is not None:
+        source = source.loc[[measure for measure in measures if measure in source.index]]
+    targets = below & table['measure'].isin(source.index)
+    table.loc[targets, columns] = source.loc[table.loc[targets, 'measure'], columns].to_numpy()
+    return table
+
+
+def fleet_file(table, machine_configs, fmt):
+    """CSV or YAML text for a fleet, as ``read_fleet_file`` reads it back."""
+    if fmt == 'csv':
+        return table.to_csv(index=False)
+    if fmt != 'yaml':
+        raise ValueError(f"Unknown fleet file format {fmt!r}; expected one of {sorted(set(FLEET_FORMATS.values()))}")
+    # PyYAML is only needed for YAML fleet files
+    import yaml
+    machines = {}
+    for machine in dict.fromkeys(table['machine']):
+        machine_config = machine_configs.get(machine) or {}
+        machines[machine] = {'measures': {
+            measure: {key: value for key, value in settings.items() if key != 'data_type'}
+            for measure, settings in (machine_config.get('settings') or {}).items()
+        }}
+        for key in _MACHINE_SETTINGS:
+            if machine_config.get(key):
+                machines[machine][key] = machine_config[key]
+    return yaml.safe_dump({'machines': machines}, sort_keys=False)
+
+
+def read_fleet_file(source, fmt, measures, column_types):
+    """``(machine_names, machine_configs, table)`` from a CSV or YAML fleet file (a path, text or file object)."""
+    if isinstance(source, (str, os.PathLike)) and os.path.exists(source):
+        with open(source) as f:
+            text = f.read()
+    elif isinstance(source, bytes):
+        text = source.decode('utf-8')
+    elif hasattr(source, 'read'):
+        text = source.read()
+        text = text.decode('utf-8') if isinstance(text, bytes) else text
+    else:
+        text = source
+
+    if fmt == 'csv':
+        table = pd.read_csv(io.StringIO(text))
+        missing = [col for col in ['machine', 'measure'] if col not in table.columns]
+        if missing:
+            raise ValueError(f"Fleet CSV needs columns {TABLE_COLUMNS}; missing {missing}")
+        for col in SETTING_COLUMNS:
+            if col not in table.columns:
+                table[col] = np.nan
+        table['include'] = table['include'].fillna(False).astype(bool)
+        table['mode'] = table['mode'].fillna(MEASURE_MODES[0])
+        table = table[TABLE_COLUMNS]
+        _raise_invalid(table)
+        machine_names, machine_configs = table_configs(table, column_types)
+        # Rows for every table measure, so the editor shows measures the file left out as not included
+        return machine_names, machine_configs, fleet_table(machine_configs, machine_names, measures)
+    if fmt != 'yaml':
+        raise ValueError(f"Unknown fleet file format {fmt!r}; expected one of {sorted(set(FLEET_FORMATS.values()))}")
+
+    import yaml
+    document = yaml.safe_load(text) or {}
+    machines = document.get('machines') if isinstance(document, dict) else None
+    if not isinstance(machines, dict):
+        raise ValueError("Fleet YAML needs a 'machines' mapping of machine name to its measures")
+    machine_configs = {}
+    for machine, machine_config in machines.items():
+        machine_config = machine_config or {}
+        settings = {}
+        for measure, measure_settings in (machine_config.get('measures') or {}).items():
+            settings[measure] = dict(measure_settings or {})
+            if settings[measure].get('include', True):
+                settings[measure]['include'] = True
+                settings[measure]['data_type'] = column_types.get(measure, 'FLOAT')
+        machine_configs[str(machine)] = {
+            'measure_columns': [measure for measure, s in settings.items() if s.get('include')],
+            'settings': settings,
+            **{key: machine_config[key] for key in _MACHINE_SETTINGS if machine_config.get(key)},
+        }
+    machine_names = list(machine_configs)
+    table = fleet_table(machine_configs, machine_names, measures)
+    _raise_invalid(table)
+    return machine_names, machine_configs, table
+
+
+def _raise_invalid(table):
+    # A fleet file is all or nothing: report the first invalid row rather than load part of it
+    errors = validate_table(table)
+    if errors:
+        (machine, measure), message = next(iter(errors.items()))
+        raise ValueError(f"{machine} {measure}: {message}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export a saved configuration's machine settings as a fleet CSV or YAML file")
+    parser.add_argument("--settings-file", required=True, help="JSON file with the same layout as SETTINGS_TABLE.DATA")
+    parser.add_argument("--output", required=True, help="Fleet file to write (.csv, .yaml or .yml)")
+    args = parser.parse_args(argv)
+
+    with open(args.settings_file) as f:
+        saved_data = json.load(f)
+    columns = [col[0] for col in (saved_data.get('table_info') or {}).get('columns') or []]
+    measures = fleet_measures(saved_data.get('special_columns') or {}, columns)
+    machine_configs = saved_data.get('machine_configs', {})
+    machine_names = (saved_data.get('config') or {}).get('machine_names') or list(machine_configs)
+
+    fmt = FLEET_FORMATS.get(os.path.splitext(args.output)[1].lower())
+    table = fleet_table(machine_configs, machine_names, measures)
+    with open(args.output, 'w') as f:
+        f.write(fleet_file(table, machine_configs, fmt))
+    print(f"Wrote {len(machine_names)} machines x {len(measures)} measures to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
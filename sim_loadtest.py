@@ -0,0 +1,253 @@
+"""Ramp the simulator against its sink until writes can no longer keep up.
+
+Each step runs the saved configuration with more machines and/or a higher
+tick rate for a fixed time and records the sustained write rate, write
+latency percentiles, error rate and queue growth. The first step that
+falls short of its target marks the saturation point; the step before it
+is the sustainable capacity.
+
+Usage:
+    python sim_loadtest.py --settings-file settings.json --sink simulated --steps 6
+    python sim_loadtest.py --settings-name Default --connection my_conn --machine-factor 2 --rate-factor 1
+"""
+import argparse
+import csv
+import json
+import time as time_module
+
+import numpy as np
+
+from sim_runner import create_session, load_settings_file, load_settings_from_table, prepare_run, run_simulator
+from sim_scheduler import MISSED_COALESCE, RATE_TICKS_PER_SECOND, tick_interval
+from sim_sinks import OFFLINE_SINKS, SINKS
+
+REPORT_COLUMNS = [
+    'step', 'machines', 'target_ticks_per_second', 'target_rows_per_second', 'sustained_rows_per_second',
+    'write_latency_p50', 'write_latency_p95', 'write_latency_p99', 'error_rate', 'queue_growth_per_second',
+    'max_queue_depth', 'dropped_rows', 'saturated', 'reason',
+]
+
+
+def scale_machines(machine_configs, machine_names, n_machines):
+    """Machine names and configs for ``n_machines`` machines.
+
+    The configured machines are reused in order; copies beyond the first
+    round get a numeric suffix (``Ragnar_2``) and share the original's
+    settings.
+    """
+    names = []
+    configs = {}
+    for i in range(n_machines):
+        base = machine_names[i % len(machine_names)]
+        name = base if i < len(machine_names) else f"{base}_{i // len(machine_names) + 1}"
+        names.append(name)
+        configs[name] = machine_configs[base]
+    return names, configs
+
+
+def ramp_steps(start_machines, start_rate, machine_factor=2.0, rate_factor=1.0, steps=6):
+    """(machines, ticks per second) for each step, growing geometrically from the start point."""
+    return [
+        (max(1, int(round(start_machines * machine_factor ** i))), start_rate * rate_factor ** i)
+        for i in range(steps)
+    ]
+
+
+def assess_step(result, tolerance=0.1, max_error_rate=0.01, queue_limit=None):
+    """Mark a step saturated when it misses its target rate, errors or lets the queue grow."""
+    reasons = []
+    if result['sustained_rows_per_second'] < (1 - tolerance) * result['target_rows_per_second']:
+        reasons.append('rate below target')
+    if result['error_rate'] > max_error_rate:
+        reasons.append('errors')
+    if result['dropped_rows']:
+        reasons.append('dropped rows')
+    if queue_limit and result['max_queue_depth'] >= queue_limit:
+        reasons.append('queue full')
+    result['saturated'] = bool(reasons)
+    result['reason'] = ', '.join(reasons)
+    return result
+
+
+def run_step(session, config, machine_configs, columns, n_machines, ticks_per_second, seconds, step=0):
+    """Run one load step and return its measurements."""
+    step_config = dict(config)
+    names, configs = scale_machines(machine_configs, config['machine_names'], n_machines)
+    # Every machine ticks at the step's rate; a machine's own cadence would ignore it
+    configs = {name: {key: value for key, value in machine_config.items() if key != 'cadence'}
+               for name, machine_config in configs.items()}
+    step_config.update({
+        'machine_names': names,
+        'rate_mode': RATE_TICKS_PER_SECOND,
+        'target_rate': ticks_per_second,
+        # Late ticks go out as one batch so the generator never becomes the bottleneck being measured
+        'missed_deadline_policy': MISSED_COALESCE,
+        # Failed writes count against the sink instead of being retried away
+        'write_retries': 0,
+    })
+
+    samples = []
+
+    def on_tick(stats):
+        samples.append((time_module.monotonic(), stats['writer']['queue_depth']))
+
+    started = time_module.monotonic()
+    stats = run_simulator(session, step_config, configs, columns, duration=seconds,
+                          on_tick=on_tick, log=lambda message: None, stop_on_error=False)
+    # Elapsed time includes draining the queue, so a backlog lowers the sustained rate
+    elapsed = max(time_module.monotonic() - started, 1e-9)
+
+    writer = stats['writer']
+    attempts = writer['written_batches'] + writer['errors']
+    if len(samples) > 1:
+        times, depths = np.array(samples, dtype=float).T
+        queue_growth = float(np.polyfit(times - times[0], depths, 1)[0]) if times[-1] > times[0] else 0.0
+    else:
+        queue_growth = 0.0
+    return {
+        'step': step,
+        'machines': n_machines,
+        'target_ticks_per_second': 1.0 / tick_interval(step_config, n_machines),
+        'target_rows_per_second': n_machines / tick_interval(step_config, n_machines),
+        'sustained_rows_per_second': writer['written_rows'] / elapsed,
+        'write_latency_p50': writer['write_latency_p50'],
+        'write_latency_p95': writer['write_latency_p95'],
+        'write_latency_p99': writer['write_latency_p99'],
+        'error_rate': writer['errors'] / attempts if attempts else 0.0,
+        'queue_growth_per_second': queue_growth,
+        'max_queue_depth': writer['max_queue_depth'],
+        'dropped_rows': writer['dropped_rows'],
+        'generated_rows': stats['total_rows'],
+        'written_rows': writer['written_rows'],
+        'elapsed_seconds': elapsed,
+    }
+
+
+def run_load_test(session, config, machine_configs, columns, steps, seconds=30.0, tolerance=0.1,
+                  max_error_rate=0.01, stop_after_saturation=1, on_step=None):
+    """Run ``steps`` (from ``ramp_steps``) in order and return the report.
+
+    The ramp stops ``stop_after_saturation`` steps after the first saturated
+    one. The report holds every step plus ``capacity`` (the last step before
+    saturation, or None) and ``saturation`` (the first saturated step).
+    """
+    results = []
+    saturation = None
+    for step, (n_machines, ticks_per_second) in enumerate(steps):
+        result = run_step(session, config, machine_configs, columns, n_machines, ticks_per_second, seconds, step)
+        assess_step(result, tolerance, max_error_rate, config.get('write_queue_size', 10))
+        results.append(result)
+        if on_step:
+            on_step(result)
+        if result['saturated'] and saturation is None:
+            saturation = result
+        if saturation is not None and step - saturation['step'] >= stop_after_saturation:
+            break
+
+    if saturation is None:
+        capacity = results[-1] if results else None
+    else:
+        capacity = results[saturation['step'] - 1] if saturation['step'] > 0 else None
+    return {
+        'sink': config.get('sink') or SINKS[0],
+        'step_seconds': seconds,
+        'steps': results,
+        'capacity': capacity,
+        'saturation': saturation,
+    }
+
+
+def format_report(report):
+    """Plain-text table of a load test report with the capacity summary."""
+    header = (f"{'step':>4} {'machines':>8} {'target r/s':>11} {'sustained r/s':>13} {'p50 s':>7} {'p95 s':>7} "
+              f"{'p99 s':>7} {'errors':>7} {'queue/s':>8}  status")
+    lines = [header]
+    for r in report['steps']:
+        lines.append(
+            f"{r['step']:>4} {r['machines']:>8} {r['target_rows_per_second']:>11.1f} {r['sustained_rows_per_second']:>13.1f} "
+            f"{r['write_latency_p50']:>7.3f} {r['write_latency_p95']:>7.3f} {r['write_latency_p99']:>7.3f} "
+            f"{r['error_rate']:>7.1%} {r['queue_growth_per_second']:>8.2f}  "
+            f"{'SATURATED (' + r['reason'] + ')' if r['saturated'] else 'ok'}"
+        )
+    capacity = report['capacity']
+    if capacity is None:
+        lines.append(f"Sink '{report['sink']}' saturated at the first step; lower the starting load")
+    else:
+        lines.append(f"Capacity on sink '{report['sink']}': {capacity['machines']} machines, "
+                     f"{capacity['sustained_rows_per_second']:.1f} rows/s sustained")
+        if report['saturation'] is None:
+            lines.append("No saturation reached; extend the ramp to find the limit")
+    return "\n".join(lines)
+
+
+def write_report(report, path):
+    """Save the report as CSV (one row per step) or JSON, by file extension."""
+    if path.lower().endswith('.csv'):
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=REPORT_COLUMNS, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(report['steps'])
+    else:
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2, default=str)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ramp simulator load against a sink until it saturates")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--settings-name", help="NAME of a row in SETTINGS_TABLE")
+    source.add_argument("--settings-file", help="JSON file with the same layout as SETTINGS_TABLE.DATA")
+    parser.add_argument("--settings-db", help="Database holding SETTINGS_TABLE (default: current database)")
+    parser.add_argument("--settings-schema", help="Schema holding SETTINGS_TABLE (default: current schema)")
+    parser.add_argument("--connection", help="Connection name from the Snowflake connections.toml")
+    parser.add_argument("--sink", choices=SINKS, help="Sink to load (default: the saved setting); simulated runs offline")
+    parser.add_argument("--local-stage-dir", help="Directory for --sink local_stage")
+    parser.add_argument("--output-dir", help="Directory for --sink parquet or ndjson")
+    parser.add_argument("--simulated-rows-per-second", type=float, help="Capacity of --sink simulated")
+    parser.add_argument("--simulated-latency", type=float, help="Fixed seconds per write for --sink simulated")
+    parser.add_argument("--simulated-error-rate", type=float, help="Fraction of --sink simulated writes that fail")
+    parser.add_argument("--start-machines", type=int, help="Machines in the first step (default: the saved machines)")
+    parser.add_argument("--start-rate", type=float, help="Ticks per second in the first step (default: the saved rate)")
+    parser.add_argument("--machine-factor", type=float, default=2.0, help="Machine count multiplier per step")
+    parser.add_argument("--rate-factor", type=float, default=1.0, help="Tick rate multiplier per step")
+    parser.add_argument("--steps", type=int, default=6, help="Maximum number of steps")
+    parser.add_argument("--step-seconds", type=float, default=30.0, help="How long each step runs")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="A step is saturated when it sustains less than (1 - tolerance) of its target")
+    parser.add_argument("--max-error-rate", type=float, default=0.01, help="Error rate that counts as saturated")
+    parser.add_argument("--report", help="Write the report to this .json or .csv file")
+    args = parser.parse_args(argv)
+
+    offline = args.sink in OFFLINE_SINKS and args.settings_file
+    session = None if offline else create_session(args.connection)
+    if args.settings_name:
+        saved_data = load_settings_from_table(session, args.settings_name, args.settings_db, args.settings_schema)
+    else:
+        saved_data = load_settings_file(args.settings_file)
+    config, machine_configs, columns = prepare_run(saved_data)
+    for option, key in (('sink', 'sink'), ('local_stage_dir', 'local_stage_dir'), ('output_dir', 'output_dir'),
+                        ('simulated_rows_per_second', 'simulated_rows_per_second'),
+                        ('simulated_latency', 'simulated_latency_seconds'),
+                        ('simulated_error_rate', 'simulated_error_rate')):
+        if getattr(args, option) is not None:
+            config[key] = getattr(args, option)
+
+    start_machines = args.start_machines or len(config['machine_names'])
+    start_rate = args.start_rate or 1.0 / tick_interval(config)
+    steps = ramp_steps(start_machines, start_rate, args.machine_factor, args.rate_factor, args.steps)
+
+    def on_step(result):
+        print(f"step {result['step']}: {result['machines']} machines at {result['target_rows_per_second']:.1f} rows/s -> "
+              f"{result['sustained_rows_per_second']:.1f} rows/s sustained"
+              + (f" (saturated: {result['reason']})" if result['saturated'] else ""), flush=True)
+
+    report = run_load_test(session, config, machine_configs, columns, steps, args.step_seconds,
+                           args.tolerance, args.max_error_rate, on_step=on_step)
+    print(format_report(report), flush=True)
+    if args.report:
+        write_report(report, args.report)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
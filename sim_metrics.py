@@ -0,0 +1,125 @@
+"""Per-stage timings for the simulator's tick pipeline.
+
+Every tick passes through the same stages; ``StageTimer`` keeps the last
+``window`` durations of each in a rolling window, so percentiles reflect
+recent behaviour rather than the whole run:
+
+- ``generate``: drawing the values for the due ticks
+- ``assemble``: building the batch frame from them
+- ``coerce``: casting the frame to the table's column types
+- ``write``: the sink write itself (on the writer thread)
+
+``summary`` gives p50/p95/p99 per stage alongside the achieved rates, and
+``write_timings`` exports it as CSV or JSON.
+"""
+import collections
+import contextlib
+import csv
+import json
+import threading
+import time as time_module
+
+import numpy as np
+
+STAGE_GENERATE = 'generate'
+STAGE_ASSEMBLE = 'assemble'
+STAGE_COERCE = 'coerce'
+STAGE_WRITE = 'write'
+STAGES = [STAGE_GENERATE, STAGE_ASSEMBLE, STAGE_COERCE, STAGE_WRITE]
+
+TIMING_COLUMNS = ['stage', 'count', 'p50_ms', 'p95_ms', 'p99_ms', 'mean_ms', 'max_ms', 'total_seconds', 'share']
+
+
+class StageTimer:
+    """Rolling per-stage durations, safe to record from the generator and writer threads."""
+
+    def __init__(self, window=1000, clock=time_module.perf_counter):
+        self.window = window
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._samples = {stage: collections.deque(maxlen=self.window) for stage in STAGES}
+            self._counts = dict.fromkeys(STAGES, 0)
+            self._totals = dict.fromkeys(STAGES, 0.0)
+
+    def record(self, stage, seconds):
+        with self._lock:
+            if stage not in self._samples:
+                self._samples[stage] = collections.deque(maxlen=self.window)
+                self._counts[stage] = 0
+                self._totals[stage] = 0.0
+            self._samples[stage].append(seconds)
+            self._counts[stage] += 1
+            self._totals[stage] += seconds
+
+    @contextlib.contextmanager
+    def time(self, stage):
+        started = self.clock()
+        try:
+            yield
+        finally:
+            self.record(stage, self.clock() - started)
+
+    def histogram(self, stage, bins=20):
+        """(counts, edges in ms) of the stage's recent durations."""
+        with self._lock:
+            samples = np.array(self._samples.get(stage, ()), dtype=float) * 1000.0
+        if not len(samples):
+            return np.zeros(0, dtype=int), np.zeros(0)
+        return np.histogram(samples, bins=bins)
+
+    def stages(self):
+        """Per-stage rows of ``TIMING_COLUMNS`` for every stage recorded so far.
+
+        ``share`` is the stage's part of the time spent in all stages, which
+        points at the stage to look at first when throughput drops.
+        """
+        with self._lock:
+            snapshot = {stage: (np.array(samples, dtype=float), self._counts[stage], self._totals[stage])
+                        for stage, samples in self._samples.items() if self._counts[stage]}
+        total = sum(stage_total for _, _, stage_total in snapshot.values()) or 1.0
+        rows = []
+        for stage, (samples, count, stage_total) in snapshot.items():
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99]) * 1000.0
+            rows.append({
+                'stage': stage,
+                'count': count,
+                'p50_ms': float(p50),
+                'p95_ms': float(p95),
+                'p99_ms': float(p99),
+                'mean_ms': float(samples.mean() * 1000.0),
+                'max_ms': float(samples.max() * 1000.0),
+                'total_seconds': stage_total,
+                'share': stage_total / total,
+            })
+        return rows
+
+    def summary(self, scheduler_stats=None, write_frequency=None):
+        """Stage rows plus achieved vs target throughput from a ``RateScheduler.stats()``."""
+        summary = {'stages': self.stages()}
+        if scheduler_stats:
+            summary['throughput'] = {
+                'write_frequency': write_frequency,
+                'target_ticks_per_second': scheduler_stats['target_ticks_per_second'],
+                'achieved_ticks_per_second': scheduler_stats['achieved_ticks_per_second'],
+                'target_rows_per_second': scheduler_stats['target_rows_per_second'],
+                'achieved_rows_per_second': scheduler_stats['achieved_rows_per_second'],
+                'ticks': scheduler_stats['ticks'],
+                'skipped_ticks': scheduler_stats['skipped_ticks'],
+            }
+        return summary
+
+
+def write_timings(summary, path):
+    """Save a timing summary as CSV (one row per stage, throughput repeated on each) or JSON, by file extension."""
+    with open(path, 'w', newline='') as f:
+        if path.lower().endswith('.csv'):
+            throughput = summary.get('throughput') or {}
+            writer = csv.DictWriter(f, fieldnames=TIMING_COLUMNS + list(throughput))
+            writer.writeheader()
+            writer.writerows(dict(row, **throughput) for row in summary['stages'])
+        else:
+            json.dump(summary, f, indent=2, default=str)
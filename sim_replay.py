@@ -0,0 +1,245 @@
+"""Replay a recorded stream of MACHINE_TBL rows into the target table.
+
+The recording is a Parquet, CSV or NDJSON file (or a directory of them, such
+as the output of the ``parquet`` and ``ndjson`` sinks) read in chunks, so
+traces larger than memory replay fine. Rows are emitted in file order and
+paced by the timestamp column:
+
+- ``speed=1``: real time, rows go out as far apart as they were recorded
+- ``speed=N``: N times faster
+- ``speed=None`` (``max`` on the command line): as fast as the sink accepts
+
+Timestamps are either written as recorded (``preserve``) or ``rebase``-d so
+the first row lands at the moment the replay starts and the rest follow on
+the replay's own clock, which keeps dashboard windows like
+``DATEADD(minute, -N, CURRENT_TIMESTAMP())`` populated.
+
+Usage:
+    python sim_replay.py trace.parquet --settings-name Default --connection demo --speed 10 --timestamps rebase
+    python sim_replay.py ./recorded --settings-file settings.json --sink simulated --speed max
+"""
+import argparse
+import os
+import signal
+import threading
+import time as time_module
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from sim_runner import create_session, load_settings_file, load_settings_from_table, prepare_run
+from sim_sinks import OFFLINE_SINKS, SINKS, build_writer
+
+TIMESTAMPS_PRESERVE = 'preserve'
+TIMESTAMPS_REBASE = 'rebase'
+REPLAY_TIMESTAMPS = [TIMESTAMPS_PRESERVE, TIMESTAMPS_REBASE]
+
+REPLAY_FORMATS = {'.parquet': 'parquet', '.pq': 'parquet', '.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+
+
+def parse_speed(value):
+    """Replay speed from ``1``, ``10``, ``"10x"`` or ``"max"`` (None: as fast as possible)."""
+    if value is None or str(value).strip().lower() in ('max', '0', ''):
+        return None
+    speed = float(str(value).strip().lower().rstrip('x'))
+    if speed <= 0:
+        raise ValueError(f"Replay speed must be positive or 'max', got {value!r}")
+    return speed
+
+
+def recording_files(path):
+    """The recording files under ``path`` in name order (``path`` itself if it's a file)."""
+    if not os.path.isdir(path):
+        return [path]
+    # Unfinished .part files from a running recorder are skipped
+    files = sorted(os.path.join(path, name) for name in os.listdir(path)
+                   if os.path.splitext(name)[1].lower() in REPLAY_FORMATS)
+    if not files:
+        raise ValueError(f"No {', '.join(sorted(REPLAY_FORMATS))} files in {path}")
+    return files
+
+
+def iter_recording(source, chunk_rows=100000, fmt=None):
+    """Yield the recording as DataFrames of at most ``chunk_rows`` rows.
+
+    ``source`` is a path to a file or directory, or a file-like object with
+    ``fmt`` (``parquet``, ``csv`` or ``ndjson``) saying how to read it.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        for path in recording_files(os.fspath(source)):
+            yield from iter_recording_file(path, chunk_rows, fmt or REPLAY_FORMATS.get(os.path.splitext(path)[1].lower()))
+    else:
+        yield from iter_recording_file(source, chunk_rows, fmt)
+
+
+def iter_recording_file(source, chunk_rows, fmt):
+    if fmt == 'parquet':
+        # pyarrow is only needed for Parquet recordings
+        import pyarrow.parquet
+        for batch in pyarrow.parquet.ParquetFile(source).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    elif fmt == 'csv':
+        yield from pd.read_csv(source, chunksize=chunk_rows)
+    elif fmt == 'ndjson':
+        yield from pd.read_json(source, lines=True, chunksize=chunk_rows)
+    else:
+        raise ValueError(f"Unknown recording format {fmt!r}; expected one of {sorted(set(REPLAY_FORMATS.values()))}")
+
+
+def run_replay(session, config, source, columns=None, speed=1.0, timestamps=TIMESTAMPS_PRESERVE, chunk_rows=100000,
+               fmt=None, max_rows=None, duration=None, stop_event=None, on_write=None, log=print,
+               stop_on_error=True, writer=None):
+    """Replay ``source`` through the configured sink, paced by ``config['timestamp_column']``.
+
+    Every row that is due by the time the replay catches up goes out in one
+    write, so rows recorded in the same tick stay together and a fast replay
+    makes fewer, larger writes. Rows are assumed to be in time order; a row
+    older than one before it goes out with it. ``columns`` limits the rows
+    to the target table's columns. Returns a stats dict shaped like
+    ``run_simulator``'s, plus ``lag_seconds`` (how far behind schedule the
+    last write went out).
+    """
+    if timestamps not in REPLAY_TIMESTAMPS:
+        raise ValueError(f"Unknown timestamp handling {timestamps!r}; expected one of {REPLAY_TIMESTAMPS}")
+    timestamp_column = config.get('timestamp_column')
+    stop_event = stop_event or threading.Event()
+    writer = writer or build_writer(session, config, config.get('column_types'))
+    stats = {'state': 'Running', 'ticks': 0, 'total_rows': 0, 'last_timestamp': None, 'recorded_timestamp': None,
+             'lag_seconds': 0.0, 'last_error': None}
+
+    started = time_module.monotonic()
+    started_at = pd.Timestamp(datetime.now())
+    first = None
+    floor = 0.0
+    try:
+        for chunk in iter_recording(source, chunk_rows, fmt):
+            if columns:
+                chunk = chunk[[col for col in columns if col in chunk.columns]]
+            if max_rows is not None:
+                chunk = chunk.iloc[:max_rows - stats['total_rows']]
+            if chunk.empty:
+                break
+
+            if timestamp_column in chunk.columns:
+                recorded = pd.to_datetime(chunk[timestamp_column])
+                if first is None:
+                    first = recorded.iloc[0]
+                # Seconds after the first recorded row, never going backwards, on the replay clock
+                offsets = np.maximum.accumulate(np.maximum((recorded - first).dt.total_seconds().to_numpy() / (speed or 1.0), floor))
+                floor = offsets[-1]
+                if timestamps == TIMESTAMPS_REBASE:
+                    chunk = chunk.assign(**{timestamp_column: started_at + pd.to_timedelta(offsets, unit='s')})
+                else:
+                    chunk = chunk.assign(**{timestamp_column: recorded})
+            elif speed is not None:
+                raise ValueError(f"Recording has no {timestamp_column!r} column to pace by; replay at max speed instead")
+            else:
+                recorded = offsets = None
+
+            position = 0
+            while position < len(chunk):
+                if stop_event.is_set() or (duration is not None and time_module.monotonic() - started >= duration):
+                    break
+                if speed is None:
+                    end = len(chunk)
+                else:
+                    delay = offsets[position] - (time_module.monotonic() - started)
+                    if delay > 0 and stop_event.wait(delay):
+                        break
+                    end = int(np.searchsorted(offsets, time_module.monotonic() - started, side='right'))
+                    end = max(end, position + 1)
+                    stats['lag_seconds'] = max(0.0, time_module.monotonic() - started - offsets[position])
+
+                df = chunk.iloc[position:end].reset_index(drop=True)
+                writer.submit(df)
+                metrics = writer.metrics()
+                if metrics['errors'] and stop_on_error:
+                    raise RuntimeError(metrics['last_error'])
+
+                stats['ticks'] += 1
+                stats['total_rows'] += len(df)
+                if recorded is not None:
+                    stats['last_timestamp'] = df[timestamp_column].iloc[-1]
+                    stats['recorded_timestamp'] = recorded.iloc[end - 1]
+                stats['writer'] = metrics
+                if on_write:
+                    on_write(stats)
+                position = end
+            if position < len(chunk) or (max_rows is not None and stats['total_rows'] >= max_rows):
+                break
+    except Exception as e:
+        stats['state'] = 'Failed'
+        stats['last_error'] = str(e)
+        log(f"Error replaying {source}: {e}")
+
+    writer.stop()
+    stats['writer'] = writer.metrics()
+    stats['elapsed_seconds'] = time_module.monotonic() - started
+    stats['rows_per_second'] = stats['total_rows'] / stats['elapsed_seconds'] if stats['elapsed_seconds'] else 0.0
+    if stats['state'] == 'Running' and stats['writer']['errors'] and stop_on_error:
+        stats['state'] = 'Failed'
+        stats['last_error'] = stats['writer']['last_error']
+    if stats['state'] == 'Running':
+        stats['state'] = 'Stopped'
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recorded MACHINE_TBL stream into the target table")
+    parser.add_argument("recording", help="Parquet, CSV or NDJSON file, or a directory of them")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--settings-name", help="NAME of a row in SETTINGS_TABLE (target table and write path)")
+    source.add_argument("--settings-file", help="JSON file with the same layout as SETTINGS_TABLE.DATA")
+    parser.add_argument("--settings-db", help="Database holding SETTINGS_TABLE (default: current database)")
+    parser.add_argument("--settings-schema", help="Schema holding SETTINGS_TABLE (default: current schema)")
+    parser.add_argument("--connection", help="Connection name from the Snowflake connections.toml")
+    parser.add_argument("--speed", default="1", help="1 for real time, N for N times faster, max for as fast as possible")
+    parser.add_argument("--timestamps", choices=REPLAY_TIMESTAMPS, default=TIMESTAMPS_PRESERVE,
+                        help="preserve: write the recorded timestamps; rebase: start the timestamps at now")
+    parser.add_argument("--timestamp-column", help="Column to pace by (default: the saved timestamp column)")
+    parser.add_argument("--chunk-rows", type=int, default=100000, help="Rows read from the recording at a time")
+    parser.add_argument("--max-rows", type=int, help="Stop after this many rows")
+    parser.add_argument("--duration", type=float, help="Stop after this many seconds")
+    parser.add_argument("--sink", choices=SINKS, help="Write path (default: the saved setting)")
+    parser.add_argument("--local-stage-dir", help="Directory for --sink local_stage")
+    parser.add_argument("--output-dir", help="Directory for --sink parquet or ndjson")
+    parser.add_argument("--status-every", type=float, default=5.0, help="Seconds between progress lines")
+    args = parser.parse_args(argv)
+
+    offline = args.sink in OFFLINE_SINKS and args.settings_file
+    session = None if offline else create_session(args.connection)
+    if args.settings_name:
+        saved_data = load_settings_from_table(session, args.settings_name, args.settings_db, args.settings_schema)
+    else:
+        saved_data = load_settings_file(args.settings_file)
+    config, _, columns = prepare_run(saved_data)
+    for option in ('timestamp_column', 'sink', 'local_stage_dir', 'output_dir'):
+        if getattr(args, option) is not None:
+            config[option] = getattr(args, option)
+    speed = parse_speed(args.speed)
+
+    stop_event = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda signum, frame: stop_event.set())
+
+    last_status = [0.0]
+
+    def on_write(stats):
+        if time_module.monotonic() - last_status[0] >= args.status_every:
+            print(f"{datetime.now().isoformat(timespec='seconds')} rows={stats['total_rows']} writes={stats['ticks']} "
+                  f"recorded={stats['recorded_timestamp']} lag={stats['lag_seconds']:.2f}s "
+                  f"queue={stats['writer']['queue_depth']}", flush=True)
+            last_status[0] = time_module.monotonic()
+
+    print(f"Replaying {args.recording} into {config['selected_db']}.{config['selected_schema']}.{config['selected_table']} "
+          f"at {'max speed' if speed is None else f'{speed:g}x'}", flush=True)
+    stats = run_replay(session, config, args.recording, columns, speed, args.timestamps, args.chunk_rows,
+                       max_rows=args.max_rows, duration=args.duration, stop_event=stop_event, on_write=on_write)
+    print(f"{stats['state']}: {stats['total_rows']} rows in {stats['ticks']} writes "
+          f"({stats['rows_per_second']:.1f} rows/s)", flush=True)
+    return 0 if stats['state'] != 'Failed' else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,487 @@
+"""Headless runner for the streaming simulator.
+
+Runs a configuration saved from streaming_sim.py (a SETTINGS_TABLE entry or
+a JSON export of one) with the same generation and write path, without
+Streamlit:
+
+    python sim_runner.py --settings-name Default --connection demo
+    python sim_runner.py --settings-file mill_settings.json --ticks 100
+    python sim_runner.py --settings-name Default --backfill-end 2026-02-01T00:00:00
+    python sim_runner.py --settings-file mill_settings.json --sink local_stage --local-stage-dir ./out
+    python sim_runner.py --settings-file mill_settings.json --sink parquet --output-dir ./recorded --rotate-mb 256
+"""
+import argparse
+import json
+import os
+import signal
+import threading
+import time as time_module
+from datetime import datetime
+
+from sim_engine import advance_timestamps, build_event_frame, build_tick_frame, compile_fleet, event_timestamps, run_backfill
+from sim_fleet_table import FLEET_FORMATS, fleet_measures, read_fleet_file
+from sim_metrics import StageTimer, write_timings
+from sim_scenarios import attach_scenario, load_scenario
+from sim_scheduler import (
+    MISSED_POLICIES,
+    RATE_MODES,
+    CadenceScheduler,
+    RateScheduler,
+    clock_scale,
+    machine_cadences,
+    tick_interval,
+)
+from sim_sinks import OFFLINE_SINKS, SINKS, WRITE_POLICIES, build_sink, build_writer, run_sql
+
+STATUS_TABLE = "SIMULATOR_STATUS"
+
+
+def create_session(connection_name=None):
+    from snowflake.snowpark import Session
+
+    builder = Session.builder
+    if connection_name:
+        builder = builder.config("connection_name", connection_name)
+    return builder.getOrCreate()
+
+
+def current_db_schema(session):
+    row = run_sql(session, "SELECT CURRENT_DATABASE(), CURRENT_SCHEMA()")[0]
+    return row[0], row[1]
+
+
+def load_settings_from_table(session, settings_name, settings_db=None, settings_schema=None):
+    if not settings_db or not settings_schema:
+        settings_db, settings_schema = current_db_schema(session)
+
+    query_sql = f"""
+    SELECT TO_JSON(DATA) as DATA_JSON
+    FROM {settings_db}.{settings_schema}.SETTINGS_TABLE
+    WHERE NAME = '{settings_name.replace("'", "''")}'
+    ORDER BY CREATED_AT DESC
+    LIMIT 1
+    """
+    rows = run_sql(session, query_sql)
+    if not rows:
+        raise ValueError(f"No settings named {settings_name!r} in {settings_db}.{settings_schema}.SETTINGS_TABLE")
+    return json.loads(rows[0]['DATA_JSON'])
+
+
+def load_settings_file(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def prepare_run(saved_data):
+    """Turn saved settings into the config, machine configs and column list the engine needs."""
+    config = dict(saved_data.get('config', {}))
+    config.update({k: v for k, v in saved_data.get('special_columns', {}).items() if v is not None})
+
+    table_info = saved_data.get('table_info', {})
+    columns = [col[0] for col in table_info.get('columns') or []]
+    column_types = table_info.get('column_types', {})
+
+    config['column_types'] = column_types
+    config.setdefault('selected_db', table_info.get('db'))
+    config.setdefault('selected_schema', table_info.get('schema'))
+    config.setdefault('selected_table', table_info.get('table'))
+    if config.get('timestamp_column') and not config.get('timestamp_data_type'):
+        config['timestamp_data_type'] = column_types.get(config['timestamp_column'], 'TIMESTAMP_NTZ')
+
+    current_timestamp = config.get('current_timestamp')
+    if isinstance(current_timestamp, str):
+        current_timestamp = datetime.fromisoformat(current_timestamp)
+    if current_timestamp is None and config.get('timestamp_mode') == 'Custom':
+        current_timestamp = datetime.now()
+    config['current_timestamp'] = current_timestamp
+
+    machine_configs = saved_data.get('machine_configs', {})
+    config.setdefault('machine_names', list(machine_configs))
+    return config, machine_configs, columns
+
+
+def record_status(session, status_location, run_name, stats):
+    status_db, status_schema = status_location
+    table_name = f"{status_db}.{status_schema}.{STATUS_TABLE}"
+    # Status runs on this thread while the writer thread may be in the middle of a ledger commit
+    run_sql(session, f"""
+    CREATE TABLE IF NOT EXISTS {table_name} (
+        RUN_NAME VARCHAR(16777216),
+        STATE VARCHAR(16777216),
+        TOTAL_ROWS NUMBER,
+        TICKS NUMBER,
+        LAST_TIMESTAMP TIMESTAMP_NTZ(9),
+        LAST_ERROR VARCHAR(16777216),
+        UPDATED_AT TIMESTAMP_NTZ(9) DEFAULT CURRENT_TIMESTAMP()
+    )
+    """)
+    last_timestamp = f"'{stats['last_timestamp'].isoformat()}'" if stats.get('last_timestamp') else "NULL"
+    last_error = f"'{str(stats['last_error']).replace(chr(39), chr(39) * 2)}'" if stats.get('last_error') else "NULL"
+    run_sql(session, f"""
+    MERGE INTO {table_name} t
+    USING (SELECT '{run_name.replace("'", "''")}' AS RUN_NAME) s
+    ON t.RUN_NAME = s.RUN_NAME
+    WHEN MATCHED THEN UPDATE SET
+        STATE = '{stats['state']}', TOTAL_ROWS = {stats['total_rows']}, TICKS = {stats['ticks']},
+        LAST_TIMESTAMP = {last_timestamp}, LAST_ERROR = {last_error}, UPDATED_AT = CURRENT_TIMESTAMP()
+    WHEN NOT MATCHED THEN INSERT (RUN_NAME, STATE, TOTAL_ROWS, TICKS, LAST_TIMESTAMP, LAST_ERROR)
+        VALUES (s.RUN_NAME, '{stats['state']}', {stats['total_rows']}, {stats['ticks']}, {last_timestamp}, {last_error})
+    """)
+
+
+def run_simulator(session, config, machine_configs, columns, max_ticks=None, duration=None,
+                  stop_event=None, on_tick=None, log=print, stop_on_error=True, writer=None, timer=None,
+                  fleet=None, scheduler=None, start_timestamp=None, on_batch=None):
+    """Generate and write batches at the configured rate until stopped.
+
+    Mirrors the Streamlit generation loop: the timestamp is advanced, one row
+    per machine is generated and the frame is queued for a background writer
+    that appends it to the target table. Ticks are paced by a
+    ``RateScheduler`` so write time doesn't drift the rate, or by a
+    ``CadenceScheduler`` when machines have their own cadence, in which case
+    each batch holds the rows that came due together. With a ``time_scale``
+    (see ``clock_scale``) Custom timestamps advance N times faster than the
+    wall clock, still one interval apart. A failed write
+    stops the run unless ``stop_on_error`` is False. ``writer`` replaces the
+    configured sink (it is stopped when the run ends). A caller that
+    changes settings mid-run passes its own ``fleet`` (scenario already
+    attached), ``scheduler`` and ``start_timestamp``; ``on_batch`` sees every
+    frame before it is queued. Returns a stats dict including the writer and
+    scheduler metrics and per-stage timings (``stages``, from ``timer`` or a
+    new ``StageTimer``).
+    """
+    stop_event = stop_event or threading.Event()
+    timer = timer or StageTimer()
+    writer = writer or build_writer(session, config, config.get('column_types'), timer)
+    compiled = fleet is None
+    if compiled:
+        fleet = compile_fleet(machine_configs, config['machine_names'], seed=config.get('seed'))
+    current_timestamp = config.get('current_timestamp')
+    n_machines = len(fleet['machine_names'])
+    cadences = machine_cadences(config, machine_configs, fleet['machine_names'])
+    # Cadence rows are timestamped from the start of the run, and the scenario timeline starts there too
+    if start_timestamp is None:
+        start_timestamp = datetime.now() if config.get('timestamp_mode') == 'Current' else current_timestamp
+    if scheduler is None:
+        missed = config.get('missed_deadline_policy') or MISSED_POLICIES[0]
+        time_scale = clock_scale(config)
+        if cadences:
+            scheduler = CadenceScheduler(cadences, missed, seed=config.get('seed'), time_scale=time_scale)
+        else:
+            scheduler = RateScheduler(tick_interval(config, n_machines), missed, rows_per_tick=n_machines,
+                                      time_scale=time_scale)
+    interval = scheduler.interval
+    if compiled and config.get('scenario'):
+        # A shard only plays the events for its own machines
+        attach_scenario(fleet, config['scenario'], interval, strict=config.get('shard') is None,
+                        start=start_timestamp, first_tick=1)
+    stats = {'state': 'Running', 'ticks': 0, 'total_rows': 0, 'last_timestamp': None, 'last_error': None}
+
+    started = time_module.time()
+    while not stop_event.is_set():
+        if max_ticks is not None and stats['ticks'] >= max_ticks:
+            break
+        if duration is not None and time_module.time() - started >= duration:
+            break
+
+        # Wait for the next deadline, waking early if asked to stop
+        if cadences:
+            events = scheduler.wait(stop_event)
+            if events is None:
+                break
+            offsets, machine_index = events
+            n_ticks = 1
+            timestamps = event_timestamps(config, start_timestamp, offsets)
+            df = build_event_frame(config, fleet, columns, machine_index, timestamps, offsets, timer=timer)
+        else:
+            skipped = scheduler.skipped_ticks
+            n_ticks = scheduler.wait(stop_event)
+            if not n_ticks:
+                break
+            if fleet.get('scenario'):
+                # Skipped ticks still pass on the scenario timeline (used when rows have no timestamps)
+                fleet['scenario_tick'] += scheduler.skipped_ticks - skipped
+            if max_ticks is not None:
+                n_ticks = min(n_ticks, max_ticks - stats['ticks'])
+            timestamps = advance_timestamps(config, current_timestamp, n_ticks, interval)
+            df = build_tick_frame(config, fleet, columns, timestamps, timer=timer)
+        current_timestamp = timestamps[-1]
+        if on_batch:
+            on_batch(df)
+        writer.submit(df)
+
+        metrics = writer.metrics()
+        if metrics['errors'] and stop_on_error:
+            stats['state'] = 'Failed'
+            stats['last_error'] = metrics['last_error']
+            log(f"Error writing to Snowflake: {metrics['last_error']}")
+            break
+
+        stats['ticks'] += n_ticks
+        stats['total_rows'] += len(df)
+        stats['last_timestamp'] = current_timestamp
+        stats['writer'] = metrics
+        stats['scheduler'] = scheduler.stats()
+        stats['stages'] = timer.summary(stats['scheduler'], config.get('write_frequency'))
+        if on_tick:
+            on_tick(stats)
+
+    writer.stop()
+    stats['writer'] = writer.metrics()
+    stats['scheduler'] = scheduler.stats()
+    stats['stages'] = timer.summary(stats['scheduler'], config.get('write_frequency'))
+    if stats['state'] == 'Running' and stats['writer']['errors'] and stop_on_error:
+        stats['state'] = 'Failed'
+        stats['last_error'] = stats['writer']['last_error']
+    if stats['state'] == 'Running':
+        stats['state'] = 'Stopped'
+    config['current_timestamp'] = current_timestamp
+    return stats
+
+
+class BackgroundSimulator:
+    """``run_simulator`` on a background thread, for a front end that only starts, stops and polls it.
+
+    ``start`` launches the run, ``metrics`` returns the stats of its latest
+    tick (the final stats once it has ended) and ``stop`` signals it and
+    waits for the writer to drain. ``last_batch`` is the most recent frame,
+    for previews. Keyword arguments go to ``run_simulator``.
+    """
+
+    def __init__(self, session, config, machine_configs, columns, **kwargs):
+        self.session = session
+        self.config = config
+        self.machine_configs = machine_configs
+        self.columns = columns
+        self.kwargs = kwargs
+        self.last_batch = None
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {'state': 'Starting', 'ticks': 0, 'total_rows': 0, 'last_timestamp': None, 'last_error': None}
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='simulator-run', daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            stats = run_simulator(self.session, self.config, self.machine_configs, self.columns,
+                                  stop_event=self._stop_event, on_tick=self._on_tick, log=lambda message: None,
+                                  on_batch=self._on_batch, **self.kwargs)
+        except Exception as e:
+            stats = dict(self.metrics(), state='Failed', last_error=str(e))
+        with self._lock:
+            self._stats = stats
+
+    def _on_tick(self, stats):
+        with self._lock:
+            self._stats = dict(stats)
+
+    def _on_batch(self, df):
+        self.last_batch = df
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def metrics(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def stop(self, timeout=60):
+        """Stop generating, then wait up to ``timeout`` seconds for queued batches to be written."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.metrics()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a saved streaming simulator configuration without Streamlit")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--settings-name", help="NAME of a row in SETTINGS_TABLE")
+    source.add_argument("--settings-file", help="JSON file with the same layout as SETTINGS_TABLE.DATA")
+    parser.add_argument("--settings-db", help="Database holding SETTINGS_TABLE (default: current database)")
+    parser.add_argument("--settings-schema", help="Schema holding SETTINGS_TABLE (default: current schema)")
+    parser.add_argument("--connection", help="Connection name from the Snowflake connections.toml")
+    parser.add_argument("--fleet-file",
+                        help="CSV or YAML fleet file (see sim_fleet_table.py) replacing the saved machines and their settings")
+    parser.add_argument("--ticks", type=int, help="Stop after this many batches")
+    parser.add_argument("--duration", type=float, help="Stop after this many seconds")
+    parser.add_argument("--rate-mode", choices=RATE_MODES,
+                        help="write_frequency: the saved interval; ticks_per_second/rows_per_second: --target-rate")
+    parser.add_argument("--target-rate", type=float, help="Target ticks or rows per second for --rate-mode")
+    parser.add_argument("--time-scale", type=float,
+                        help="Run Custom timestamps this many times faster than real time, e.g. 60 for an hour a minute")
+    parser.add_argument("--missed-policy", choices=MISSED_POLICIES,
+                        help="What to do with ticks whose deadline passed (default: the saved setting, or catch_up)")
+    parser.add_argument("--write-policy", choices=WRITE_POLICIES,
+                        help="What to do when writes fall behind (default: the saved setting, or block)")
+    parser.add_argument("--queue-size", type=int, help="Batches the write queue holds before the policy applies")
+    parser.add_argument("--write-retries", type=int, help="Retries per failed batch (default 5; 0 stops on the first failure)")
+    parser.add_argument("--retry-backoff", type=float, help="Seconds before the first retry, doubled for each retry after")
+    parser.add_argument("--exactly-once", action="store_true",
+                        help="Commit table and stage writes through a staging table and the SIMULATOR_BATCHES ledger "
+                             "so retries never duplicate a batch (slower per batch)")
+    parser.add_argument("--dead-letter-dir", help="Where batches that fail every retry are saved (default: a temp directory)")
+    parser.add_argument("--sink", choices=SINKS,
+                        help="table: Snowpark append; stage: Parquet files + COPY INTO; local_stage, simulated: offline stand-ins; "
+                             "parquet, ndjson: rotating local files")
+    parser.add_argument("--stage-name", help="Stage for --sink stage (default: the target table's stage)")
+    parser.add_argument("--local-stage-dir", help="Directory for --sink local_stage")
+    parser.add_argument("--output-dir", help="Directory for --sink parquet or ndjson (default: simulator_output)")
+    parser.add_argument("--rotate-mb", type=float, help="Start a new file once the current one reaches this many MB")
+    parser.add_argument("--rotate-seconds", type=float, help="Start a new file once the current one is this many seconds old")
+    parser.add_argument("--flush-rows", type=int, help="Coalesce batches and write once this many rows are buffered")
+    parser.add_argument("--flush-mb", type=float, help="Coalesce batches and write once this many MB are buffered")
+    parser.add_argument("--flush-seconds", type=float, help="Coalesce batches and write at least this often")
+    parser.add_argument("--backfill-start",
+                        help="ISO timestamp to backfill from (default: the saved Custom start timestamp)")
+    parser.add_argument("--backfill-end", help="ISO timestamp to backfill up to (exclusive); enables backfill mode")
+    parser.add_argument("--chunk-rows", type=int, default=100000, help="Rows per bulk write in backfill mode")
+    parser.add_argument("--shards", type=int, default=1, help="Split the machines across this many worker processes")
+    parser.add_argument("--shard-write", choices=['worker', 'aggregate'], default='worker',
+                        help="worker: each process writes its own rows; aggregate: one writer in this process")
+    parser.add_argument("--full-dtypes", action="store_true",
+                        help="Write float64/int64/object columns instead of compact categorical, narrow-int and float32 ones")
+    parser.add_argument("--seed", type=int, help="Run seed; the same seed reproduces the same values")
+    parser.add_argument("--scenario", help="Scenario JSON file to play from the start of the run or backfill")
+    parser.add_argument("--timings-file",
+                        help="Write per-stage timings (p50/p95/p99) to this .csv or .json file at the end (unsharded runs)")
+    parser.add_argument("--run-name", help=f"Name reported in {STATUS_TABLE} (default: the settings name)")
+    parser.add_argument("--status-every", type=float, default=30.0,
+                        help=f"Seconds between {STATUS_TABLE} updates; 0 disables status reporting")
+    args = parser.parse_args(argv)
+    if args.timings_file and args.shards > 1:
+        # Each shard times its own stages in its own process; there is no single timer to save
+        parser.error("--timings-file isn't supported with --shards; run unsharded to record stage timings")
+
+    # The local sinks with a settings file run without any warehouse connection
+    offline = args.sink in OFFLINE_SINKS and args.settings_file
+    session = None if offline else create_session(args.connection)
+    if args.settings_name:
+        saved_data = load_settings_from_table(session, args.settings_name, args.settings_db, args.settings_schema)
+    else:
+        saved_data = load_settings_file(args.settings_file)
+    config, machine_configs, columns = prepare_run(saved_data)
+    if args.fleet_file:
+        fmt = FLEET_FORMATS.get(os.path.splitext(args.fleet_file)[1].lower())
+        config['machine_names'], machine_configs, _ = read_fleet_file(
+            args.fleet_file, fmt, fleet_measures(config, columns), config['column_types'])
+    if args.write_policy:
+        config['write_policy'] = args.write_policy
+    if args.queue_size:
+        config['write_queue_size'] = args.queue_size
+    if args.write_retries is not None:
+        config['write_retries'] = args.write_retries
+    if args.retry_backoff is not None:
+        config['retry_backoff_seconds'] = args.retry_backoff
+    if args.dead_letter_dir:
+        config['dead_letter_dir'] = args.dead_letter_dir
+    if args.exactly_once:
+        config['exactly_once'] = True
+    if args.seed is not None:
+        config['seed'] = args.seed
+    if args.full_dtypes:
+        config['compact_dtypes'] = False
+    if args.scenario:
+        config['scenario'] = load_scenario(args.scenario)
+    if args.missed_policy:
+        config['missed_deadline_policy'] = args.missed_policy
+    for option in ('rate_mode', 'target_rate', 'time_scale', 'sink', 'stage_name', 'local_stage_dir', 'output_dir', 'rotate_mb',
+                   'rotate_seconds', 'flush_rows', 'flush_mb', 'flush_seconds'):
+        if getattr(args, option) is not None:
+            config[option] = getattr(args, option)
+
+    run_name = args.run_name or args.settings_name or args.settings_file
+    status_location = (args.settings_db, args.settings_schema)
+    if offline:
+        args.status_every = 0
+    elif not all(status_location):
+        status_location = current_db_schema(session)
+
+    if args.backfill_end:
+        start = args.backfill_start or config.get('current_timestamp')
+        if not start:
+            parser.error("--backfill-start is required when the settings have no Custom start timestamp")
+
+        def on_chunk(stats):
+            print(f"{stats['last_timestamp'].isoformat()} {stats['ticks']}/{stats['total_ticks']} ticks "
+                  f"rows={stats['total_rows']}", flush=True)
+
+        write_fn, close_fn, _ = build_sink(session, config, config.get('column_types'))
+        try:
+            fleet = compile_fleet(machine_configs, config['machine_names'], seed=config.get('seed'))
+            if config.get('scenario'):
+                attach_scenario(fleet, config['scenario'], config['write_frequency'], start=start)
+            stats = run_backfill(session, config, fleet, columns, start, args.backfill_end, args.chunk_rows,
+                                 write=lambda session, df, database, schema, table: write_fn(df), on_chunk=on_chunk)
+        finally:
+            if close_fn:
+                close_fn()
+        print(f"Backfilled {stats['total_rows']} rows in {stats['chunks']} writes", flush=True)
+        return 0
+
+    stop_event = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda signum, frame: stop_event.set())
+
+    last_status = [0.0]
+
+    def on_tick(stats):
+        writer = stats['writer']
+        scheduler = stats['scheduler']
+        print(f"{datetime.now().isoformat(timespec='seconds')} tick={stats['ticks']} rows={stats['total_rows']} "
+              f"rows/s={scheduler['achieved_rows_per_second']:.1f}/{scheduler['target_rows_per_second']:.1f} "
+              f"jitter_p95={scheduler['jitter_p95_ms']:.1f}ms queue={writer['queue_depth']} write_latency={writer['write_latency_last']:.3f}s "
+              f"dropped={writer['dropped_rows']}"
+              + (f" retries={writer['retries']} dead_letter_rows={writer['dead_letter_rows']}" if writer.get('retries') else "")
+              + (f" rows_per_write={writer['rows_per_write']:.0f}" if 'rows_per_write' in writer else "")
+              + (f" time_scale={scheduler['achieved_time_scale']:.0f}x" if scheduler['time_scale'] != 1 else ""), flush=True)
+        if args.status_every and time_module.time() - last_status[0] >= args.status_every:
+            record_status(session, status_location, run_name, stats)
+            last_status[0] = time_module.time()
+
+    print(f"Writing to {config['selected_db']}.{config['selected_schema']}.{config['selected_table']} "
+          f"every {tick_interval(config):g}s for {len(config['machine_names'])} machines"
+          + (f" at {clock_scale(config):g}x real time" if clock_scale(config) != 1 else ""), flush=True)
+
+    if args.shards > 1:
+        from sim_shards import ShardedSimulator
+
+        def on_status(stats):
+            print(f"{datetime.now().isoformat(timespec='seconds')} shards={stats['alive']}/{stats['shards']} "
+                  f"rows={stats['total_rows']} written={stats['written_rows']} "
+                  f"rows/s={stats['achieved_rows_per_second']:.1f}/{stats['target_rows_per_second']:.1f} "
+                  f"errors={stats['errors']}", flush=True)
+            if args.status_every and time_module.time() - last_status[0] >= args.status_every:
+                record_status(session, status_location, run_name, stats)
+                last_status[0] = time_module.time()
+
+        sharded = ShardedSimulator(config, machine_configs, columns, args.shards, args.shard_write, session=session,
+                                   connection_name=args.connection, max_ticks=args.ticks, duration=args.duration)
+        stats = sharded.start().wait(stop_event, on_status)
+        if args.status_every:
+            record_status(session, status_location, run_name, stats)
+        print(f"{stats['state']}: {stats['total_rows']} rows from {stats['shards']} shards", flush=True)
+        return 0 if stats['state'] != 'Failed' else 1
+
+    stats = run_simulator(session, config, machine_configs, columns, args.ticks, args.duration, stop_event, on_tick)
+    if args.status_every:
+        record_status(session, status_location, run_name, stats)
+    print(f"{stats['state']}: {stats['total_rows']} rows in {stats['ticks']} batches", flush=True)
+    if stats['scheduler']['time_scale'] != 1:
+        print(f"  simulated up to {stats['last_timestamp']} at {stats['scheduler']['achieved_time_scale']:.0f}x "
+              f"real time (target {stats['scheduler']['time_scale']:g}x)", flush=True)
+    for row in stats['stages']['stages']:
+        print(f"  {row['stage']:<9} p50={row['p50_ms']:.2f}ms p95={row['p95_ms']:.2f}ms p99={row['p99_ms']:.2f}ms "
+              f"share={row['share']:.0%}", flush=True)
+    if args.timings_file:
+        write_timings(stats['stages'], args.timings_file)
+    return 0 if stats['state'] != 'Failed' else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,190 @@
+"""Declarative scenarios: scripted incidents compiled into per-tick parameter arrays.
+
+A scenario is a JSON document listing events against machine settings::
+
+    {
+        "name": "vibration spike",
+        "seed": 42,
+        "events": [
+            {"at": "10m", "duration": "5m", "machine": "Ragnar", "measure": "VIBRATION",
+             "param": "percent_outside", "op": "set", "value": 60},
+            {"at": "0s", "duration": "30m", "machine": "Harald", "measure": "TOOL_WEAR",
+             "param": "increment", "op": "ramp", "value": 3, "hold": true}
+        ]
+    }
+
+``at`` and ``duration`` are seconds after the scenario starts (numbers or
+strings like ``"90s"``, ``"10m"``, ``"1h30m"``); an event without a
+duration lasts until the run ends. ``machine`` and ``measure`` take a name,
+a list of names or ``"*"``. Operations:
+
+- ``set``: replace the setting with ``value``
+- ``scale``: multiply the setting by ``value``
+- ``add``: add ``value`` to the setting
+- ``ramp``: multiply by a factor moving linearly from 1 to ``value`` over the duration
+
+``hold`` keeps an event's final effect after its duration instead of
+reverting. Events apply in order, so later events build on earlier ones.
+
+``compile_scenario`` resolves the events to tick boundaries and slots once,
+and the generator evaluates them at the tick numbers of its rows
+(``sim_engine.scenario_values``), so the same scenario produces the same
+parameter timeline in a live run and a backfill, and a months-long timeline
+costs no more memory than a short one.
+"""
+import json
+import math
+import re
+
+import numpy as np
+
+from sim_engine import scenario_values, seed_fleet
+
+# Settings a scenario can change, as named in the machine settings
+SCENARIO_PARAMS = ['percent_outside', 'nominal_min', 'nominal_max', 'total_min', 'total_max', 'increment', 'max_value']
+SCENARIO_OPS = ['set', 'scale', 'add', 'ramp']
+
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)\s*(ms|s|m|h|d)', re.IGNORECASE)
+_DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_duration(value):
+    """Seconds for a number or a duration string such as ``"90s"``, ``"10m"`` or ``"1h30m"``."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip().lower().lstrip('t+').strip()
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(text)
+    if not parts or _DURATION_PART.sub('', text).strip():
+        raise ValueError(f"Can't parse duration {value!r}; use seconds or e.g. '90s', '10m', '1h30m'")
+    return sum(float(amount) * _DURATION_UNITS[unit.lower()] for amount, unit in parts)
+
+
+def load_scenario(source):
+    """Scenario dict from a dict, a JSON string or a path to a JSON file."""
+    if isinstance(source, dict):
+        return source
+    text = str(source)
+    if not text.lstrip().startswith('{'):
+        with open(text) as f:
+            text = f.read()
+    return json.loads(text)
+
+
+def _select(names, selector, kind, strict=True):
+    if selector in (None, '*'):
+        return list(range(len(names)))
+    selected = [selector] if isinstance(selector, str) else list(selector)
+    unknown = [name for name in selected if name not in names]
+    if unknown and strict:
+        raise ValueError(f"Scenario refers to unknown {kind} {unknown}; expected one of {names}")
+    return [names.index(name) for name in selected if name in names]
+
+
+def _event_slots(fleet, event, strict=True):
+    machines = set(_select(fleet['machine_names'], event.get('machine'), 'machine', strict))
+    measures = set(_select(fleet['measures'], event.get('measure'), 'measure', strict))
+    slots = [
+        slot for slot, (m, j) in enumerate(zip(fleet['machine_index'], fleet['measure_index']))
+        if m in machines and j in measures
+    ]
+    if not slots and strict:
+        raise ValueError(f"Scenario event {event} matches no included machine measure")
+    return np.array(slots, dtype=np.intp)
+
+
+def compile_scenario(scenario, fleet, interval, strict=True):
+    """Compile ``scenario`` against a compiled fleet for ticks ``interval`` seconds apart.
+
+    Returns ``{'horizon': H, 'params': {param: entry}, ...}``. Tick k is k
+    intervals after the scenario starts (an event ``at`` 10m begins at tick
+    600 / interval), and tick H, the last event boundary, holds the state
+    after every event has ended. Each entry has the ``slots`` the scenario
+    touches (``mask`` marks them; other slots keep following the fleet's
+    live settings), their ``base`` settings and the ``events`` as
+    ``(columns, op, value, start, end, hold)`` over those slots. With
+    ``strict`` False, events for machines or measures the fleet doesn't
+    have are skipped instead of rejected (used by shards, which each hold
+    part of the fleet).
+    """
+    scenario = load_scenario(scenario)
+    interval = float(interval)
+    events = []
+    for event in scenario.get('events', []):
+        param = event.get('param')
+        op = event.get('op', 'set')
+        if param not in SCENARIO_PARAMS:
+            raise ValueError(f"Unknown scenario param {param!r}; expected one of {SCENARIO_PARAMS}")
+        if op not in SCENARIO_OPS:
+            raise ValueError(f"Unknown scenario op {op!r}; expected one of {SCENARIO_OPS}")
+        start = int(math.ceil(parse_duration(event.get('at', 0)) / interval - 1e-9))
+        duration = parse_duration(event.get('duration'))
+        if duration is None and op == 'ramp':
+            raise ValueError(f"Scenario ramp on {param!r} needs a duration")
+        end = None if duration is None else start + max(1, int(math.ceil(duration / interval - 1e-9)))
+        events.append((_event_slots(fleet, event, strict), param, op, float(event['value']), start, end, bool(event.get('hold'))))
+
+    horizon = max([end if end is not None else start for _, _, _, _, start, end, _ in events], default=0)
+    by_param = {}
+    for slots, param, op, value, start, end, hold in events:
+        by_param.setdefault(param, []).append((slots, op, value, start, end, hold))
+    params = {}
+    for param, param_events in by_param.items():
+        slots = np.unique(np.concatenate([event[0] for event in param_events])).astype(np.intp)
+        mask = np.zeros(len(fleet[param]), dtype=bool)
+        mask[slots] = True
+        params[param] = {
+            'mask': mask,
+            'slots': slots,
+            'base': np.asarray(fleet[param], dtype=np.float64)[slots],
+            'events': [(np.searchsorted(slots, event_slots), op, value, start, end, hold)
+                       for event_slots, op, value, start, end, hold in param_events],
+        }
+
+    return {
+        'name': scenario.get('name'),
+        'seed': scenario.get('seed'),
+        'interval': interval,
+        'horizon': horizon,
+        'params': params,
+    }
+
+
+def attach_scenario(fleet, scenario, interval, strict=True, start=None, first_tick=0):
+    """Compile ``scenario`` onto ``fleet`` so generation follows it from the next tick.
+
+    ``start`` is when the scenario's tick 0 falls (the run or backfill
+    start); rows are placed on the timeline by their timestamps relative to
+    it. Without a start or a timestamp column, rows count on from
+    ``first_tick`` (1 for live runs, whose first tick is one interval in).
+
+    A scenario ``seed`` seeds the fleet's per-slot streams (unless the run
+    already has a seed), so a rerun of the same scenario produces the same
+    values.
+    """
+    fleet['scenario'] = compile_scenario(scenario, fleet, interval, strict)
+    fleet['scenario_start'] = start
+    fleet['scenario_tick'] = first_tick
+    if fleet['scenario']['seed'] is not None and fleet.get('slot_seeds') is None:
+        seed_fleet(fleet, fleet['scenario']['seed'])
+    return fleet
+
+
+def scenario_timeline(fleet, n_ticks=None):
+    """Per-tick values of every scenario-controlled setting, keyed ``machine_measure.param``, for previews."""
+    scenario = fleet.get('scenario')
+    if not scenario:
+        return {}
+    n_ticks = n_ticks or scenario['horizon'] + 1
+    ticks = np.minimum(np.arange(n_ticks), scenario['horizon'])
+    timeline = {}
+    for param, entry in scenario['params'].items():
+        values = scenario_values(entry, ticks[:, None])
+        for column, slot in enumerate(entry['slots']):
+            timeline[f"{fleet['keys'][slot]}.{param}"] = values[:, column]
+    return timeline
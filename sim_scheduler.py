@@ -0,0 +1,336 @@
+import collections
+import heapq
+import math
+import time as time_module
+import zlib
+
+import numpy as np
+
+# What the scheduler does with deadlines that passed while a tick was being produced
+MISSED_CATCH_UP = 'catch_up'
+MISSED_SKIP = 'skip'
+MISSED_COALESCE = 'coalesce'
+MISSED_POLICIES = [MISSED_CATCH_UP, MISSED_SKIP, MISSED_COALESCE]
+
+# How the target rate is expressed in the simulator config
+RATE_WRITE_FREQUENCY = 'write_frequency'
+RATE_TICKS_PER_SECOND = 'ticks_per_second'
+RATE_ROWS_PER_SECOND = 'rows_per_second'
+RATE_MODES = [RATE_WRITE_FREQUENCY, RATE_TICKS_PER_SECOND, RATE_ROWS_PER_SECOND]
+
+
+def tick_interval(config, n_machines=None):
+    """Seconds between ticks for the configured rate.
+
+    By default this is ``write_frequency``; ``rate_mode`` can instead set a
+    target in ticks per second or rows per second (one row per machine per
+    tick).
+    """
+    rate_mode = config.get('rate_mode') or RATE_WRITE_FREQUENCY
+    target_rate = config.get('target_rate') or 0
+    if rate_mode == RATE_TICKS_PER_SECOND and target_rate > 0:
+        return 1.0 / target_rate
+    if rate_mode == RATE_ROWS_PER_SECOND and target_rate > 0:
+        if n_machines is None:
+            n_machines = len(config.get('machine_names') or [])
+        return max(1, n_machines) / target_rate
+    return float(config['write_frequency'])
+
+
+def clock_scale(config):
+    """Simulated seconds per wall-clock second for a run (``time_scale``, default 1).
+
+    With a scale of 60 an hour of Custom timestamps is written in a minute:
+    intervals, cadences and scenario times stay in simulated seconds and
+    only the pacing speeds up. Current timestamps follow the wall clock, so
+    they always run at 1.
+    """
+    scale = float(config.get('time_scale') or 1.0)
+    if scale <= 0:
+        raise ValueError(f"Time scale must be positive, got {scale}")
+    if config.get('timestamp_mode') == 'Current':
+        return 1.0
+    return scale
+
+
+class RateScheduler:
+    """Tick scheduler driven by monotonic deadlines.
+
+    Deadlines are ``start + k * interval``, so time spent generating and
+    writing never pushes later ticks back. When a deadline has already passed
+    the policy decides what ``due`` returns:
+
+    - ``catch_up``: one tick per call until every missed deadline is emitted
+    - ``skip``: one tick now, missed deadlines are dropped (counted in ``skipped_ticks``)
+    - ``coalesce``: every missed tick at once, for the caller to emit as one batch
+
+    ``interval`` is in simulated seconds; with a ``time_scale`` of N ticks
+    come due N times as often on the wall clock (see ``clock_scale``).
+    """
+
+    def __init__(self, interval, missed=MISSED_CATCH_UP, rows_per_tick=1, clock=time_module.monotonic, window=1000,
+                 time_scale=1.0):
+        if missed not in MISSED_POLICIES:
+            raise ValueError(f"Unknown missed-deadline policy {missed!r}; expected one of {MISSED_POLICIES}")
+        self.interval = float(interval)
+        self.time_scale = float(time_scale)
+        self._wall_interval = self.interval / self.time_scale
+        self.missed = missed
+        self.rows_per_tick = rows_per_tick
+        self.clock = clock
+        self._lateness = collections.deque(maxlen=window)
+        self.start()
+
+    def start(self, now=None):
+        now = self.clock() if now is None else now
+        self.started = now
+        # The first tick is due one interval after start, as the simulator has always done
+        self.next_deadline = now + self._wall_interval
+        self.ticks = 0
+        self.skipped_ticks = 0
+        self._lateness.clear()
+
+    def time_until_due(self, now=None):
+        now = self.clock() if now is None else now
+        return max(0.0, self.next_deadline - now)
+
+    def due(self, now=None):
+        """Number of ticks to emit now (0 if the next deadline hasn't arrived)."""
+        now = self.clock() if now is None else now
+        if now < self.next_deadline:
+            return 0
+
+        missed = int(math.floor((now - self.next_deadline) / self._wall_interval)) + 1
+        self._lateness.append(now - self.next_deadline)
+        if self.missed == MISSED_CATCH_UP:
+            n_ticks = 1
+        elif self.missed == MISSED_SKIP:
+            n_ticks = 1
+            self.skipped_ticks += missed - 1
+            self.next_deadline += (missed - 1) * self._wall_interval
+        else:
+            n_ticks = missed
+        self.next_deadline += n_ticks * self._wall_interval
+        self.ticks += n_ticks
+        return n_ticks
+
+    def wait(self, stop_event=None):
+        """Block until at least one tick is due and return how many. Returns 0 if ``stop_event`` is set."""
+        while True:
+            n_ticks = self.due()
+            if n_ticks:
+                return n_ticks
+            remaining = self.time_until_due()
+            if stop_event is not None:
+                if stop_event.wait(remaining):
+                    return 0
+            else:
+                time_module.sleep(remaining)
+
+    def stats(self, now=None):
+        now = self.clock() if now is None else now
+        elapsed = max(now - self.started, 1e-9)
+        target_ticks = 1.0 / self._wall_interval
+        achieved_ticks = self.ticks / elapsed
+        lateness_ms = np.array(self._lateness) * 1000.0
+        jitter = np.percentile(lateness_ms, [50, 95, 99]) if len(lateness_ms) else [0.0, 0.0, 0.0]
+        return {
+            'target_ticks_per_second': target_ticks,
+            'achieved_ticks_per_second': achieved_ticks,
+            'target_rows_per_second': target_ticks * self.rows_per_tick,
+            'achieved_rows_per_second': achieved_ticks * self.rows_per_tick,
+            'ticks': self.ticks,
+            'skipped_ticks': self.skipped_ticks,
+            'jitter_p50_ms': float(jitter[0]),
+            'jitter_p95_ms': float(jitter[1]),
+            'jitter_p99_ms': float(jitter[2]),
+            'time_scale': self.time_scale,
+            # Simulated seconds covered (skipped ticks included) per wall-clock second
+            'achieved_time_scale': (self.ticks + self.skipped_ticks) * self.interval / elapsed,
+        }
+
+
+def machine_cadences(config, machine_configs, machine_names):
+    """Per-machine cadences for a run, or None when every machine follows the global tick.
+
+    A machine config's ``cadence`` is ``{"interval": 30, "jitter": 2,
+    "burst_size": 5, "burst_gap": 0.2}``: a report every ``interval``
+    seconds, moved by up to ``jitter`` seconds either way, of ``burst_size``
+    rows ``burst_gap`` seconds apart. Machines without one report every
+    ``tick_interval(config)`` seconds with no jitter.
+    """
+    if not any((machine_configs.get(name) or {}).get('cadence') for name in machine_names):
+        return None
+    default_interval = tick_interval(config, len(machine_names))
+    cadences = []
+    for name in machine_names:
+        cadence = (machine_configs.get(name) or {}).get('cadence') or {}
+        interval = float(cadence.get('interval') or default_interval)
+        jitter = float(cadence.get('jitter') or 0.0)
+        burst_size = int(cadence.get('burst_size') or 1)
+        burst_gap = float(cadence.get('burst_gap') or 0.0)
+        if interval <= 0 or jitter < 0 or burst_size < 1 or burst_gap < 0:
+            raise ValueError(f"{name}: cadence needs a positive interval, burst_size of at least 1 and "
+                             f"non-negative jitter and burst_gap, got {cadence}")
+        if (burst_size - 1) * burst_gap >= interval:
+            raise ValueError(f"{name}: a burst of {burst_size} rows {burst_gap}s apart doesn't fit in its {interval}s interval")
+        cadences.append({'name': name, 'interval': interval, 'jitter': jitter,
+                         'burst_size': burst_size, 'burst_gap': burst_gap})
+    return cadences
+
+
+class CadenceScheduler:
+    """Priority-queue scheduler for machines reporting at their own cadences.
+
+    Every machine's next report sits in one heap keyed by its deadline.
+    ``due`` pops everything whose deadline has passed and returns it as one
+    batch of events, so rows that come due together are written together
+    whatever mix of rates produced them. Report ``k`` of a machine is
+    nominally due ``k * interval`` after start (the first one interval in,
+    like ``RateScheduler``), each row of a burst ``burst_gap`` after the
+    last, and each shifted by a uniform draw of up to ``jitter`` seconds
+    while staying after the machine's previous row. With a ``seed`` the
+    jitter of each machine comes from its own stream, so it doesn't depend
+    on the rest of the fleet or how it is sharded.
+
+    Missed deadlines:
+
+    - ``catch_up``: one ``interval`` of overdue rows per call, from the
+      earliest, until every missed row is emitted
+    - ``skip``: only the rows of each machine's latest overdue report, so a
+      whole burst survives (earlier rows are counted in ``skipped_ticks``)
+    - ``coalesce``: every overdue row in one batch
+
+    A "tick" here is one batch; ``interval`` is the fastest machine's.
+    Cadences and offsets are in simulated seconds, paced ``time_scale``
+    times faster than the wall clock.
+    """
+
+    def __init__(self, cadences, missed=MISSED_CATCH_UP, clock=time_module.monotonic, window=1000, seed=None,
+                 time_scale=1.0):
+        if missed not in MISSED_POLICIES:
+            raise ValueError(f"Unknown missed-deadline policy {missed!r}; expected one of {MISSED_POLICIES}")
+        if not cadences:
+            raise ValueError("CadenceScheduler needs at least one machine cadence")
+        self.cadences = cadences
+        self.missed = missed
+        self.clock = clock
+        self.seed = seed
+        self.time_scale = float(time_scale)
+        self.interval = min(cadence['interval'] for cadence in cadences)
+        self.rows_per_second = sum(cadence['burst_size'] / cadence['interval'] for cadence in cadences)
+        self._lateness = collections.deque(maxlen=window)
+        self.start()
+
+    def start(self, now=None):
+        now = self.clock() if now is None else now
+        self.started = now
+        self.ticks = 0
+        self.rows = 0
+        self.skipped_ticks = 0
+        self.simulated_seconds = 0.0
+        self._lateness.clear()
+        self._rngs = [
+            np.random.default_rng(None if self.seed is None else
+                                  np.random.SeedSequence(int(self.seed), spawn_key=(zlib.crc32(cadence['name'].encode('utf-8')),)))
+            for cadence in self.cadences
+        ]
+        # Per machine: reports so far and position in the current burst
+        self._reports = [0] * len(self.cadences)
+        self._burst = [0] * len(self.cadences)
+        self._last = [0.0] * len(self.cadences)
+        self._heap = []
+        for machine in range(len(self.cadences)):
+            self._push(machine)
+
+    def _push(self, machine):
+        offset = self._next_offset(machine)
+        heapq.heappush(self._heap, (offset, machine, self._reports[machine]))
+
+    def _next_offset(self, machine):
+        # Seconds after start of the machine's next row; advances its report/burst counters
+        cadence = self.cadences[machine]
+        if self._burst[machine] == 0:
+            self._reports[machine] += 1
+        offset = self._reports[machine] * cadence['interval'] + self._burst[machine] * cadence['burst_gap']
+        if cadence['jitter']:
+            offset += self._rngs[machine].uniform(-cadence['jitter'], cadence['jitter'])
+        offset = max(offset, self._last[machine])
+        self._last[machine] = offset
+        self._burst[machine] = (self._burst[machine] + 1) % cadence['burst_size']
+        return offset
+
+    def _elapsed(self, now):
+        # Simulated seconds since start
+        return (now - self.started) * self.time_scale
+
+    def time_until_due(self, now=None):
+        now = self.clock() if now is None else now
+        return max(0.0, (self._heap[0][0] - self._elapsed(now)) / self.time_scale)
+
+    def due(self, now=None):
+        """``(offsets, machine_index)`` arrays of the rows due now, in deadline order, or None.
+
+        ``offsets`` are seconds after start (for the rows' timestamps) and
+        ``machine_index`` indexes the cadences given at construction.
+        """
+        now = self.clock() if now is None else now
+        elapsed = self._elapsed(now)
+        if self._heap[0][0] > elapsed:
+            return None
+
+        cutoff = elapsed
+        if self.missed == MISSED_CATCH_UP:
+            # The rest stay overdue for the next calls
+            cutoff = min(elapsed, self._heap[0][0] + self.interval)
+        events = []
+        while self._heap[0][0] <= cutoff:
+            offset, machine, report = heapq.heappop(self._heap)
+            events.append((offset, machine, report))
+            self._push(machine)
+        if self.missed == MISSED_SKIP:
+            latest = {}
+            for _, machine, report in events:
+                latest[machine] = max(report, latest.get(machine, report))
+            kept = [event for event in events if event[2] == latest[event[1]]]
+            self.skipped_ticks += len(events) - len(kept)
+            events = kept
+
+        self._lateness.append((elapsed - events[0][0]) / self.time_scale)
+        self.ticks += 1
+        self.rows += len(events)
+        self.simulated_seconds = events[-1][0]
+        offsets, machines, _ = zip(*events)
+        return np.array(offsets), np.array(machines, dtype=np.intp)
+
+    def wait(self, stop_event=None):
+        """Block until rows are due and return them as ``due`` does. Returns None if ``stop_event`` is set."""
+        while True:
+            events = self.due()
+            if events is not None:
+                return events
+            remaining = self.time_until_due()
+            if stop_event is not None:
+                if stop_event.wait(remaining):
+                    return None
+            else:
+                time_module.sleep(remaining)
+
+    def stats(self, now=None):
+        now = self.clock() if now is None else now
+        elapsed = max(now - self.started, 1e-9)
+        lateness_ms = np.array(self._lateness) * 1000.0
+        jitter = np.percentile(lateness_ms, [50, 95, 99]) if len(lateness_ms) else [0.0, 0.0, 0.0]
+        return {
+            'target_ticks_per_second': self.time_scale / self.interval,
+            'achieved_ticks_per_second': self.ticks / elapsed,
+            'target_rows_per_second': self.rows_per_second * self.time_scale,
+            'achieved_rows_per_second': self.rows / elapsed,
+            'ticks': self.ticks,
+            'skipped_ticks': self.skipped_ticks,
+            'jitter_p50_ms': float(jitter[0]),
+            'jitter_p95_ms': float(jitter[1]),
+            'jitter_p99_ms': float(jitter[2]),
+            'time_scale': self.time_scale,
+            'achieved_time_scale': self.simulated_seconds / elapsed,
+        }
@@ -0,0 +1,242 @@
+"""Sharded simulator: machines split across worker processes.
+
+Each worker runs ``run_simulator`` for its shard of machines with its own
+rate scheduler. Output goes one of two ways:
+
+- ``worker``: every worker writes its own rows through the configured sink
+  (each opens its own Snowflake session, or none for the offline sinks)
+- ``aggregate``: workers send their frames back and one writer in the
+  parent process writes them, merging whatever has arrived into one write
+
+Workers report their progress over a status queue; ``ShardedSimulator.metrics``
+rolls it up into the fleet-wide totals the UI and the CLI show. With a run
+seed the data is identical to an unsharded run, because every machine
+measure has its own random stream.
+"""
+import multiprocessing
+import queue
+import threading
+import time as time_module
+
+from sim_sinks import OFFLINE_SINKS, QueuedWriter, build_writer, concat_frames
+
+SHARD_WRITE_WORKER = 'worker'
+SHARD_WRITE_AGGREGATE = 'aggregate'
+SHARD_WRITE_MODES = [SHARD_WRITE_WORKER, SHARD_WRITE_AGGREGATE]
+
+
+def partition_machines(machine_names, n_shards):
+    """Split machines into ``n_shards`` contiguous, evenly sized groups (empty groups dropped)."""
+    n_shards = max(1, min(int(n_shards), len(machine_names)))
+    size, extra = divmod(len(machine_names), n_shards)
+    shards = []
+    start = 0
+    for i in range(n_shards):
+        end = start + size + (1 if i < extra else 0)
+        shards.append(list(machine_names[start:end]))
+        start = end
+    return [shard for shard in shards if shard]
+
+
+def _shard_summary(shard_id, stats):
+    writer = stats.get('writer') or {}
+    scheduler = stats.get('scheduler') or {}
+    return {
+        'shard': shard_id,
+        'state': stats['state'],
+        'ticks': stats['ticks'],
+        'total_rows': stats['total_rows'],
+        'written_rows': writer.get('written_rows', 0),
+        'dropped_rows': writer.get('dropped_rows', 0),
+        'queue_depth': writer.get('queue_depth', 0),
+        'write_latency_avg': writer.get('write_latency_avg', 0.0),
+        'errors': writer.get('errors', 0),
+        'last_error': stats.get('last_error') or writer.get('last_error'),
+        'achieved_rows_per_second': scheduler.get('achieved_rows_per_second', 0.0),
+        'target_rows_per_second': scheduler.get('target_rows_per_second', 0.0),
+        'jitter_p95_ms': scheduler.get('jitter_p95_ms', 0.0),
+        'last_timestamp': stats.get('last_timestamp'),
+        'updated_at': time_module.time(),
+    }
+
+
+def _run_shard(shard_id, config, machine_configs, columns, write_mode, connection_name,
+               stop_event, status_queue, data_queue, max_ticks, duration, status_every):
+    # Runs in the worker process
+    from sim_runner import create_session, run_simulator
+
+    stats = {'state': 'Starting', 'ticks': 0, 'total_rows': 0, 'last_error': None}
+    try:
+        session = None
+        writer = None
+        if write_mode == SHARD_WRITE_AGGREGATE:
+            writer = QueuedWriter(data_queue.put, max_batches=config.get('write_queue_size', 10),
+                                  policy=config.get('write_policy', 'block'), name=f'shard-{shard_id}-sender')
+        elif (config.get('sink') or 'table') not in OFFLINE_SINKS:
+            session = create_session(connection_name)
+
+        last_status = [0.0]
+
+        def on_tick(tick_stats):
+            if time_module.time() - last_status[0] >= status_every:
+                status_queue.put(_shard_summary(shard_id, tick_stats))
+                last_status[0] = time_module.time()
+
+        stats = run_simulator(session, config, machine_configs, columns, max_ticks, duration, stop_event,
+                              on_tick, log=lambda message: None, writer=writer)
+    except Exception as e:
+        stats = dict(stats, state='Failed', last_error=str(e))
+    status_queue.put(_shard_summary(shard_id, stats))
+
+
+class ShardedSimulator:
+    """Run the configured fleet as ``n_shards`` worker processes.
+
+    ``start`` launches the workers, ``metrics`` returns the rolled-up totals
+    plus one summary per shard, and ``stop`` signals the workers, waits for
+    them and drains the aggregating writer. ``session`` is only used by the
+    parent's writer in ``aggregate`` mode; ``worker`` mode opens a session
+    per process from ``connection_name``.
+    """
+
+    def __init__(self, config, machine_configs, columns, n_shards, write_mode=SHARD_WRITE_WORKER,
+                 session=None, connection_name=None, max_ticks=None, duration=None, status_every=1.0):
+        if write_mode not in SHARD_WRITE_MODES:
+            raise ValueError(f"Unknown shard write mode {write_mode!r}; expected one of {SHARD_WRITE_MODES}")
+        self.config = config
+        self.machine_configs = machine_configs
+        self.columns = columns
+        self.shards = partition_machines(config['machine_names'], n_shards)
+        self.write_mode = write_mode
+        self.session = session
+        self.connection_name = connection_name
+        self.max_ticks = max_ticks
+        self.duration = duration
+        self.status_every = status_every
+        self._context = multiprocessing.get_context('spawn')
+        self._processes = []
+        self._status = {}
+        self._writer = None
+        self._collector = None
+        self._collecting = threading.Event()
+
+    def start(self):
+        self._stop_event = self._context.Event()
+        self._status_queue = self._context.Queue()
+        self._data_queue = None
+        if self.write_mode == SHARD_WRITE_AGGREGATE:
+            self._data_queue = self._context.Queue(maxsize=len(self.shards) * self.config.get('write_queue_size', 10))
+            self._writer = build_writer(self.session, self.config, self.config.get('column_types'))
+            self._collecting.set()
+            self._collector = threading.Thread(target=self._collect, name='shard-collector', daemon=True)
+            self._collector.start()
+
+        for shard_id, machine_names in enumerate(self.shards):
+            shard_config = dict(self.config, machine_names=machine_names, shard=shard_id)
+            shard_configs = {name: self.machine_configs[name] for name in machine_names}
+            self._status[shard_id] = {'shard': shard_id, 'state': 'Starting', 'ticks': 0, 'total_rows': 0,
+                                      'machines': len(machine_names)}
+            process = self._context.Process(
+                target=_run_shard,
+                args=(shard_id, shard_config, shard_configs, self.columns, self.write_mode, self.connection_name,
+                      self._stop_event, self._status_queue, self._data_queue, self.max_ticks, self.duration,
+                      self.status_every),
+                name=f'simulator-shard-{shard_id}',
+                daemon=True
+            )
+            process.start()
+            self._processes.append(process)
+        return self
+
+    def _collect(self):
+        # Merge every frame that has arrived from the shards into one write for the parent's writer
+        while self._collecting.is_set() or not self._data_queue.empty():
+            try:
+                frames = [self._data_queue.get(timeout=0.2)]
+            except queue.Empty:
+                continue
+            while True:
+                try:
+                    frames.append(self._data_queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._writer.submit(concat_frames(frames))
+
+    def _drain_status(self):
+        while True:
+            try:
+                summary = self._status_queue.get_nowait()
+            except queue.Empty:
+                return
+            self._status[summary['shard']].update(summary)
+
+    @property
+    def running(self):
+        return any(process.is_alive() for process in self._processes)
+
+    def metrics(self):
+        """Fleet-wide totals rolled up from the latest report of every shard."""
+        self._drain_status()
+        for shard_id, process in enumerate(self._processes):
+            status = self._status[shard_id]
+            status['alive'] = process.is_alive()
+            if not process.is_alive() and status['state'] in ('Starting', 'Running'):
+                status['state'] = 'Failed' if process.exitcode else 'Stopped'
+        shards = [self._status[shard_id] for shard_id in sorted(self._status)]
+        metrics = {
+            'shards': len(shards),
+            'alive': sum(1 for s in shards if s.get('alive')),
+            'total_rows': sum(s['total_rows'] for s in shards),
+            'written_rows': sum(s.get('written_rows', 0) for s in shards),
+            'dropped_rows': sum(s.get('dropped_rows', 0) for s in shards),
+            'errors': sum(s.get('errors', 0) for s in shards),
+            'achieved_rows_per_second': sum(s.get('achieved_rows_per_second', 0.0) for s in shards),
+            'target_rows_per_second': sum(s.get('target_rows_per_second', 0.0) for s in shards),
+            # Ticks and timestamp every shard has reached, so the rollup reads like a single run's stats
+            'ticks': min((s['ticks'] for s in shards), default=0),
+            'last_timestamp': min((s['last_timestamp'] for s in shards if s.get('last_timestamp')), default=None),
+            'failed_shards': [s['shard'] for s in shards if s['state'] == 'Failed'],
+            'last_error': next((s.get('last_error') for s in shards if s.get('last_error')), None),
+            'per_shard': shards,
+        }
+        if self._writer is not None:
+            # In aggregate mode rows count as written once the parent's writer has written them
+            writer = self._writer.metrics()
+            metrics['written_rows'] = writer['written_rows']
+            metrics['dropped_rows'] += writer['dropped_rows']
+            metrics['errors'] += writer['errors']
+            metrics['last_error'] = metrics['last_error'] or writer['last_error']
+            metrics['writer'] = writer
+        if metrics['alive']:
+            metrics['state'] = 'Running'
+        else:
+            metrics['state'] = 'Failed' if metrics['failed_shards'] or metrics['errors'] else 'Stopped'
+        return metrics
+
+    def stop(self, timeout=60):
+        """Stop every shard, wait for their final reports and flush the aggregating writer."""
+        self._stop_event.set()
+        deadline = time_module.monotonic() + timeout
+        # Keep reading status while waiting so no worker blocks on exit behind a full queue
+        while self.running and time_module.monotonic() < deadline:
+            self._drain_status()
+            for process in self._processes:
+                process.join(0.1)
+        for process in self._processes:
+            if process.is_alive():
+                process.terminate()
+        if self._collector is not None:
+            self._collecting.clear()
+            self._collector.join(max(0.0, deadline - time_module.monotonic()))
+        if self._writer is not None:
+            self._writer.stop(max(0.0, deadline - time_module.monotonic()))
+        return self.metrics()
+
+    def wait(self, stop_event=None, on_status=None, status_every=None):
+        """Block until every shard finishes (or ``stop_event`` is set), calling ``on_status`` with the rollup."""
+        status_every = status_every or self.status_every
+        while self.running and not (stop_event is not None and stop_event.is_set()):
+            time_module.sleep(status_every)
+            if on_status:
+                on_status(self.metrics())
+        return self.stop()
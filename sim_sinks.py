@@ -0,0 +1,950 @@
+import collections
+import itertools
+import os
+import shutil
+import tempfile
+import threading
+import time as time_module
+import random
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from sim_engine import apply_coercion_plan, compile_coercion_plan, timed, write_frame
+
+def concat_frames(frames):
+    """Concatenate batches, keeping categorical columns categorical when their categories differ."""
+    if len(frames) == 1:
+        return frames[0]
+    first = frames[0]
+    for col in first.columns:
+        if isinstance(first[col].dtype, pd.CategoricalDtype) and any(df[col].dtype != first[col].dtype for df in frames[1:]):
+            # e.g. batches from different shards, each with its own machines
+            categories = pd.unique(np.concatenate([np.asarray(df[col].cat.categories) for df in frames]))
+            dtype = pd.CategoricalDtype(categories)
+            frames = [df.assign(**{col: df[col].astype(dtype)}) for df in frames]
+    return pd.concat(frames, ignore_index=True)
+
+
+# Backpressure policies for QueuedWriter when the queue is full
+POLICY_BLOCK = 'block'
+POLICY_DROP_OLDEST = 'drop_oldest'
+POLICY_COALESCE = 'coalesce'
+WRITE_POLICIES = [POLICY_BLOCK, POLICY_DROP_OLDEST, POLICY_COALESCE]
+
+
+class QueuedWriter:
+    """Drain generated batches to ``write_fn`` on a dedicated writer thread.
+
+    ``submit`` returns as soon as the batch is queued so generation keeps its
+    cadence while the warehouse is slow. When ``max_batches`` are already
+    waiting the policy decides what happens:
+
+    - ``block``: wait for the writer to make room
+    - ``drop_oldest``: discard the oldest queued batch (counted in ``dropped_rows``)
+    - ``coalesce``: merge everything queued plus the new batch into one write
+
+    ``poll_fn`` is called on the writer thread every ``poll_interval``
+    seconds while idle, ``close_fn`` once after the queue is drained on stop,
+    and ``metrics_fn`` contributes extra entries to ``metrics()``. Latency
+    percentiles cover the last ``latency_window`` writes.
+    """
+
+    def __init__(self, write_fn, max_batches=10, policy=POLICY_BLOCK, name='simulator-writer',
+                 poll_fn=None, close_fn=None, metrics_fn=None, poll_interval=1.0, latency_window=1000):
+        if policy not in WRITE_POLICIES:
+            raise ValueError(f"Unknown write policy {policy!r}; expected one of {WRITE_POLICIES}")
+        self.write_fn = write_fn
+        self.max_batches = max(1, int(max_batches))
+        self.policy = policy
+        self.poll_fn = poll_fn
+        self.close_fn = close_fn
+        self.metrics_fn = metrics_fn
+        self.poll_interval = poll_interval
+        self._queue = collections.deque()
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._busy = False
+        self._latencies = collections.deque(maxlen=latency_window)
+        self._metrics = {
+            'submitted_rows': 0,
+            'written_rows': 0,
+            'written_batches': 0,
+            'dropped_rows': 0,
+            'dropped_batches': 0,
+            'coalesced_batches': 0,
+            'errors': 0,
+            'last_error': None,
+            'write_latency_last': 0.0,
+            'write_latency_max': 0.0,
+            'write_latency_total': 0.0,
+            'max_queue_depth': 0,
+        }
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, df):
+        with self._cond:
+            if self._stopping:
+                raise RuntimeError("Writer is stopped")
+            self._metrics['submitted_rows'] += len(df)
+            if len(self._queue) >= self.max_batches:
+                if self.policy == POLICY_BLOCK:
+                    while len(self._queue) >= self.max_batches and not self._stopping:
+                        self._cond.wait()
+                elif self.policy == POLICY_DROP_OLDEST:
+                    dropped = self._queue.popleft()
+                    self._metrics['dropped_rows'] += len(dropped)
+                    self._metrics['dropped_batches'] += 1
+                else:
+                    self._metrics['coalesced_batches'] += len(self._queue)
+                    df = concat_frames(list(self._queue) + [df])
+                    self._queue.clear()
+            self._queue.append(df)
+            self._metrics['max_queue_depth'] = max(self._metrics['max_queue_depth'], len(self._queue))
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            df = None
+            with self._cond:
+                while not self._queue and not self._stopping:
+                    if self.poll_fn is None:
+                        self._cond.wait()
+                    elif not self._cond.wait(self.poll_interval):
+                        break
+                stopping = self._stopping and not self._queue
+                if self._queue:
+                    df = self._queue.popleft()
+                self._busy = True
+                self._cond.notify_all()
+
+            # Writes, polls and the final close all run outside the lock so submit() never waits on the warehouse
+            started = time_module.perf_counter()
+            try:
+                if df is not None:
+                    self.write_fn(df)
+                elif stopping:
+                    if self.close_fn is not None:
+                        self.close_fn()
+                elif self.poll_fn is not None:
+                    self.poll_fn()
+                error = None
+            except Exception as e:
+                error = e
+            latency = time_module.perf_counter() - started
+
+            with self._cond:
+                self._busy = False
+                if error is not None:
+                    self._metrics['errors'] += 1
+                    self._metrics['last_error'] = str(error)
+                if df is not None:
+                    if error is None:
+                        self._metrics['written_rows'] += len(df)
+                        self._metrics['written_batches'] += 1
+                    self._metrics['write_latency_last'] = latency
+                    self._metrics['write_latency_max'] = max(self._metrics['write_latency_max'], latency)
+                    self._metrics['write_latency_total'] += latency
+                    self._latencies.append(latency)
+                self._cond.notify_all()
+                if stopping:
+                    return
+
+    def flush(self, timeout=None):
+        """Wait until everything queued so far has been written. Returns False on timeout."""
+        deadline = None if timeout is None else time_module.monotonic() + timeout
+        with self._cond:
+            while self._queue or self._busy:
+                remaining = None if deadline is None else deadline - time_module.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stop(self, timeout=None):
+        """Write whatever is still queued, then stop the writer thread."""
+        flushed = self.flush(timeout)
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        return flushed
+
+    @property
+    def running(self):
+        return self._thread.is_alive()
+
+    def metrics(self):
+        with self._cond:
+            metrics = dict(self._metrics)
+            metrics['queue_depth'] = len(self._queue)
+            metrics['queued_rows'] = sum(len(df) for df in self._queue)
+            latencies = np.array(self._latencies)
+        percentiles = np.percentile(latencies, [50, 95, 99]) if len(latencies) else [0.0, 0.0, 0.0]
+        metrics['write_latency_p50'], metrics['write_latency_p95'], metrics['write_latency_p99'] = map(float, percentiles)
+        attempts = metrics['written_batches'] + metrics['errors']
+        metrics['write_latency_avg'] = metrics.pop('write_latency_total') / attempts if attempts else 0.0
+        if self.metrics_fn is not None:
+            metrics.update(self.metrics_fn())
+        return metrics
+
+
+class CoalescingSink:
+    """Buffer batches across ticks and write them in one call.
+
+    The buffer is flushed to ``write_fn`` once it holds ``max_rows`` rows,
+    ``max_bytes`` bytes or its oldest row is ``max_seconds`` old, whichever
+    comes first; a limit of 0 disables that trigger. ``close`` always
+    flushes what is left.
+
+    A flush that fails is never put back in the buffer, so an outage can't
+    grow it past the limits: its rows are counted in ``failed_rows``, saved
+    to ``dead_letter_dir`` when one is given, and the error is re-raised.
+    Retries belong in ``write_fn`` (see ``RetryingSink``).
+    """
+
+    def __init__(self, write_fn, max_rows=10000, max_bytes=16 * 1024 * 1024, max_seconds=30.0, dead_letter_dir=None,
+                 prefix='coalesced'):
+        self.write_fn = write_fn
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.dead_letter_dir = dead_letter_dir
+        self.prefix = prefix
+        self._buffer = []
+        self._rows = 0
+        self._bytes = 0
+        self._oldest = None
+        self._lock = threading.RLock()
+        self._metrics = {'flushes': 0, 'flushed_rows': 0, 'flush_latency_total': 0.0, 'failed_flushes': 0,
+                         'failed_rows': 0}
+
+    def write(self, df):
+        with self._lock:
+            if self._oldest is None:
+                self._oldest = time_module.monotonic()
+            self._buffer.append(df)
+            self._rows += len(df)
+            self._bytes += int(df.memory_usage(index=False, deep=True).sum())
+            if (self.max_rows and self._rows >= self.max_rows) or (self.max_bytes and self._bytes >= self.max_bytes):
+                self.flush()
+            else:
+                self.poll()
+
+    def poll(self):
+        with self._lock:
+            if self._oldest is not None and self.max_seconds and time_module.monotonic() - self._oldest >= self.max_seconds:
+                self.flush()
+
+    def flush(self):
+        with self._lock:
+            if not self._buffer:
+                return
+            df = concat_frames(self._buffer)
+            self._buffer = []
+            self._rows = 0
+            self._bytes = 0
+            self._oldest = None
+            started = time_module.perf_counter()
+            try:
+                self.write_fn(df)
+            except Exception:
+                self._metrics['failed_flushes'] += 1
+                self._metrics['failed_rows'] += len(df)
+                if self.dead_letter_dir:
+                    spill_frame(df, self.dead_letter_dir, f"{self.prefix}_{uuid.uuid4().hex[:8]}")
+                raise
+            self._metrics['flush_latency_total'] += time_module.perf_counter() - started
+            self._metrics['flushes'] += 1
+            self._metrics['flushed_rows'] += len(df)
+
+    def close(self):
+        self.flush()
+
+    def metrics(self):
+        with self._lock:
+            flushes = self._metrics['flushes']
+            return {
+                'buffered_rows': self._rows,
+                'buffered_bytes': self._bytes,
+                'flushes': flushes,
+                'flushed_rows': self._metrics['flushed_rows'],
+                'rows_per_write': self._metrics['flushed_rows'] / flushes if flushes else 0.0,
+                'flush_latency_avg': self._metrics['flush_latency_total'] / flushes if flushes else 0.0,
+                'failed_flushes': self._metrics['failed_flushes'],
+                'failed_rows': self._metrics['failed_rows'],
+            }
+
+
+def table_writer(session, database, schema, table, plan=None):
+    """Write function appending batches to ``database.schema.table``."""
+    def write(df):
+        write_frame(session, df, database, schema, table, plan)
+    return write
+
+
+# One lock per Snowpark session: threads sharing a session take it around their statements
+_session_locks = {}
+_session_locks_guard = threading.Lock()
+
+
+def session_lock(session):
+    """Re-entrant lock serializing statements on ``session`` across threads.
+
+    A BatchLedger holds it for a whole batch, so no other thread's
+    statement (DDL commits an open transaction) lands inside the batch's
+    transaction.
+    """
+    with _session_locks_guard:
+        return _session_locks.setdefault(id(session), threading.RLock())
+
+
+def run_sql(session, query):
+    """``session.sql(query).collect()`` under the session's lock."""
+    with session_lock(session):
+        return session.sql(query).collect()
+
+
+# Exactly-once bookkeeping for table writes: one row per committed batch
+LEDGER_TABLE = 'SIMULATOR_BATCHES'
+STAGING_SUFFIX = '_SIM_STAGING'
+RUN_ID_COLUMN = 'SIM_RUN_ID'
+SEQ_COLUMN = 'SIM_SEQ'
+
+
+class BatchLedger:
+    """Idempotent batch commits to ``database.schema.table``, keyed by ``(run_id, seq)``.
+
+    A batch is first written, tagged with its key, to a transient staging
+    table (``<table>_SIM_STAGING``, the target's columns plus SIM_RUN_ID and
+    SIM_SEQ) by whatever sink ``staged_write`` is. One transaction then
+    copies it into the target and records the key in SIMULATOR_BATCHES, so
+    the target gets either the whole batch with its ledger row or neither.
+    ``committed`` asks the ledger whether a key is in, which is how a retry
+    tells a write that failed from one that committed before its error.
+    Only the batch's own staging rows are ever deleted. The session's lock
+    (see ``session_lock``) is held from the staging write to the commit.
+
+    This costs a staging write and five more statements per batch, so it is
+    opt-in (``exactly_once``); plain retries can repeat a write that
+    committed before its error.
+    """
+
+    def __init__(self, session, database, schema, table, run_id=None):
+        self.session = session
+        self.table_name = f"{database}.{schema}.{table}"
+        self.staging_table = table + STAGING_SUFFIX
+        self.staging_name = f"{database}.{schema}.{self.staging_table}"
+        self.ledger_name = f"{database}.{schema}.{LEDGER_TABLE}"
+        self.run_id = run_id or uuid.uuid4().hex
+        self.staged_write = None
+        self._ready = False
+        self._attempted = set()
+
+    def _key(self, sequence):
+        return f"RUN_ID = '{self.run_id}' AND TABLE_NAME = '{self.table_name}' AND SEQ = {int(sequence)}"
+
+    def _staged_key(self, sequence):
+        return f"{RUN_ID_COLUMN} = '{self.run_id}' AND {SEQ_COLUMN} = {int(sequence)}"
+
+    def ensure_tables(self):
+        if self._ready:
+            return
+        for statement in [
+            f"""CREATE TABLE IF NOT EXISTS {self.ledger_name} (
+                RUN_ID VARCHAR, TABLE_NAME VARCHAR, SEQ NUMBER, ROWS NUMBER,
+                COMMITTED_AT TIMESTAMP_NTZ(9) DEFAULT CURRENT_TIMESTAMP())""",
+            f"CREATE TRANSIENT TABLE IF NOT EXISTS {self.staging_name} LIKE {self.table_name}",
+            f"ALTER TABLE {self.staging_name} ADD COLUMN IF NOT EXISTS {RUN_ID_COLUMN} VARCHAR",
+            f"ALTER TABLE {self.staging_name} ADD COLUMN IF NOT EXISTS {SEQ_COLUMN} NUMBER",
+        ]:
+            self.session.sql(statement).collect()
+        self._ready = True
+
+    def committed(self, sequence):
+        with session_lock(self.session):
+            self.ensure_tables()
+            rows = self.session.sql(f"SELECT COUNT(*) AS N FROM {self.ledger_name} WHERE {self._key(sequence)}").collect()
+        if rows and rows[0]['N']:
+            self._attempted.discard(sequence)
+            return True
+        return False
+
+    def write(self, df, sequence):
+        with session_lock(self.session):
+            self.ensure_tables()
+            if sequence in self._attempted:
+                # A failed attempt may have left part of this batch in staging; those rows are this batch's own
+                self.session.sql(f"DELETE FROM {self.staging_name} WHERE {self._staged_key(sequence)}").collect()
+            self._attempted.add(sequence)
+            self.staged_write(df.assign(**{RUN_ID_COLUMN: self.run_id, SEQ_COLUMN: sequence}))
+            self.commit(sequence, list(df.columns), len(df))
+            self._attempted.discard(sequence)
+
+    def commit(self, sequence, columns, n_rows):
+        column_list = ", ".join(columns)
+        unseen = f"NOT EXISTS (SELECT 1 FROM {self.ledger_name} WHERE {self._key(sequence)})"
+        statements = [
+            f"INSERT INTO {self.table_name} ({column_list}) SELECT {column_list} FROM {self.staging_name} "
+            f"WHERE {self._staged_key(sequence)} AND {unseen}",
+            f"INSERT INTO {self.ledger_name} (RUN_ID, TABLE_NAME, SEQ, ROWS) "
+            f"SELECT '{self.run_id}', '{self.table_name}', {int(sequence)}, {int(n_rows)} WHERE {unseen}",
+            f"DELETE FROM {self.staging_name} WHERE {self._staged_key(sequence)}",
+        ]
+        with session_lock(self.session):
+            self.session.sql("BEGIN TRANSACTION").collect()
+            try:
+                for statement in statements:
+                    self.session.sql(statement).collect()
+                self.session.sql("COMMIT").collect()
+            except Exception:
+                try:
+                    self.session.sql("ROLLBACK").collect()
+                except Exception:
+                    pass
+                raise
+
+
+def spill_frame(df, directory, name):
+    """Save ``df`` under ``directory`` as Parquet (CSV without pyarrow) and return the path."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name + '.parquet')
+    try:
+        df.to_parquet(path, index=False)
+    except ImportError:
+        path = os.path.join(directory, name + '.csv')
+        df.to_csv(path, index=False)
+    return path
+
+
+class RetryingSink:
+    """Retry failed writes with exponential backoff, then spill the batch to a dead-letter directory.
+
+    Every batch gets a sequence number. A failed write is retried up to
+    ``max_retries`` times, waiting ``backoff_seconds`` doubled per attempt
+    (capped at ``max_backoff_seconds``, with jitter). With a ``ledger``
+    (see ``BatchLedger``) batches are written through it under their
+    sequence number, and before each retry the ledger is asked whether the
+    failed attempt committed after all, so a write that timed out after
+    committing isn't repeated. A batch that still fails is written to
+    ``dead_letter_dir`` for replay with sim_replay.py and the run carries
+    on; without a directory the last error is raised.
+    """
+
+    def __init__(self, write_fn, max_retries=5, backoff_seconds=0.5, max_backoff_seconds=30.0, dead_letter_dir=None,
+                 ledger=None, prefix='batch', sleep=time_module.sleep, seed=None):
+        self.write_fn = write_fn
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.dead_letter_dir = dead_letter_dir
+        self.ledger = ledger
+        self.prefix = prefix
+        self.sleep = sleep
+        self._random = random.Random(seed)
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._metrics = {
+            'last_sequence': None,
+            'retries': 0,
+            'retried_batches': 0,
+            'deduplicated_batches': 0,
+            'dead_letter_batches': 0,
+            'dead_letter_rows': 0,
+            'last_retry_error': None,
+            'last_dead_letter': None,
+        }
+
+    def backoff(self, attempt):
+        # Jitter keeps shards that failed together from retrying in lockstep
+        delay = min(self.max_backoff_seconds, self.backoff_seconds * 2 ** attempt)
+        return delay * (0.5 + self._random.random() / 2)
+
+    def write(self, df):
+        sequence = next(self._sequence)
+        for attempt in range(self.max_retries + 1):
+            try:
+                if self.ledger is None:
+                    self.write_fn(df)
+                    break
+                if attempt and self.ledger.committed(sequence):
+                    with self._lock:
+                        self._metrics['deduplicated_batches'] += 1
+                    break
+                self.ledger.write(df, sequence)
+                break
+            except Exception as e:
+                with self._lock:
+                    self._metrics['last_retry_error'] = str(e)
+                    if attempt == 0:
+                        self._metrics['retried_batches'] += 1
+                if attempt == self.max_retries:
+                    if not self.dead_letter_dir:
+                        raise
+                    path = spill_frame(df, self.dead_letter_dir, f"{self.prefix}_{sequence:08d}_{uuid.uuid4().hex[:8]}")
+                    with self._lock:
+                        self._metrics['dead_letter_batches'] += 1
+                        self._metrics['dead_letter_rows'] += len(df)
+                        self._metrics['last_dead_letter'] = path
+                    break
+                with self._lock:
+                    self._metrics['retries'] += 1
+                self.sleep(self.backoff(attempt))
+        with self._lock:
+            self._metrics['last_sequence'] = sequence
+
+    def metrics(self):
+        with self._lock:
+            return dict(self._metrics)
+
+
+def snowflake_type_cast(data_type, precision=None, scale=None):
+    # Target type for the COPY INTO transform, from the INFORMATION_SCHEMA DATA_TYPE, NUMERIC_PRECISION and NUMERIC_SCALE
+    data_type = (data_type or 'VARCHAR').upper()
+    if data_type == 'TEXT':
+        return 'VARCHAR'
+    # A bare NUMBER cast is NUMBER(38,0), which would round scaled measures to integers
+    if data_type in ('NUMBER', 'DECIMAL', 'NUMERIC') and precision is not None:
+        return f"NUMBER({int(precision)},{int(scale or 0)})"
+    return data_type
+
+
+class SnowflakeStage:
+    """Uploads Parquet files to a Snowflake stage and loads them with COPY INTO.
+
+    Columns are cast to the table's own types, read from INFORMATION_SCHEMA
+    with their precision and scale on the first load, so NUMBER(p,s)
+    measures keep their decimals; ``column_types`` covers any column the
+    lookup doesn't return. The table stage (``@db.schema.%table``) is used
+    unless ``stage`` is given.
+    """
+
+    def __init__(self, session, database, schema, table, column_types, stage=None):
+        self.session = session
+        self.database = database
+        self.schema = schema
+        self.table = table
+        self.table_name = f"{database}.{schema}.{table}"
+        self.stage = stage or f"@{database}.{schema}.%{table}"
+        self.column_types = column_types
+        self.prefix = f"simulator/{uuid.uuid4().hex}"
+        self._casts = None
+
+    def column_casts(self):
+        if self._casts is None:
+            rows = self.session.sql(f"""
+            SELECT COLUMN_NAME, DATA_TYPE, NUMERIC_PRECISION, NUMERIC_SCALE
+            FROM {self.database}.INFORMATION_SCHEMA.COLUMNS
+            WHERE TABLE_SCHEMA = '{self.schema}' AND TABLE_NAME = '{self.table}'
+            """).collect()
+            self._casts = {row['COLUMN_NAME']: snowflake_type_cast(row['DATA_TYPE'], row['NUMERIC_PRECISION'],
+                                                                   row['NUMERIC_SCALE'])
+                           for row in rows}
+        return self._casts
+
+    def upload(self, local_path):
+        self.session.file.put(local_path, f"{self.stage}/{self.prefix}", auto_compress=False, overwrite=True)
+        return os.path.basename(local_path)
+
+    def copy_into(self, file_names, columns):
+        column_list = ", ".join(columns)
+        casts = self.column_casts()
+        select_list = ", ".join(f'$1:"{col}"::{casts.get(col) or snowflake_type_cast(self.column_types.get(col))}'
+                                for col in columns)
+        files = ", ".join(f"'{name}'" for name in file_names)
+        self.session.sql(f"""
+        COPY INTO {self.table_name} ({column_list})
+        FROM (SELECT {select_list} FROM {self.stage}/{self.prefix}/)
+        FILES = ({files})
+        FILE_FORMAT = (TYPE = PARQUET USE_LOGICAL_TYPE = TRUE)
+        PURGE = TRUE
+        """).collect()
+
+
+class LocalStage:
+    """Filesystem stand-in for SnowflakeStage.
+
+    ``upload`` copies files into ``<root>/stage`` and ``copy_into`` moves them
+    to ``<root>/loaded``, so the staged sink can be exercised and benchmarked
+    without a warehouse.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.stage_dir = os.path.join(root, 'stage')
+        self.loaded_dir = os.path.join(root, 'loaded')
+        os.makedirs(self.stage_dir, exist_ok=True)
+        os.makedirs(self.loaded_dir, exist_ok=True)
+
+    def upload(self, local_path):
+        name = os.path.basename(local_path)
+        shutil.copyfile(local_path, os.path.join(self.stage_dir, name))
+        return name
+
+    def copy_into(self, file_names, columns):
+        for name in file_names:
+            os.replace(os.path.join(self.stage_dir, name), os.path.join(self.loaded_dir, name))
+
+
+class StagedParquetSink:
+    """Write each batch as one compressed Parquet file and load it with a single COPY INTO."""
+
+    def __init__(self, stage, columns=None, compression='snappy', plan=None):
+        self.stage = stage
+        self.columns = columns
+        self.plan = plan
+        self.compression = compression
+        self._local_dir = tempfile.mkdtemp(prefix='simulator_stage_')
+        self._sequence = itertools.count()
+        self._metrics = {'files': 0, 'staged_rows': 0, 'staged_bytes': 0}
+
+    def write(self, df):
+        columns = self.columns or list(df.columns)
+        df = df.reindex(columns=columns)
+        if self.plan is not None:
+            apply_coercion_plan(df, self.plan)
+        else:
+            # Without a plan timestamps travel as text, the same way write_frame sends them
+            for col in df.select_dtypes(include=['datetime64']).columns:
+                df[col] = df[col].dt.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+        local_path = os.path.join(self._local_dir, f"batch_{next(self._sequence):08d}_{uuid.uuid4().hex[:8]}.parquet")
+        df.to_parquet(local_path, index=False, compression=self.compression)
+        try:
+            self._metrics['staged_bytes'] += os.path.getsize(local_path)
+            name = self.stage.upload(local_path)
+            self.stage.copy_into([name], columns)
+        finally:
+            os.remove(local_path)
+        self._metrics['files'] += 1
+        self._metrics['staged_rows'] += len(df)
+
+    def close(self):
+        shutil.rmtree(self._local_dir, ignore_errors=True)
+
+    def metrics(self):
+        files = self._metrics['files']
+        return dict(self._metrics, bytes_per_row=self._metrics['staged_bytes'] / self._metrics['staged_rows']
+                    if self._metrics['staged_rows'] else 0.0, rows_per_file=self._metrics['staged_rows'] / files if files else 0.0)
+
+
+class SimulatedSink:
+    """Offline stand-in for a warehouse with a fixed capacity.
+
+    Each write takes ``latency_seconds`` plus one second per
+    ``rows_per_second`` rows and fails with probability ``error_rate``, so
+    load tests can find a saturation point without a connection.
+    """
+
+    def __init__(self, rows_per_second=50000, latency_seconds=0.05, error_rate=0.0, seed=None):
+        self.rows_per_second = rows_per_second
+        self.latency_seconds = latency_seconds
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._metrics = {'simulated_writes': 0, 'simulated_rows': 0}
+
+    def write(self, df):
+        delay = self.latency_seconds + (len(df) / self.rows_per_second if self.rows_per_second else 0.0)
+        time_module.sleep(delay)
+        if self.error_rate and self._random.random() < self.error_rate:
+            raise RuntimeError("Simulated write failure")
+        self._metrics['simulated_writes'] += 1
+        self._metrics['simulated_rows'] += len(df)
+
+    def metrics(self):
+        return dict(self._metrics)
+
+
+class RotatingFileSink:
+    """Append batches to local files in ``directory``, starting a new file as each one fills up.
+
+    A file is rolled once it reaches ``max_bytes``, or when a batch arrives
+    after it has been open for ``max_seconds`` (0 disables either limit). Files are written under a
+    ``.part`` name and renamed when they are rolled or the sink is closed,
+    so anything without the suffix is complete and safe to read while the
+    simulator is still running. Subclasses implement ``_open``, ``_append``
+    and ``_close_file``.
+    """
+
+    extension = ''
+
+    def __init__(self, directory, prefix='simulator', max_bytes=128 * 1024 * 1024, max_seconds=0.0, plan=None):
+        self.directory = directory
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.plan = plan
+        os.makedirs(directory, exist_ok=True)
+        self._sequence = itertools.count()
+        self._path = None
+        self._opened = None
+        self._lock = threading.RLock()
+        self._metrics = {'files': 0, 'file_rows': 0, 'file_bytes': 0, 'current_file': None}
+
+    def write(self, df):
+        with self._lock:
+            if self._path is not None and self.max_seconds and time_module.monotonic() - self._opened >= self.max_seconds:
+                self.roll()
+            if self.plan is not None:
+                apply_coercion_plan(df, self.plan)
+            if self._path is None:
+                name = f"{self.prefix}_{time_module.strftime('%Y%m%dT%H%M%S')}_{next(self._sequence):05d}{self.extension}"
+                self._path = os.path.join(self.directory, name)
+                self._opened = time_module.monotonic()
+                self._open(self._path + '.part', df)
+                self._metrics['current_file'] = name
+            self._append(df)
+            self._metrics['file_rows'] += len(df)
+            if self.max_bytes and os.path.getsize(self._path + '.part') >= self.max_bytes:
+                self.roll()
+
+    def roll(self):
+        """Finish the current file (if any); the next write starts a new one."""
+        with self._lock:
+            if self._path is None:
+                return
+            self._close_file()
+            os.replace(self._path + '.part', self._path)
+            self._metrics['files'] += 1
+            self._metrics['file_bytes'] += os.path.getsize(self._path)
+            self._metrics['current_file'] = None
+            self._path = None
+
+    def close(self):
+        self.roll()
+
+    def metrics(self):
+        with self._lock:
+            return dict(self._metrics)
+
+
+class RotatingParquetSink(RotatingFileSink):
+    """Rotating Parquet files, one row group per batch.
+
+    The schema is taken from the first batch of each file; a batch whose
+    types differ (a compact column that had to widen) starts a new file.
+    """
+
+    extension = '.parquet'
+
+    def __init__(self, directory, prefix='simulator', max_bytes=128 * 1024 * 1024, max_seconds=0.0, plan=None,
+                 compression='snappy'):
+        # pyarrow is only needed by this sink, so the others work without it
+        import pyarrow
+        import pyarrow.parquet
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self.compression = compression
+        self._writer = None
+        super().__init__(directory, prefix, max_bytes, max_seconds, plan)
+
+    def write(self, df):
+        with self._lock:
+            if self._writer is not None:
+                if self.plan is not None:
+                    apply_coercion_plan(df, self.plan)
+                if not self._pa.Schema.from_pandas(df, preserve_index=False).equals(self._writer.schema, check_metadata=False):
+                    self.roll()
+            super().write(df)
+
+    def _open(self, path, df):
+        schema = self._pa.Schema.from_pandas(df, preserve_index=False)
+        self._writer = self._pq.ParquetWriter(path, schema, compression=self.compression)
+
+    def _append(self, df):
+        self._writer.write_table(self._pa.Table.from_pandas(df, schema=self._writer.schema, preserve_index=False))
+
+    def _close_file(self):
+        self._writer.close()
+        self._writer = None
+
+
+class NdjsonSink(RotatingFileSink):
+    """Rotating newline-delimited JSON files, one object per row with ISO timestamps."""
+
+    extension = '.ndjson'
+
+    def __init__(self, directory, prefix='simulator', max_bytes=128 * 1024 * 1024, max_seconds=0.0, plan=None):
+        self._file = None
+        super().__init__(directory, prefix, max_bytes, max_seconds, plan)
+
+    def _open(self, path, df):
+        self._file = open(path, 'w', encoding='utf-8')
+
+    def _append(self, df):
+        text = df.to_json(orient='records', lines=True, date_format='iso', date_unit='us')
+        self._file.write(text if text.endswith('\n') else text + '\n')
+        self._file.flush()
+
+    def _close_file(self):
+        self._file.close()
+        self._file = None
+
+
+# Where simulator batches go: Snowpark appends, staged Parquet + COPY INTO, local files or a stand-in
+SINK_TABLE = 'table'
+SINK_STAGE = 'stage'
+SINK_LOCAL_STAGE = 'local_stage'
+SINK_SIMULATED = 'simulated'
+SINK_PARQUET = 'parquet'
+SINK_NDJSON = 'ndjson'
+SINKS = [SINK_TABLE, SINK_STAGE, SINK_LOCAL_STAGE, SINK_SIMULATED, SINK_PARQUET, SINK_NDJSON]
+
+# Sinks that don't need a Snowflake session
+OFFLINE_SINKS = [SINK_LOCAL_STAGE, SINK_SIMULATED, SINK_PARQUET, SINK_NDJSON]
+FILE_SINKS = {SINK_PARQUET: RotatingParquetSink, SINK_NDJSON: NdjsonSink}
+
+
+def build_sink(session, config, column_types=None, timer=None):
+    """Write function for the configured sink, plus its close and metrics hooks.
+
+    ``config['sink']`` picks the write path (``table`` by default). The file
+    sinks write to ``output_dir`` and roll files at ``rotate_mb`` megabytes
+    or every ``rotate_seconds``. Failed writes are retried ``write_retries``
+    times (5 by default, 0 disables retries) starting ``retry_backoff_seconds``
+    apart, then spilled to ``dead_letter_dir``. With ``exactly_once`` the
+    table and stage sinks commit through a ``BatchLedger`` so a retry never
+    duplicates a batch; otherwise they write straight to the table and a
+    write that committed before failing can be repeated. Batches are cast
+    to the table's types once, before any retry; with a ``timer`` the cast
+    and the write are recorded as the ``coerce`` and ``write`` stages.
+    Returns ``(write_fn, close_fn, metrics_fn)``.
+    """
+    # Coercion rules are compiled once per table rather than rediscovered every batch
+    plan = compile_coercion_plan(column_types) if column_types else None
+    retries = config.get('write_retries', 5)
+    ledger = None
+    if config.get('exactly_once') and retries and session is not None \
+            and (config.get('sink') or SINK_TABLE) in (SINK_TABLE, SINK_STAGE):
+        # Each sink (so each shard) gets its own run id
+        ledger = BatchLedger(session, config['selected_db'], config['selected_schema'], config['selected_table'])
+    # The sinks get an empty plan: the frame arrives already cast but still takes the native-type path
+    write_fn, close_fn, metrics_fn = _open_sink(session, config, column_types, None if plan is None else [],
+                                                ledger.staging_table if ledger else None)
+    if retries:
+        write_fn, metrics_fn = _with_retries(config, write_fn, metrics_fn, retries, ledger)
+
+    def write(df):
+        if plan:
+            with timed(timer, 'coerce'):
+                apply_coercion_plan(df, plan)
+        with timed(timer, 'write'):
+            write_fn(df)
+
+    return write, close_fn, metrics_fn
+
+
+def _with_retries(config, write_fn, metrics_fn, retries, ledger=None):
+    if ledger is not None:
+        ledger.staged_write = write_fn
+    prefix = config.get('selected_table') or 'batch'
+    if config.get('shard') is not None:
+        prefix = f"{prefix}_shard{config['shard']}"
+    retrying = RetryingSink(
+        write_fn,
+        max_retries=retries,
+        backoff_seconds=config.get('retry_backoff_seconds', 0.5),
+        max_backoff_seconds=config.get('retry_max_backoff_seconds', 30.0),
+        dead_letter_dir=config.get('dead_letter_dir', os.path.join(tempfile.gettempdir(), 'simulator_dead_letter')),
+        ledger=ledger,
+        prefix=prefix
+    )
+
+    def metrics():
+        combined = metrics_fn() if metrics_fn else {}
+        combined.update(retrying.metrics())
+        return combined
+
+    return retrying.write, metrics
+
+
+def _open_sink(session, config, column_types=None, plan=None, table=None):
+    # ``table`` redirects the warehouse sinks, e.g. to a BatchLedger's staging table
+    sink_name = config.get('sink') or SINK_TABLE
+    table = table or config['selected_table']
+    if sink_name == SINK_TABLE:
+        write_fn = table_writer(session, config['selected_db'], config['selected_schema'], table, plan)
+        return write_fn, None, None
+
+    if sink_name == SINK_SIMULATED:
+        simulated = SimulatedSink(
+            rows_per_second=config.get('simulated_rows_per_second', 50000),
+            latency_seconds=config.get('simulated_latency_seconds', 0.05),
+            error_rate=config.get('simulated_error_rate', 0.0)
+        )
+        return simulated.write, None, simulated.metrics
+
+    if sink_name in FILE_SINKS:
+        prefix = config.get('file_prefix') or config.get('selected_table') or 'simulator'
+        if config.get('shard') is not None:
+            # Shards writing their own files share a directory, so keep their names apart
+            prefix = f"{prefix}_shard{config['shard']}"
+        files = FILE_SINKS[sink_name](
+            config.get('output_dir') or 'simulator_output',
+            prefix=prefix,
+            max_bytes=int((config.get('rotate_mb') or 0) * 1024 * 1024),
+            max_seconds=config.get('rotate_seconds') or 0,
+            plan=plan
+        )
+        return files.write, files.close, files.metrics
+
+    columns = list(column_types) if column_types else None
+    if sink_name == SINK_STAGE:
+        column_types = dict(column_types or {})
+        if table != config['selected_table']:
+            # Staging rows carry their batch key
+            column_types.update({RUN_ID_COLUMN: 'VARCHAR', SEQ_COLUMN: 'NUMBER'})
+            columns = columns and columns + [RUN_ID_COLUMN, SEQ_COLUMN]
+        stage = SnowflakeStage(session, config['selected_db'], config['selected_schema'], table,
+                               column_types, config.get('stage_name'))
+    else:
+        stage = LocalStage(config.get('local_stage_dir') or 'simulator_stage')
+    staged = StagedParquetSink(stage, columns=columns, plan=plan)
+    return staged.write, staged.close, staged.metrics
+
+
+def build_writer(session, config, column_types=None, timer=None):
+    """Background writer for the configured sink.
+
+    When any of ``flush_rows``, ``flush_mb`` or ``flush_seconds`` is set in
+    ``config`` batches are coalesced across ticks before being written, and
+    ``written_rows`` counts only rows a flush has written (``buffered_rows``
+    are still waiting).
+    """
+    write_fn, sink_close, sink_metrics = build_sink(session, config, column_types, timer)
+    close_fns = [fn for fn in [sink_close] if fn]
+    metrics_fns = [fn for fn in [sink_metrics] if fn]
+    writer_options = {
+        'max_batches': config.get('write_queue_size', 10),
+        'policy': config.get('write_policy', POLICY_BLOCK),
+    }
+    if config.get('flush_rows') or config.get('flush_mb') or config.get('flush_seconds'):
+        sink = CoalescingSink(
+            write_fn,
+            max_rows=config.get('flush_rows') or 0,
+            max_bytes=int((config.get('flush_mb') or 0) * 1024 * 1024),
+            max_seconds=config.get('flush_seconds') or 0,
+            dead_letter_dir=config.get('dead_letter_dir'),
+            prefix=f"{config.get('selected_table') or 'batch'}_coalesced"
+        )
+        write_fn = sink.write
+        writer_options['poll_fn'] = sink.poll
+        close_fns.insert(0, sink.close)
+        metrics_fns.append(sink.metrics)
+
+    def close():
+        for fn in close_fns:
+            fn()
+
+    def metrics():
+        combined = {}
+        for fn in metrics_fns:
+            combined.update(fn())
+        if 'flushed_rows' in combined:
+            # Coalesced rows are written when a flush lands them, not when the buffer takes them
+            combined['written_rows'] = combined['flushed_rows']
+        return combined
+
+    return QueuedWriter(write_fn, close_fn=close, metrics_fn=metrics, **writer_options)
@@ -5,6 +5,48 @@ import time as time_module
 import pandas as pd
 import random
 import json
+import os
+import tempfile
+from sim_engine import (
+    is_timestamp_type,
+    apply_coercion_plan,
+    compile_coercion_plan,
+    compile_fleet,
+    correlation_factor,
+    update_fleet_setting,
+    fleet_measure_values,
+    fleet_state,
+    backfill_timestamps,
+    run_backfill,
+)
+from sim_sinks import SINKS, WRITE_POLICIES, build_sink, run_sql, session_lock
+from sim_scheduler import (
+    MISSED_POLICIES,
+    RATE_MODES,
+    CadenceScheduler,
+    RateScheduler,
+    clock_scale,
+    machine_cadences,
+    tick_interval,
+)
+from sim_loadtest import ramp_steps, run_load_test, format_report, REPORT_COLUMNS
+from sim_runner import BackgroundSimulator
+from sim_scenarios import attach_scenario, load_scenario, scenario_timeline
+from sim_shards import SHARD_WRITE_AGGREGATE, ShardedSimulator
+from sim_replay import REPLAY_TIMESTAMPS, parse_speed, run_replay
+from sim_metrics import TIMING_COLUMNS, StageTimer
+from sim_fleet_table import (
+    FLEET_FORMATS,
+    MEASURE_MODES,
+    changed_rows,
+    copy_down,
+    fleet_file,
+    fleet_table,
+    read_fleet_file,
+    resize_table,
+    table_configs,
+    validate_table,
+)
 
 # Initialize session state variables
 if 'running' not in st.session_state:
@@ -13,12 +55,14 @@ if 'total_rows_generated' not in st.session_state:
     st.session_state['total_rows_generated'] = 0
 if 'current_session_rows' not in st.session_state:
     st.session_state['current_session_rows'] = 0
-if 'last_batch_time' not in st.session_state:
-    st.session_state['last_batch_time'] = time_module.time()
+if 'scheduler' not in st.session_state:
+    st.session_state['scheduler'] = None
+if 'sharded' not in st.session_state:
+    st.session_state['sharded'] = None
 if 'config' not in st.session_state:
     st.session_state['config'] = {}
-if 'current_measure_values' not in st.session_state:
-    st.session_state['current_measure_values'] = {}
+if 'fleet' not in st.session_state:
+    st.session_state['fleet'] = None
 if 'selected_table_info' not in st.session_state:
     st.session_state['selected_table_info'] = {
         'db': None,
@@ -27,6 +71,8 @@ if 'selected_table_info' not in st.session_state:
         'columns': None,
         'column_types': {}
     }
+if 'run' not in st.session_state:
+    st.session_state['run'] = None
 if 'current_timestamp' not in st.session_state:
     st.session_state['current_timestamp'] = None
 if 'machine_configs' not in st.session_state:
@@ -42,134 +88,542 @@ if 'selected_minute' not in st.session_state:
 if 'selected_date' not in st.session_state:
     st.session_state['selected_date'] = datetime.now().date()
 
+# Seconds before cached SHOW / INFORMATION_SCHEMA results are fetched again
+METADATA_TTL_SECONDS = 300
+
+# Seconds between refreshes of a running simulator's metrics; generation runs in the background either way
+RUN_REFRESH_SECONDS = 2.0
+
+def cached_metadata(key, loader):
+    # Metadata is cached per (kind, database, schema, table) key so reruns don't repeat SHOW round trips
+    cache = st.session_state.setdefault('metadata_cache', {})
+    entry = cache.get(key)
+    now = time_module.time()
+    if entry is None or now - entry[0] > METADATA_TTL_SECONDS:
+        entry = (now, loader())
+        cache[key] = entry
+    return entry[1]
+
+def invalidate_metadata(*key_prefix):
+    cache = st.session_state.get('metadata_cache', {})
+    for key in [k for k in cache if k[:len(key_prefix)] == key_prefix]:
+        del cache[key]
+
 def get_databases(session):
-    return [row['name'] for row in session.sql("SHOW DATABASES").collect()]
+    return cached_metadata(
+        ('databases',),
+        lambda: [row['name'] for row in run_sql(session, "SHOW DATABASES")]
+    )
 
 def get_schemas(session, database):
-    return [row['name'] for row in session.sql(f"SHOW SCHEMAS IN DATABASE {database}").collect()]
+    return cached_metadata(
+        ('schemas', database),
+        lambda: [row['name'] for row in run_sql(session, f"SHOW SCHEMAS IN DATABASE {database}")]
+    )
 
 def get_tables(session, database, schema):
-    return [row['name'] for row in session.sql(f"SHOW TABLES IN {database}.{schema}").collect()]
+    return cached_metadata(
+        ('tables', database, schema),
+        lambda: [row['name'] for row in run_sql(session, f"SHOW TABLES IN {database}.{schema}")]
+    )
 
 def get_columns_with_types(session, database, schema, table):
+    return cached_metadata(
+        ('columns', database, schema, table),
+        lambda: query_columns_with_types(session, database, schema, table)
+    )
+
+def query_columns_with_types(session, database, schema, table):
     query = f"""
-    SELECT COLUMN_NAME, DATA_TYPE 
+    SELECT COLUMN_NAME, DATA_TYPE, NUMERIC_PRECISION, NUMERIC_SCALE
     FROM {database}.INFORMATION_SCHEMA.COLUMNS 
     WHERE TABLE_SCHEMA = '{schema}' 
     AND TABLE_NAME = '{table}'
     ORDER BY ORDINAL_POSITION
     """
-    results = session.sql(query).collect()
-    return [(row['COLUMN_NAME'], row['DATA_TYPE']) for row in results]
-
-def is_timestamp_type(data_type):
-    timestamp_types = [
-        'TIMESTAMP_NTZ', 'TIMESTAMP_LTZ', 'TIMESTAMP_TZ',
-        'TIMESTAMP', 'DATETIME', 'DATE', 'TIME'
+    results = run_sql(session, query)
+    # Scaled NUMBER columns keep their scale (NUMBER(10,2)) so decimal inputs and compact float32 batches can use it
+    return [
+        (row['COLUMN_NAME'], f"{row['DATA_TYPE']}({row['NUMERIC_PRECISION']},{row['NUMERIC_SCALE']})"
+         if row['DATA_TYPE'] == 'NUMBER' and row['NUMERIC_SCALE'] else row['DATA_TYPE'])
+        for row in results
     ]
-    return any(ts_type in data_type.upper() for ts_type in timestamp_types)
 
-def format_timestamp_for_snowflake(timestamp_value, data_type):
-    if timestamp_value is None:
-        return None
-    
-    data_type = data_type.upper()
-    if 'TIME' in data_type and 'TIMESTAMP' not in data_type and 'DATETIME' not in data_type:
-        return timestamp_value.time()
-    elif 'DATE' in data_type and 'TIME' not in data_type:
-        return timestamp_value.date()
-    else:
-        return timestamp_value
-
-def generate_measure_value(settings, data_type, current_value=None):
-    if settings['mode'] == 'random':
-        outside_nominal = random.uniform(0, 100) < settings['percent_outside']
-        
-        if outside_nominal:
-            can_go_below = settings['total_min'] < settings['nominal_min']
-            can_go_above = settings['total_max'] > settings['nominal_max']
-            
-            if can_go_above and not can_go_below:
-                value = random.uniform(settings['nominal_max'], settings['total_max'])
-            elif can_go_below and not can_go_above:
-                value = random.uniform(settings['total_min'], settings['nominal_min'])
-            elif can_go_above and can_go_below:
-                if random.choice([True, False]):
-                    value = random.uniform(settings['total_min'], settings['nominal_min'])
-                else:
-                    value = random.uniform(settings['nominal_max'], settings['total_max'])
-            else:
-                value = random.uniform(settings['nominal_min'], settings['nominal_max'])
-        else:
-            value = random.uniform(settings['nominal_min'], settings['nominal_max'])
-        
-        if 'INT' in data_type.upper():
-            value = int(value)
-            
-        return value
-            
-    elif settings['mode'] == 'additive':
-        if current_value is None:
-            value = settings['initial_value']
-        else:
-            value = current_value + settings['increment']
-            value = min(value, settings['max_value'])
-        
-        if 'INT' in data_type.upper():
-            value = int(value)
-            
-        return value
+def get_coercion_plan():
+    # Compiled once per selected table instead of re-scanning column types on every batch
+    table_info = st.session_state['selected_table_info']
+    table_key = (table_info['db'], table_info['schema'], table_info['table'])
+    cached = st.session_state.get('coercion_plan')
+    if not cached or cached[0] != table_key:
+        cached = (table_key, compile_coercion_plan(table_info['column_types']))
+        st.session_state['coercion_plan'] = cached
+    return cached[1]
+
+def preview_batch(df, database, schema, table):
+    # Refresh the preview at most every preview_seconds; rendering it every tick cost more than generating the batch
+    interval = st.session_state['config'].get('preview_seconds', 10)
+    if not interval:
+        return
+    now = time_module.time()
+    if now - st.session_state.get('last_preview_time', 0) >= interval:
+        st.session_state['last_preview_time'] = now
+        st.session_state['batch_preview'] = apply_coercion_plan(df.head().copy(), get_coercion_plan())
 
-def write_to_snowflake(session, df, database, schema, table):
-    try:
+    if st.session_state.get('batch_preview') is not None:
         st.write(f"Writing to {database}.{schema}.{table}")
-        
-        preview_df = df.copy()
-        column_types = st.session_state['selected_table_info']['column_types']
-        
-        for col in preview_df.columns:
-            if col in column_types:
-                data_type = column_types[col].upper()
-                
-                if any(int_type in data_type for int_type in ['INT', 'INTEGER', 'BIGINT', 'SMALLINT', 'TINYINT', 'BYTEINT']):
-                    preview_df[col] = preview_df[col].astype('Int64')
-                    preview_df[col] = preview_df[col].apply(lambda x: f"{int(x)}" if pd.notnull(x) else None)
-                
-                elif 'DECIMAL' in data_type or 'NUMERIC' in data_type:
-                    if '(' in data_type:
-                        scale = int(data_type.split(',')[1].split(')')[0])
-                        preview_df[col] = preview_df[col].round(scale)
-                
-                elif 'FLOAT' in data_type or 'REAL' in data_type or 'DOUBLE' in data_type:
-                    preview_df[col] = preview_df[col].round(6)
-                
-                elif any(ts_type in data_type for ts_type in ['TIMESTAMP', 'DATETIME', 'DATE', 'TIME']):
-                    if preview_df[col].dtype == 'datetime64[ns]':
-                        preview_df[col] = preview_df[col].dt.strftime('%Y-%m-%d %H:%M:%S')
-        
         st.write("Preview of data being written (matching table data types):")
-        st.write(preview_df.head())
-        
-        timestamp_columns = df.select_dtypes(include=['datetime64[ns]']).columns
-        for col in timestamp_columns:
-            df[col] = df[col].dt.strftime('%Y-%m-%d %H:%M:%S.%f')
-        
-        snowpark_df = session.create_dataframe(df)
-        table_name = f"{database}.{schema}.{table}"
-        snowpark_df.write.mode("append").save_as_table(table_name)
-        st.write("Write successful")
-        return True
-    except Exception as e:
-        st.error(f"Error writing to Snowflake: {str(e)}")
-        st.error(f"Error details: {str(type(e))}")
-        return False
+        st.write(st.session_state['batch_preview'])
+
+def current_settings_data():
+    # Convert datetime objects to strings for JSON serialization
+    config_copy = dict(st.session_state['config'])
+    if 'current_timestamp' in config_copy and config_copy['current_timestamp']:
+        config_copy['current_timestamp'] = config_copy['current_timestamp'].isoformat()
+
+    # Add special columns configuration
+    special_columns = {
+        'machine_name_column': st.session_state['config'].get('machine_name_column'),
+        'batch_id_column': st.session_state['config'].get('batch_id_column'),
+        'timestamp_column': st.session_state['config'].get('timestamp_column'),
+        'timestamp_mode': st.session_state['config'].get('timestamp_mode')
+    }
+
+    return {
+        'table_info': st.session_state['selected_table_info'],
+        'machine_configs': st.session_state['machine_configs'],
+        'config': config_copy,
+        'special_columns': special_columns
+    }
+
+def start_run(columns):
+    # Generation and writes run on a background thread; the script only starts, stops and polls it
+    stop_run()
+    config = dict(st.session_state['config'], column_types=st.session_state['selected_table_info']['column_types'])
+    # The scenario timeline follows the scheduler's (fastest) interval
+    scheduler = start_scheduler()
+    fleet = get_fleet(scheduler.interval, scenario_start=st.session_state['run_start_timestamp'], first_tick=1)
+    st.session_state['run'] = BackgroundSimulator(
+        snowflake.snowpark.context.get_active_session(),
+        config,
+        st.session_state['machine_configs'],
+        columns,
+        timer=get_stage_timer(),
+        fleet=fleet,
+        scheduler=scheduler,
+        start_timestamp=st.session_state['run_start_timestamp']
+    ).start()
+    st.session_state['run_rows'] = 0
+
+def stop_run():
+    run = st.session_state.get('run')
+    if run is not None:
+        run.stop(timeout=60)
+        st.session_state['run'] = None
+
+def writer_metrics():
+    """Queue depth, write latency and dropped rows for the background writer"""
+    run = st.session_state.get('run')
+    metrics = run.metrics().get('writer') if run is not None else None
+    if not metrics:
+        return
+    with st.expander("📈 Writer Metrics", expanded=False):
+        cols = st.columns(4)
+        cols[0].metric("Queued Batches", metrics['queue_depth'])
+        cols[1].metric("Written Rows", metrics['written_rows'])
+        cols[2].metric("Dropped Rows", metrics['dropped_rows'])
+        cols[3].metric("Write Latency (avg)", f"{metrics['write_latency_avg']:.2f}s")
+        st.write({
+            'policy': st.session_state['config'].get('write_policy', WRITE_POLICIES[0]),
+            'queued_rows': metrics['queued_rows'],
+            'coalesced_batches': metrics['coalesced_batches'],
+            'write_latency_last': round(metrics['write_latency_last'], 3),
+            'write_latency_max': round(metrics['write_latency_max'], 3),
+            'errors': metrics['errors'],
+        })
+        if metrics.get('retries') or metrics.get('dead_letter_batches'):
+            cols = st.columns(3)
+            cols[0].metric("Retries", metrics['retries'])
+            cols[1].metric("Deduplicated Batches", metrics['deduplicated_batches'])
+            cols[2].metric("Dead-Lettered Rows", metrics['dead_letter_rows'])
+            if metrics['last_dead_letter']:
+                st.warning(f"Batches that failed every retry were saved to {os.path.dirname(metrics['last_dead_letter'])}; "
+                           f"last error: {metrics['last_retry_error']}")
+        if 'rows_per_write' in metrics:
+            cols = st.columns(3)
+            cols[0].metric("Rows per Write", f"{metrics['rows_per_write']:.0f}")
+            cols[1].metric("Buffered Rows", metrics['buffered_rows'])
+            cols[2].metric("Flushes", metrics['flushes'])
+
+def headless_status():
+    """Show how to run the current settings headless and the status reported by sim_runner.py"""
+    with st.expander("🖥️ Headless Simulators", expanded=False):
+        st.write("Save the settings above, then run them unattended without this app:")
+        st.code("python sim_runner.py --settings-name <Settings Name> --connection <connection>")
+        st.download_button(
+            "Download Current Settings (JSON)",
+            data=json.dumps(current_settings_data(), default=str, indent=2),
+            file_name="simulator_settings.json",
+            mime="application/json"
+        )
+
+        if st.checkbox("Show headless run status", value=False, key="show_headless_status"):
+            try:
+                session = snowflake.snowpark.context.get_active_session()
+                with session_lock(session):
+                    status_df = session.sql(
+                        "SELECT RUN_NAME, STATE, TOTAL_ROWS, TICKS, LAST_TIMESTAMP, LAST_ERROR, UPDATED_AT "
+                        "FROM SIMULATOR_STATUS ORDER BY UPDATED_AT DESC"
+                    ).to_pandas()
+                st.dataframe(status_df, use_container_width=True)
+            except Exception as e:
+                st.info(f"No headless runs reported yet ({str(e)})")
+
+def backfill_controls(columns):
+    """Generate a historical range for Custom timestamp mode as fast as possible"""
+    config = st.session_state['config']
+    if config.get('timestamp_mode') != 'Custom' or not config.get('timestamp_column'):
+        return
+
+    with st.expander("⏩ Historical Backfill", expanded=False):
+        start = st.session_state.get('current_timestamp')
+        st.write(f"Backfill from {start} at one row per machine every {config['write_frequency']} seconds")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            end_date = st.date_input("End Date", value=datetime.now().date(), key="backfill_end_date")
+        with col2:
+            end_hour = st.number_input("End Hour (0-23)", min_value=0, max_value=23, value=0, key="backfill_end_hour")
+        with col3:
+            chunk_rows = st.number_input("Rows per Write", min_value=1000, value=100000, step=10000, key="backfill_chunk_rows")
+
+        end = datetime.combine(end_date, time(hour=end_hour))
+        if start and end > start:
+            n_ticks = len(backfill_timestamps(start, end, config['write_frequency']))
+            st.caption(f"{n_ticks:,} ticks, {n_ticks * len(config['machine_names']):,} rows")
+
+        if st.button("Run Backfill", key="run_backfill"):
+            if not start or end <= start:
+                st.error("End must be after the current Custom timestamp")
+                return
+            progress = st.progress(0.0)
+
+            def on_chunk(stats):
+                progress.progress(stats['ticks'] / stats['total_ticks'])
+
+            # Compile the machine settings as they are now, but carry on the additive values of the last run
+            previous = st.session_state.get('fleet')
+            st.session_state['fleet'] = None
+            close_fn = None
+            try:
+                session = snowflake.snowpark.context.get_active_session()
+                fleet = get_fleet(config['write_frequency'], fleet_state(previous) if previous else None,
+                                  scenario_start=start)
+                # The configured sink and its coercion plan, as the live writer and sim_runner's backfill use
+                write_fn, close_fn, _ = build_sink(session, config, st.session_state['selected_table_info']['column_types'])
+                stats = run_backfill(
+                    session,
+                    config,
+                    fleet,
+                    columns,
+                    start,
+                    end,
+                    chunk_rows,
+                    write=lambda session, df, database, schema, table: write_fn(df),
+                    on_chunk=on_chunk
+                )
+            except Exception as e:
+                st.error(f"Error during backfill: {str(e)}")
+                return
+            finally:
+                if close_fn:
+                    close_fn()
+
+            # Continue a later live run from where the backfill stopped
+            if stats['last_timestamp']:
+                last_ts = stats['last_timestamp']
+                st.session_state['current_timestamp'] = last_ts
+                st.session_state['selected_date'] = last_ts.date()
+                st.session_state['selected_hour'] = last_ts.hour
+                st.session_state['selected_minute'] = last_ts.minute
+            st.session_state['total_rows_generated'] += stats['total_rows']
+            st.success(f"Backfilled {stats['total_rows']:,} rows in {stats['chunks']} writes")
+
+def load_test_controls(columns):
+    """Ramp machines and tick rate against the configured write path to find where it saturates"""
+    config = st.session_state['config']
+    with st.expander("🧪 Load Test", expanded=False):
+        st.write(f"Each step runs the current settings against the '{config.get('sink') or SINKS[0]}' write path; "
+                 "choose the simulated write path to test offline without writing to the table")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            start_machines = st.number_input("Starting Machines", min_value=1,
+                                             value=max(1, len(config.get('machine_names') or [])), key="load_start_machines")
+            machine_factor = st.number_input("Machine Multiplier per Step", min_value=1.0, value=2.0, key="load_machine_factor")
+        with col2:
+            start_rate = st.number_input("Starting Ticks per Second", min_value=0.01,
+                                         value=float(round(1.0 / tick_interval(config), 3)), key="load_start_rate")
+            rate_factor = st.number_input("Rate Multiplier per Step", min_value=1.0, value=1.0, key="load_rate_factor")
+        with col3:
+            n_steps = st.number_input("Steps", min_value=1, max_value=20, value=6, key="load_steps")
+            step_seconds = st.number_input("Seconds per Step", min_value=1, value=30, key="load_step_seconds")
+
+        if st.button("Run Load Test", key="run_load_test"):
+            steps = ramp_steps(start_machines, start_rate, machine_factor, rate_factor, n_steps)
+            progress = st.progress(0.0)
+
+            def on_step(result):
+                progress.progress((result['step'] + 1) / len(steps))
+
+            try:
+                session = snowflake.snowpark.context.get_active_session()
+                run_config = dict(config, column_types=st.session_state['selected_table_info']['column_types'])
+                report = run_load_test(session, run_config, st.session_state['machine_configs'], columns, steps,
+                                       step_seconds, on_step=on_step)
+            except Exception as e:
+                st.error(f"Error during load test: {str(e)}")
+                return
+            st.session_state['load_test_report'] = report
+
+        report = st.session_state.get('load_test_report')
+        if report:
+            capacity = report['capacity']
+            if capacity:
+                st.metric("Sustainable Capacity", f"{capacity['machines']} machines",
+                          f"{capacity['sustained_rows_per_second']:.1f} rows/s", delta_color="off")
+            else:
+                st.warning("The write path saturated at the first step; lower the starting load")
+            st.dataframe(pd.DataFrame(report['steps'], columns=REPORT_COLUMNS), use_container_width=True)
+            st.download_button("Download Report", json.dumps(report, indent=2, default=str),
+                               file_name="load_test_report.json", mime="application/json")
+            with st.expander("Text Report", expanded=False):
+                st.code(format_report(report))
+
+def replay_controls(columns):
+    """Re-emit a recorded stream into the target table at real time, N× or max speed"""
+    config = st.session_state['config']
+    with st.expander("⏯️ Replay Recording", expanded=False):
+        st.write("Replays a recorded Parquet, CSV or NDJSON stream of table rows through the current write path, "
+                 "paced by the timestamp column")
+        recording = st.file_uploader("Recording", type=['parquet', 'csv', 'ndjson', 'jsonl'], key="replay_file")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            speed_text = st.text_input("Speed", value="1", key="replay_speed",
+                                       help="1 for real time, 10 for ten times faster, max for as fast as possible")
+        with col2:
+            replay_timestamps = st.selectbox("Timestamps", REPLAY_TIMESTAMPS, key="replay_timestamps",
+                                             help="preserve: write the recorded timestamps; rebase: start them at now so dashboard windows show the data")
+        with col3:
+            max_rows = st.number_input("Max Rows (0 for all)", min_value=0, value=0, step=1000, key="replay_max_rows")
+
+        if recording is not None and st.button("Start Replay", key="run_replay"):
+            try:
+                speed = parse_speed(speed_text)
+            except ValueError as e:
+                st.error(str(e))
+                return
+            progress = st.empty()
+
+            def on_write(stats):
+                progress.text(f"Replayed {stats['total_rows']} rows, recorded time {stats['recorded_timestamp']}")
+
+            fmt = recording.name.rsplit('.', 1)[-1].lower().replace('jsonl', 'ndjson')
+            session = snowflake.snowpark.context.get_active_session()
+            run_config = dict(config, column_types=st.session_state['selected_table_info']['column_types'])
+            stats = run_replay(session, run_config, recording, columns, speed, replay_timestamps, fmt=fmt,
+                               max_rows=max_rows or None, on_write=on_write, log=lambda message: None)
+            st.session_state['total_rows_generated'] += stats['total_rows']
+            if stats['state'] == 'Failed':
+                st.error(f"Replay failed after {stats['total_rows']} rows: {stats['last_error']}")
+            else:
+                st.success(f"Replayed {stats['total_rows']} rows in {stats['elapsed_seconds']:.1f}s "
+                           f"({stats['rows_per_second']:.1f} rows/s)")
+
+def start_sharded(columns):
+    # Worker processes generate their shard of machines and send the rows back to one writer here,
+    # since only this process holds the Snowflake session
+    stop_sharded()
+    config = dict(st.session_state['config'], column_types=st.session_state['selected_table_info']['column_types'])
+    st.session_state['sharded'] = ShardedSimulator(
+        config,
+        st.session_state['machine_configs'],
+        columns,
+        config.get('shards', 1),
+        SHARD_WRITE_AGGREGATE,
+        session=snowflake.snowpark.context.get_active_session()
+    ).start()
+    st.session_state['sharded_rows'] = 0
+
+def stop_sharded():
+    sharded = st.session_state.get('sharded')
+    if sharded is not None:
+        sharded.stop(timeout=60)
+        st.session_state['sharded'] = None
+
+def sharded_metrics():
+    """Per-shard health for a multi-process run"""
+    sharded = st.session_state.get('sharded')
+    if sharded is None:
+        return
+    metrics = sharded.metrics()
+    with st.expander("🧩 Shards", expanded=False):
+        cols = st.columns(4)
+        cols[0].metric("Shards Running", f"{metrics['alive']}/{metrics['shards']}")
+        cols[1].metric("Rows/s", f"{metrics['achieved_rows_per_second']:.1f}",
+                       f"target {metrics['target_rows_per_second']:.1f}", delta_color="off")
+        cols[2].metric("Written Rows", metrics['written_rows'])
+        cols[3].metric("Errors", metrics['errors'])
+        st.dataframe(pd.DataFrame(metrics['per_shard']).drop(columns=['updated_at'], errors='ignore'),
+                     use_container_width=True)
+
+def start_scheduler():
+    # Ticks are due at fixed deadlines from Start, so time spent writing and rerunning doesn't drift the rate
+    config = st.session_state['config']
+    n_machines = len(config.get('machine_names') or [])
+    missed = config.get('missed_deadline_policy') or MISSED_POLICIES[0]
+    time_scale = clock_scale(config)
+    cadences = machine_cadences(config, st.session_state['machine_configs'], config.get('machine_names') or [])
+    if cadences:
+        # Machines with their own cadence share one heap; their rows are timestamped from Start
+        st.session_state['scheduler'] = CadenceScheduler(cadences, missed, seed=config.get('seed'), time_scale=time_scale)
+    else:
+        st.session_state['scheduler'] = RateScheduler(
+            tick_interval(config, n_machines),
+            missed,
+            rows_per_tick=n_machines,
+            time_scale=time_scale
+        )
+    # Cadence rows are timestamped from Start, and the scenario timeline starts there too
+    st.session_state['run_start_timestamp'] = (
+        datetime.now() if config.get('timestamp_mode') == 'Current' else st.session_state.get('current_timestamp')
+    )
+    get_stage_timer().reset()
+    return st.session_state['scheduler']
+
+def get_stage_timer():
+    # One timer per app session, shared with the writer thread; cleared when a run starts
+    if st.session_state.get('stage_timer') is None:
+        st.session_state['stage_timer'] = StageTimer()
+    return st.session_state['stage_timer']
+
+def stage_timings():
+    """Per-stage p50/p95/p99 for the ticks of the current (or last) run, with CSV/JSON export"""
+    scheduler = st.session_state.get('scheduler')
+    timer = st.session_state.get('stage_timer')
+    if scheduler is None or timer is None:
+        return
+    summary = timer.summary(scheduler.stats(), st.session_state['config'].get('write_frequency'))
+    if not summary['stages']:
+        return
+    with st.expander("🧮 Stage Timings", expanded=False):
+        throughput = summary['throughput']
+        cols = st.columns(2)
+        cols[0].metric("Ticks/s", f"{throughput['achieved_ticks_per_second']:.2f}",
+                       f"target {throughput['target_ticks_per_second']:.2f}", delta_color="off")
+        cols[1].metric("Rows/s", f"{throughput['achieved_rows_per_second']:.1f}",
+                       f"target {throughput['target_rows_per_second']:.1f}", delta_color="off")
+        timings = pd.DataFrame(summary['stages'], columns=TIMING_COLUMNS)
+        st.dataframe(timings.round(3), use_container_width=True, hide_index=True)
+        # The stage with the largest share is where a throughput drop comes from
+        slowest = timings.sort_values('share', ascending=False).iloc[0]
+        st.caption(f"Most time spent in {slowest['stage']} ({slowest['share']:.0%}, p95 {slowest['p95_ms']:.1f} ms)")
+
+        stage = st.selectbox("Histogram", list(timings['stage']), key="stage_histogram")
+        counts, edges = timer.histogram(stage)
+        if len(counts):
+            st.bar_chart(pd.DataFrame({'ticks': counts}, index=[f"{edge:.1f} ms" for edge in edges[:-1]]))
+
+        col1, col2 = st.columns(2)
+        col1.download_button(
+            "Download CSV",
+            timings.assign(**throughput).to_csv(index=False),
+            file_name="stage_timings.csv",
+            mime="text/csv",
+            key="stage_timings_csv"
+        )
+        col2.download_button(
+            "Download JSON",
+            json.dumps(summary, indent=2, default=str),
+            file_name="stage_timings.json",
+            mime="application/json",
+            key="stage_timings_json"
+        )
+
+def scheduler_metrics():
+    """Achieved vs target rate and tick lateness for the running scheduler"""
+    scheduler = st.session_state.get('scheduler')
+    if scheduler is None or not st.session_state['running']:
+        return
+    stats = scheduler.stats()
+    with st.expander("⏱️ Rate", expanded=False):
+        cols = st.columns(4)
+        cols[0].metric("Rows/s", f"{stats['achieved_rows_per_second']:.1f}",
+                       f"target {stats['target_rows_per_second']:.1f}", delta_color="off")
+        cols[1].metric("Jitter p50", f"{stats['jitter_p50_ms']:.0f} ms")
+        cols[2].metric("Jitter p95", f"{stats['jitter_p95_ms']:.0f} ms")
+        cols[3].metric("Jitter p99", f"{stats['jitter_p99_ms']:.0f} ms")
+        st.write({
+            'policy': scheduler.missed,
+            'ticks': stats['ticks'],
+            'skipped_ticks': stats['skipped_ticks'],
+            'ticks_per_second': round(stats['achieved_ticks_per_second'], 3),
+            'target_ticks_per_second': round(stats['target_ticks_per_second'], 3),
+        })
+        if stats['time_scale'] != 1:
+            st.caption(f"Simulated time is running at {stats['achieved_time_scale']:.0f}x real time "
+                       f"(target {stats['time_scale']:g}x); it falls behind when the sink can't keep up")
+
+def get_fleet(interval=None, current_measure_values=None, scenario_start=None, first_tick=0):
+    # Machine settings are compiled into arrays once per run instead of walked as dicts every tick
+    if st.session_state.get('fleet') is None:
+        config = st.session_state['config']
+        fleet = compile_fleet(
+            st.session_state['machine_configs'],
+            config['machine_names'],
+            current_measure_values,
+            seed=config.get('seed')
+        )
+        # The scenario timeline is compiled for the run's tick spacing before the first tick
+        if config.get('scenario'):
+            attach_scenario(fleet, config['scenario'], interval or tick_interval(config, len(fleet['machine_names'])),
+                            start=scenario_start, first_tick=first_tick)
+        st.session_state['fleet'] = fleet
+    return st.session_state['fleet']
+
+def scenario_controls():
+    """Script incidents (e.g. a vibration spike on one machine) that play out from Start or a backfill"""
+    config = st.session_state['config']
+    with st.expander("🎬 Scenario", expanded=False):
+        st.caption('Events like {"at": "10m", "duration": "5m", "machine": "Ragnar", "measure": "VIBRATION", '
+                   '"param": "percent_outside", "op": "set", "value": 60}; ops are set, scale, add and ramp')
+        current = json.dumps(config['scenario'], indent=2) if config.get('scenario') else ""
+        text = st.text_area("Scenario JSON", value=current, height=200, key="scenario_json")
+        col1, col2 = st.columns(2)
+        if col1.button("Apply Scenario", key="apply_scenario"):
+            try:
+                scenario = load_scenario(text) if text.strip() else None
+                if scenario:
+                    # Compile once against the current machines to catch unknown names and bad durations now
+                    preview = attach_scenario(
+                        compile_fleet(st.session_state['machine_configs'], config['machine_names']),
+                        scenario,
+                        tick_interval(config)
+                    )
+                    st.session_state['scenario_preview'] = scenario_timeline(preview)
+                config['scenario'] = scenario
+                st.success("Scenario applied; it starts with the next run or backfill" if scenario else "Scenario cleared")
+            except (ValueError, KeyError, OSError) as e:
+                st.error(f"Invalid scenario: {str(e)}")
+        if col2.button("Clear Scenario", key="clear_scenario"):
+            config['scenario'] = None
+            st.session_state['scenario_preview'] = None
+        if config.get('scenario') and st.session_state.get('scenario_preview'):
+            st.line_chart(pd.DataFrame(st.session_state['scenario_preview']))
 
 def save_settings():
     try:
         session = snowflake.snowpark.context.get_active_session()
         
         # Get current database and schema from the connection
-        current_db_schema = session.sql("SELECT CURRENT_DATABASE(), CURRENT_SCHEMA()").collect()[0]
+        current_db_schema = run_sql(session, "SELECT CURRENT_DATABASE(), CURRENT_SCHEMA()")[0]
         settings_db = current_db_schema[0]
         settings_schema = current_db_schema[1]
         
@@ -180,43 +634,25 @@ def save_settings():
             CREATED_AT TIMESTAMP_NTZ(9) DEFAULT CURRENT_TIMESTAMP()
         )
         """
-        session.sql(create_sql).collect()
+        run_sql(session, create_sql)
 
         settings_name = st.text_input("Settings Name", "Default")
         if st.button("Save Current Settings"):
             try:
-                # Convert datetime objects to strings for JSON serialization
-                config_copy = dict(st.session_state['config'])
-                if 'current_timestamp' in config_copy and config_copy['current_timestamp']:
-                    config_copy['current_timestamp'] = config_copy['current_timestamp'].isoformat()
-
-                # Add special columns configuration
-                special_columns = {
-                    'machine_name_column': st.session_state['config'].get('machine_name_column'),
-                    'batch_id_column': st.session_state['config'].get('batch_id_column'),
-                    'timestamp_column': st.session_state['config'].get('timestamp_column'),
-                    'timestamp_mode': st.session_state['config'].get('timestamp_mode')
-                }
-
-                settings_data = {
-                    'table_info': st.session_state['selected_table_info'],
-                    'machine_configs': st.session_state['machine_configs'],
-                    'config': config_copy,
-                    'special_columns': special_columns
-                }
+                settings_data = current_settings_data()
                 
                 insert_sql = f"""
                 INSERT INTO {settings_db}.{settings_schema}.SETTINGS_TABLE (NAME, DATA)
                 SELECT '{settings_name}', TO_VARIANT(parse_json('{json.dumps(settings_data).replace("'", "''")}'))
                 """
                 
-                session.sql(insert_sql).collect()
+                run_sql(session, insert_sql)
                 
                 verify_sql = f"""
                 SELECT COUNT(*) as cnt FROM {settings_db}.{settings_schema}.SETTINGS_TABLE 
                 WHERE NAME = '{settings_name}'
                 """
-                result = session.sql(verify_sql).collect()
+                result = run_sql(session, verify_sql)
                 
                 if result and result[0]['CNT'] > 0:
                     st.success(f"Settings successfully saved as: {settings_name}")
@@ -238,7 +674,7 @@ def load_saved_settings():
         session = snowflake.snowpark.context.get_active_session()
         
         # Get current database and schema from the connection
-        current_db_schema = session.sql("SELECT CURRENT_DATABASE(), CURRENT_SCHEMA()").collect()[0]
+        current_db_schema = run_sql(session, "SELECT CURRENT_DATABASE(), CURRENT_SCHEMA()")[0]
         settings_db = current_db_schema[0]
         settings_schema = current_db_schema[1]
         
@@ -251,7 +687,7 @@ def load_saved_settings():
         )
         """
         try:
-            session.sql(create_sql).collect()
+            run_sql(session, create_sql)
         except Exception as e:
             st.error(f"Error creating settings table: {str(e)}")
             return
@@ -261,7 +697,7 @@ def load_saved_settings():
         FROM {settings_db}.{settings_schema}.SETTINGS_TABLE 
         ORDER BY CREATED_AT DESC
         """
-        settings_df = session.sql(query_sql).collect()
+        settings_df = run_sql(session, query_sql)
         
         if settings_df:
             col1, col2 = st.columns([3, 1])
@@ -320,13 +756,22 @@ def load_saved_settings():
                                     if 'machine_configs' in saved_data:
                                         machine_configs = saved_data['machine_configs']
                                         st.session_state['machine_configs'] = {}
+                                        # The fleet table is rebuilt from the loaded configs
+                                        st.session_state.pop('fleet_table', None)
                                         
                                         for machine_name, machine_config in machine_configs.items():
                                             if 'measure_columns' in machine_config and 'settings' in machine_config:
                                                 st.session_state['machine_configs'][machine_name] = {
                                                     'measure_columns': machine_config['measure_columns'],
-                                                    'settings': machine_config['settings']
+                                                    'settings': machine_config['settings'],
+                                                    'correlations': machine_config.get('correlations'),
+                                                    'cadence': machine_config.get('cadence')
                                                 }
+                                                # The correlation editor starts over from the loaded pairs
+                                                st.session_state.pop(f"correlation_pairs_{machine_name}", None)
+                                                st.session_state.pop(f"correlations_{machine_name}", None)
+                                                for cadence_key in ('on', 'interval', 'jitter', 'burst_size', 'burst_gap'):
+                                                    st.session_state.pop(f"cadence_{cadence_key}_{machine_name}", None)
                                                 
                                                 # Initialize measure selections in session state
                                                 st.session_state[f"selected_measures_{machine_name}"] = machine_config['measure_columns']
@@ -346,9 +791,11 @@ def load_saved_settings():
                                             'timestamp_mode': special_cols.get('timestamp_mode')
                                         })
             
-                                    # Reset runtime state
+                                    # Reset runtime state; the previous run's writer is flushed and its workers stopped first
                                     st.session_state['running'] = False
-                                    st.session_state['current_measure_values'] = {}
+                                    stop_run()
+                                    stop_sharded()
+                                    st.session_state['fleet'] = None
                                     st.session_state['total_rows_generated'] = 0
                                     st.session_state['current_session_rows'] = 0
                                     st.session_state['show_confirm_button'] = False
@@ -419,13 +866,22 @@ def load_saved_settings():
                             if 'machine_configs' in saved_data:
                                 machine_configs = saved_data['machine_configs']
                                 st.session_state['machine_configs'] = {}
+                                # The fleet table is rebuilt from the loaded configs
+                                st.session_state.pop('fleet_table', None)
                                 
                                 for machine_name, machine_config in machine_configs.items():
                                     if 'measure_columns' in machine_config and 'settings' in machine_config:
                                         st.session_state['machine_configs'][machine_name] = {
                                             'measure_columns': machine_config['measure_columns'],
-                                            'settings': machine_config['settings']
+                                            'settings': machine_config['settings'],
+                                            'correlations': machine_config.get('correlations'),
+                                            'cadence': machine_config.get('cadence')
                                         }
+                                        # The correlation editor starts over from the loaded pairs
+                                        st.session_state.pop(f"correlation_pairs_{machine_name}", None)
+                                        st.session_state.pop(f"correlations_{machine_name}", None)
+                                        for cadence_key in ('on', 'interval', 'jitter', 'burst_size', 'burst_gap'):
+                                            st.session_state.pop(f"cadence_{cadence_key}_{machine_name}", None)
                                         
                                         # Initialize measure selections in session state
                                         st.session_state[f"selected_measures_{machine_name}"] = machine_config['measure_columns']
@@ -445,9 +901,11 @@ def load_saved_settings():
                                     'timestamp_mode': special_cols.get('timestamp_mode')
                                 })
 
-                            # Reset runtime state
+                            # Reset runtime state; the previous run's writer is flushed and its workers stopped first
                             st.session_state['running'] = False
-                            st.session_state['current_measure_values'] = {}
+                            stop_run()
+                            stop_sharded()
+                            st.session_state['fleet'] = None
                             st.session_state['total_rows_generated'] = 0
                             st.session_state['current_session_rows'] = 0
                             st.session_state['show_confirm_button'] = False
@@ -769,6 +1227,196 @@ def create_measure_inputs(columns, machine_name_column, batch_id_column, timesta
     
     return selected_measures, machine_settings
 
+def create_correlation_inputs(machine_name, machine_settings):
+    """Pairwise correlations between a machine's random-mode measures, e.g. VIBRATION rising with TOOL_WEAR"""
+    measures = [m for m, s in machine_settings.items() if s.get('include') and s.get('mode') == 'random']
+    if len(measures) < 2:
+        return None
+
+    # The editor's starting rows are fixed for the session so Streamlit's edit deltas stay aligned with them
+    pairs_key = f"correlation_pairs_{machine_name}"
+    if pairs_key not in st.session_state:
+        saved = st.session_state.get('machine_configs', {}).get(machine_name, {}).get('correlations') or {}
+        st.session_state[pairs_key] = pd.DataFrame(
+            [{'measure': m, 'other': o, 'correlation': float(rho)} for m, others in saved.items() for o, rho in others.items()],
+            columns=['measure', 'other', 'correlation']
+        )
+
+    st.markdown("**Correlated Measures**")
+    st.caption("Random-mode measures in a pair move together (positive) or against each other (negative), "
+               "keeping their ranges and % outside nominal; additive measures follow their own ramp")
+    edited = st.data_editor(
+        st.session_state[pairs_key],
+        num_rows="dynamic",
+        hide_index=True,
+        use_container_width=True,
+        key=f"correlations_{machine_name}",
+        column_config={
+            'measure': st.column_config.SelectboxColumn("Measure", options=measures, required=True),
+            'other': st.column_config.SelectboxColumn("Correlated With", options=measures, required=True),
+            'correlation': st.column_config.NumberColumn("Correlation", min_value=-1.0, max_value=1.0, step=0.05,
+                                                         required=True),
+        }
+    )
+
+    correlations = {}
+    for row in edited.dropna().itertuples(index=False):
+        if row.measure != row.other:
+            correlations.setdefault(row.measure, {})[row.other] = float(row.correlation)
+    try:
+        correlation_factor(correlations, measures)
+    except ValueError as e:
+        st.error(f"{machine_name}: {e}")
+        return None
+    return correlations or None
+
+def create_cadence_inputs(machine_name):
+    """Optional reporting cadence for one machine; without one it reports every write frequency"""
+    saved = st.session_state.get('machine_configs', {}).get(machine_name, {}).get('cadence') or {}
+    own_cadence = st.checkbox(
+        "Own Reporting Cadence",
+        value=bool(saved),
+        key=f"cadence_on_{machine_name}",
+        help="Report every Interval seconds (± Jitter), Rows per Burst rows Burst Gap seconds apart. "
+             "Rows from machines that come due together are still written as one batch"
+    )
+    if not own_cadence:
+        return None
+
+    cols = st.columns(4)
+    interval = cols[0].number_input("Interval (s)", min_value=0.01, value=float(saved.get('interval', 1.0)),
+                                    step=0.5, key=f"cadence_interval_{machine_name}")
+    jitter = cols[1].number_input("Jitter (± s)", min_value=0.0, value=float(saved.get('jitter', 0.0)),
+                                  step=0.1, key=f"cadence_jitter_{machine_name}")
+    burst_size = cols[2].number_input("Rows per Burst", min_value=1, value=int(saved.get('burst_size', 1)),
+                                      step=1, key=f"cadence_burst_size_{machine_name}")
+    burst_gap = cols[3].number_input("Burst Gap (s)", min_value=0.0, value=float(saved.get('burst_gap', 0.0)),
+                                     step=0.1, key=f"cadence_burst_gap_{machine_name}")
+    if (burst_size - 1) * burst_gap >= interval:
+        st.error(f"{machine_name}: a burst of {burst_size} rows {burst_gap}s apart doesn't fit in a {interval}s interval")
+        return None
+    return {'interval': interval, 'jitter': jitter, 'burst_size': int(burst_size), 'burst_gap': burst_gap}
+
+def set_fleet_table(table):
+    """Make ``table`` the bulk editor's starting rows; its edit deltas start over"""
+    st.session_state['fleet_table'] = table
+    st.session_state['fleet_table_edited'] = table
+    st.session_state['fleet_table_checked'] = None
+    st.session_state.pop('fleet_table_editor', None)
+
+def fleet_table_editor(measures):
+    """Every machine's measure settings as one editable table, for fleets too large for per-machine inputs.
+
+    Returns ``(machine_names, machine_configs)``; while the table has invalid
+    rows the last valid ones are kept.
+    """
+    column_types = st.session_state['selected_table_info']['column_types']
+    previous = st.session_state.get('machine_configs', {})
+    if not measures:
+        st.info("The selected table has no measure columns to configure.")
+        return st.session_state['config'].get('machine_names', []), previous
+    base = st.session_state.get('fleet_table')
+    if base is None or list(dict.fromkeys(base['measure'])) != measures:
+        names = st.session_state['config'].get('machine_names') or list(previous) or ['Machine_1']
+        set_fleet_table(fleet_table(previous, names, measures))
+        st.session_state.pop('fleet_machine_names', None)
+
+    # Import replaces the whole fleet, names included
+    import_cols = st.columns([3, 1])
+    with import_cols[0]:
+        uploaded = st.file_uploader("Import Fleet File", type=['csv', 'yaml', 'yml'], key="fleet_file_upload",
+                                    help="CSV: one row per machine and measure, as exported below. "
+                                         "YAML: machines → measures, plus each machine's cadence and correlations")
+    with import_cols[1]:
+        if uploaded is not None and st.button("Import", key="fleet_file_import"):
+            fmt = FLEET_FORMATS.get(os.path.splitext(uploaded.name)[1].lower())
+            try:
+                names, configs, table = read_fleet_file(uploaded.getvalue(), fmt, measures, column_types)
+            except ValueError as e:
+                st.error(str(e))
+            else:
+                st.session_state['machine_configs'] = configs
+                st.session_state['config']['machine_names'] = names
+                set_fleet_table(table)
+                st.session_state.pop('fleet_machine_names', None)
+                st.rerun()
+
+    current = st.session_state['fleet_table_edited']
+    names_text = st.text_area("Machine Names (one per line)", value="\n".join(dict.fromkeys(current['machine'])),
+                              key="fleet_machine_names", height=150,
+                              help="New machines start with the first machine's settings")
+    machine_names = list(dict.fromkeys(name.strip() for name in names_text.splitlines() if name.strip()))
+    if not machine_names:
+        st.error("Enter at least one machine name")
+        return st.session_state['config'].get('machine_names', []), previous
+    if machine_names != list(dict.fromkeys(current['machine'])):
+        set_fleet_table(resize_table(current, machine_names))
+
+    edited = st.data_editor(
+        st.session_state['fleet_table'],
+        num_rows="fixed",
+        hide_index=True,
+        use_container_width=True,
+        height=400,
+        key="fleet_table_editor",
+        disabled=['machine', 'measure'],
+        column_config={
+            'machine': st.column_config.TextColumn("Machine"),
+            'measure': st.column_config.TextColumn("Measure"),
+            'include': st.column_config.CheckboxColumn("Include"),
+            'mode': st.column_config.SelectboxColumn("Mode", options=MEASURE_MODES, required=True),
+            'percent_outside': st.column_config.NumberColumn("% Outside", min_value=0, max_value=100),
+        }
+    )
+    st.session_state['fleet_table_edited'] = edited
+
+    copy_cols = st.columns([1, 2, 1])
+    with copy_cols[0]:
+        copy_from = st.selectbox("Copy Down From", machine_names, key="fleet_copy_from")
+    with copy_cols[1]:
+        copy_measures = st.multiselect("Measures (all if empty)", measures, key="fleet_copy_measures")
+    with copy_cols[2]:
+        st.write("")
+        if st.button("Copy to Machines Below", key="fleet_copy_down", use_container_width=True):
+            set_fleet_table(copy_down(edited, copy_from, copy_measures or None))
+            st.rerun()
+
+    # Only rows edited since the last check are revalidated
+    checked = st.session_state.get('fleet_table_checked')
+    errors = st.session_state.get('fleet_table_errors', {})
+    changed = changed_rows(checked, edited)
+    if changed.any():
+        changed_keys = set(zip(edited.loc[changed, 'machine'], edited.loc[changed, 'measure']))
+        errors = {} if changed.all() else {key: msg for key, msg in errors.items() if key not in changed_keys}
+        errors.update(validate_table(edited, changed))
+        st.session_state['fleet_table_errors'] = errors
+        st.session_state['fleet_table_checked'] = edited
+        if not errors:
+            names, configs = table_configs(edited, column_types, previous)
+            st.session_state['machine_configs'] = configs
+            st.session_state['config']['machine_names'] = names
+
+    st.caption(f"{len(machine_names)} machines × {len(measures)} measures. Cadence and correlations are kept "
+               "from each machine's settings; set them per machine or in a YAML fleet file")
+    if errors:
+        st.error(f"{len(errors)} invalid rows; the last valid settings are used until they're fixed")
+        st.dataframe(pd.DataFrame([{'machine': machine, 'measure': measure, 'problem': message}
+                                   for (machine, measure), message in errors.items()]),
+                     hide_index=True, use_container_width=True)
+
+    export_cols = st.columns(2)
+    export_cols[0].download_button("Download CSV", fleet_file(edited, st.session_state['machine_configs'], 'csv'),
+                                   file_name="fleet.csv", mime="text/csv", use_container_width=True)
+    try:
+        fleet_yaml = fleet_file(edited, st.session_state['machine_configs'], 'yaml')
+    except ImportError:
+        export_cols[1].caption("Add the pyyaml package for YAML export")
+    else:
+        export_cols[1].download_button("Download YAML", fleet_yaml, file_name="fleet.yaml",
+                                       mime="application/x-yaml", use_container_width=True)
+
+    return st.session_state['config'].get('machine_names', machine_names), st.session_state['machine_configs']
+
 def debug_state():
     """Helper function to debug session state"""
     if st.sidebar.checkbox("Show Debug Information", value=False):
@@ -779,7 +1427,8 @@ def debug_state():
             with st.sidebar.expander("Runtime Debug Info", expanded=False):
                 st.write("Current Timestamp:", st.session_state.get('current_timestamp'))
                 st.write("Machine Configs:", st.session_state.get('machine_configs', {}))
-                st.write("Current Measure Values:", st.session_state.get('current_measure_values', {}))
+                fleet = st.session_state.get('fleet')
+                st.write("Current Measure Values:", fleet_measure_values(fleet) if fleet else {})
     
 
 def main():
@@ -798,6 +1447,9 @@ def main():
 
     with tab_connection:
         st.header("Database Connection")
+        refresh_metadata = st.button("🔄 Refresh Metadata", help="Re-read databases, schemas, tables and columns from Snowflake")
+        if refresh_metadata:
+            invalidate_metadata()
         col1, col2, col3 = st.columns(3)
         
         with col1:
@@ -834,6 +1486,8 @@ def main():
                         selected_schema != st.session_state['selected_table_info']['schema'] or 
                         selected_table != st.session_state['selected_table_info']['table']):
                         
+                        # A newly selected table always gets a fresh column list
+                        invalidate_metadata('columns', selected_db, selected_schema, selected_table)
                         columns_with_types = get_columns_with_types(session, selected_db, selected_schema, selected_table)
                         st.session_state['selected_table_info'] = {
                             'db': selected_db,
@@ -842,10 +1496,19 @@ def main():
                             'columns': columns_with_types,
                             'column_types': {col: dtype for col, dtype in columns_with_types}
                         }
+                        # The writer and shard workers would otherwise keep writing to the previous table
                         st.session_state['running'] = False
-                        st.session_state['current_measure_values'] = {}
+                        stop_run()
+                        stop_sharded()
+                        st.session_state['fleet'] = None
                         st.session_state['current_timestamp'] = None
 
+                    elif refresh_metadata:
+                        columns_with_types = get_columns_with_types(session, selected_db, selected_schema, selected_table)
+                        st.session_state['selected_table_info']['columns'] = columns_with_types
+                        st.session_state['selected_table_info']['column_types'] = {col: dtype for col, dtype in columns_with_types}
+                        st.session_state['coercion_plan'] = None
+
                     columns_with_types = st.session_state['selected_table_info']['columns']
                     columns = [col[0] for col in columns_with_types]
 
@@ -921,6 +1584,7 @@ def main():
                             key=mode_key,
                             help="Choose whether to use current system time or set a custom start time"
                         )
+                        time_scale = 1.0
 
                         if timestamp_mode == 'Custom':
                             col1, col2, col3 = st.columns(3)
@@ -946,6 +1610,16 @@ def main():
                                     value=st.session_state.get('selected_minute', datetime.now().minute),
                                     key=f"minute_input_{timestamp_column}"
                                 )
+                            time_scale = st.number_input(
+                                "Time Scale (x real time)",
+                                min_value=1.0,
+                                value=float(st.session_state['config'].get('time_scale') or 1.0),
+                                step=10.0,
+                                key=f"time_scale_{timestamp_column}",
+                                help="Advance the custom timestamps this many times faster than real time, still one write "
+                                     "frequency apart (60 writes an hour of data a minute). Use coalesce under When Ticks "
+                                     "Run Late so each rerun writes every tick that came due"
+                            )
                                 
                             if not st.session_state.get('running'):
                                 new_timestamp = datetime.combine(
@@ -965,6 +1639,130 @@ def main():
                     write_frequency = st.number_input("Write Frequency (seconds)", 
                                                     min_value=1, 
                                                     value=st.session_state['config'].get('write_frequency', 5))
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    default_rate_mode = st.session_state['config'].get('rate_mode') or RATE_MODES[0]
+                    rate_mode = st.selectbox(
+                        "Rate",
+                        RATE_MODES,
+                        index=RATE_MODES.index(default_rate_mode) if default_rate_mode in RATE_MODES else 0,
+                        help="write_frequency: one tick every Write Frequency seconds; ticks_per_second/rows_per_second: pace to Target Rate"
+                    )
+                with col2:
+                    target_rate = st.number_input("Target Rate (per second)", min_value=0.0,
+                                                  value=float(st.session_state['config'].get('target_rate') or 0.0),
+                                                  disabled=rate_mode == RATE_MODES[0])
+                with col3:
+                    default_missed = st.session_state['config'].get('missed_deadline_policy') or MISSED_POLICIES[0]
+                    missed_deadline_policy = st.selectbox(
+                        "When Ticks Run Late",
+                        MISSED_POLICIES,
+                        index=MISSED_POLICIES.index(default_missed) if default_missed in MISSED_POLICIES else 0,
+                        help="catch_up: emit every missed tick; skip: drop missed ticks; coalesce: emit missed ticks as one batch"
+                    )
+                col1, col2 = st.columns(2)
+                with col1:
+                    default_policy = st.session_state['config'].get('write_policy', WRITE_POLICIES[0])
+                    write_policy = st.selectbox(
+                        "When Writes Fall Behind",
+                        WRITE_POLICIES,
+                        index=WRITE_POLICIES.index(default_policy) if default_policy in WRITE_POLICIES else 0,
+                        help="block: wait for the writer; drop_oldest: discard the oldest queued batch; coalesce: merge queued batches into one write"
+                    )
+                with col2:
+                    write_queue_size = st.number_input("Write Queue Size (batches)",
+                                                       min_value=1,
+                                                       value=st.session_state['config'].get('write_queue_size', 10))
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    write_retries = st.number_input("Write Retries", min_value=0, max_value=20,
+                                                    value=st.session_state['config'].get('write_retries', 5),
+                                                    help="Retries per failed batch before it is spilled to disk; 0 stops the run on the first failure")
+                with col2:
+                    retry_backoff_seconds = st.number_input("Retry Backoff (seconds)", min_value=0.0, step=0.5,
+                                                            value=float(st.session_state['config'].get('retry_backoff_seconds', 0.5)),
+                                                            help="Wait before the first retry, doubled for each one after (up to 30s)")
+                with col3:
+                    dead_letter_dir = st.text_input("Dead-Letter Directory",
+                                                    value=st.session_state['config'].get('dead_letter_dir',
+                                                                                         os.path.join(tempfile.gettempdir(), 'simulator_dead_letter')) or "",
+                                                    help="Batches that still fail are saved here for sim_replay.py; leave empty to stop the run instead")
+                exactly_once = st.checkbox("Exactly-Once Writes",
+                                           value=st.session_state['config'].get('exactly_once', False),
+                                           help="table and stage paths: commit each batch through a staging table and the "
+                                                "SIMULATOR_BATCHES ledger so a retry never duplicates it (a few more statements per batch)")
+                col1, col2 = st.columns(2)
+                with col1:
+                    default_sink = st.session_state['config'].get('sink', SINKS[0])
+                    sink = st.selectbox(
+                        "Write Path",
+                        SINKS,
+                        index=SINKS.index(default_sink) if default_sink in SINKS else 0,
+                        help="table: Snowpark append; stage: compressed Parquet files loaded with COPY INTO; local_stage: local directory stand-in; simulated: offline stand-in with a fixed capacity; parquet, ndjson: rotating files in a local directory"
+                    )
+                with col2:
+                    preview_seconds = st.number_input("Preview Every (seconds)", min_value=0,
+                                                      value=st.session_state['config'].get('preview_seconds', 10),
+                                                      help="How often the Generator tab refreshes its batch preview; 0 hides it")
+                col1, col2 = st.columns(2)
+                with col1:
+                    seed_text = st.text_input("Random Seed",
+                                              value="" if st.session_state['config'].get('seed') is None else str(st.session_state['config']['seed']),
+                                              help="Leave empty for fresh values every run; the same seed reproduces the same data")
+                    try:
+                        seed = int(seed_text) if seed_text.strip() else None
+                    except ValueError:
+                        st.error("Random Seed must be a whole number")
+                        seed = st.session_state['config'].get('seed')
+                with col2:
+                    shards = st.number_input("Worker Processes", min_value=1,
+                                             value=st.session_state['config'].get('shards', 1),
+                                             help="Split the machines across this many processes for large fleets; rows are written from here")
+                compact_dtypes = st.checkbox("Compact Batch Types", value=st.session_state['config'].get('compact_dtypes', True),
+                                             help="Categorical machine and batch columns, narrow integers and float32 for NUMBER(p,s) columns where the stored values are unchanged")
+                stage_name = ""
+                if sink == 'stage':
+                    stage_name = st.text_input("Stage Name", value=st.session_state['config'].get('stage_name') or "",
+                                               help="Leave empty to use the target table's stage")
+                simulated_rows_per_second = st.session_state['config'].get('simulated_rows_per_second', 50000)
+                simulated_latency_seconds = st.session_state['config'].get('simulated_latency_seconds', 0.05)
+                simulated_error_rate = st.session_state['config'].get('simulated_error_rate', 0.0)
+                if sink == 'simulated':
+                    col1, col2, col3 = st.columns(3)
+                    with col1:
+                        simulated_rows_per_second = st.number_input("Simulated Rows/s", min_value=1,
+                                                                    value=int(simulated_rows_per_second))
+                    with col2:
+                        simulated_latency_seconds = st.number_input("Simulated Latency (seconds)", min_value=0.0,
+                                                                    value=float(simulated_latency_seconds), step=0.01)
+                    with col3:
+                        simulated_error_rate = st.number_input("Simulated Error Rate", min_value=0.0, max_value=1.0,
+                                                               value=float(simulated_error_rate), step=0.01)
+                output_dir = st.session_state['config'].get('output_dir') or 'simulator_output'
+                rotate_mb = st.session_state['config'].get('rotate_mb', 128.0)
+                rotate_seconds = st.session_state['config'].get('rotate_seconds', 0)
+                if sink in ('parquet', 'ndjson'):
+                    col1, col2, col3 = st.columns(3)
+                    with col1:
+                        output_dir = st.text_input("Output Directory", value=output_dir,
+                                                   help="Files are named after the table; unfinished files end in .part")
+                    with col2:
+                        rotate_mb = st.number_input("Roll File at MB", min_value=0.0, step=16.0, value=float(rotate_mb),
+                                                    help="0 never rolls by size")
+                    with col3:
+                        rotate_seconds = st.number_input("Roll File Every (seconds)", min_value=0, step=60,
+                                                         value=int(rotate_seconds), help="0 never rolls by age")
+                st.caption("Coalesce rows across ticks into fewer, larger writes (0 disables a limit, all 0 writes every tick)")
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    flush_rows = st.number_input("Flush at Rows", min_value=0, step=1000,
+                                                 value=st.session_state['config'].get('flush_rows', 0))
+                with col2:
+                    flush_mb = st.number_input("Flush at MB", min_value=0.0, step=1.0,
+                                               value=float(st.session_state['config'].get('flush_mb', 0.0)))
+                with col3:
+                    flush_seconds = st.number_input("Flush Every (seconds)", min_value=0, step=5,
+                                                    value=st.session_state['config'].get('flush_seconds', 0))
 
             # Save/Load Settings Section
             with st.expander("💾 Settings Management", expanded=True):
@@ -978,52 +1776,77 @@ def main():
         if selected_table:
             st.header("Machine Configuration")
             
-            # Machine Names Section
-            with st.expander("🏭 Machine Names", expanded=True):
-                num_machines = st.number_input("Number of Machines", 
-                                             min_value=1, 
-                                             max_value=10, 
-                                             value=len(st.session_state['config'].get('machine_names', ['Machine_1'])))
-                
-                cols = st.columns(3)
-                machine_names = []
-                for i in range(num_machines):
-                    col_index = i % 3
-                    with cols[col_index]:
-                        default_name = st.session_state['config'].get('machine_names', [])[i] if i < len(st.session_state['config'].get('machine_names', [])) else f"Machine_{i+1}"
-                        machine_name = st.text_input(f"Machine {i+1}", value=default_name)
-                        machine_names.append(machine_name)
-
-            # Machine Measures Section
-            st.subheader("Machine Measures")
-            machine_configs = {}
-            first_machine_settings = None
             available_measure_columns = [col for col in columns 
                                        if col not in [v for v in selected_special_columns.values() if v is not None]]
-            
-            for i, machine_name in enumerate(machine_names):
-                with st.expander(f"📊 {machine_name} Measures", expanded=(i==0)):
-                    measure_columns, machine_settings = create_measure_inputs(
-                        available_measure_columns,
-                        machine_name_column,
-                        batch_id_column,
-                        timestamp_column,
-                        machine_name,
-                        i == 0,
-                        first_machine_settings if i > 0 else None
-                    )
+
+            # Large fleets are easier to edit as one table than as one expander per machine
+            saved_names = st.session_state['config'].get('machine_names', ['Machine_1'])
+            editor_modes = ["Per Machine", "Table"]
+            machine_editor = st.radio(
+                "Machine Settings Editor",
+                editor_modes,
+                index=editor_modes.index(st.session_state['config'].get('machine_editor',
+                                                                        "Table" if len(saved_names) > 10 else "Per Machine")),
+                horizontal=True,
+                help="Table: every machine's measures in one grid, with copy-down and CSV/YAML import and export"
+            )
+            st.session_state['config']['machine_editor'] = machine_editor
+
+            if machine_editor == "Table":
+                with st.expander("🏭 Fleet Table", expanded=True):
+                    machine_names, machine_configs = fleet_table_editor(available_measure_columns)
+            else:
+                # The per-machine inputs start over from the saved configs next time the table is shown
+                st.session_state.pop('fleet_table', None)
+
+                # Machine Names Section
+                with st.expander("🏭 Machine Names", expanded=True):
+                    num_machines = st.number_input("Number of Machines", 
+                                                 min_value=1, 
+                                                 value=len(saved_names))
                     
-                    if i == 0:
-                        first_machine_settings = machine_settings
+                    cols = st.columns(3)
+                    machine_names = []
+                    for i in range(num_machines):
+                        col_index = i % 3
+                        with cols[col_index]:
+                            default_name = saved_names[i] if i < len(saved_names) else f"Machine_{i+1}"
+                            machine_name = st.text_input(f"Machine {i+1}", value=default_name)
+                            machine_names.append(machine_name)
+
+                # Machine Measures Section
+                st.subheader("Machine Measures")
+                machine_configs = {}
+                first_machine_settings = None
+                
+                for i, machine_name in enumerate(machine_names):
+                    with st.expander(f"📊 {machine_name} Measures", expanded=(i==0)):
+                        measure_columns, machine_settings = create_measure_inputs(
+                            available_measure_columns,
+                            machine_name_column,
+                            batch_id_column,
+                            timestamp_column,
+                            machine_name,
+                            i == 0,
+                            first_machine_settings if i > 0 else None
+                        )
                         
-                    machine_configs[machine_name] = {
-                        'measure_columns': measure_columns,
-                        'settings': machine_settings
-                    }
-                    
-                    if 'machine_configs' not in st.session_state:
-                        st.session_state['machine_configs'] = {}
-                    st.session_state['machine_configs'][machine_name] = machine_configs[machine_name]
+                        correlations = create_correlation_inputs(machine_name, machine_settings)
+                        cadence = create_cadence_inputs(machine_name)
+
+                        if i == 0:
+                            first_machine_settings = machine_settings
+                            
+                        machine_configs[machine_name] = {
+                            'measure_columns': measure_columns,
+                            'settings': machine_settings,
+                            'correlations': correlations,
+                            'cadence': cadence
+                        }
+                        
+                        if 'machine_configs' not in st.session_state:
+                            st.session_state['machine_configs'] = {}
+                        st.session_state['machine_configs'][machine_name] = machine_configs[machine_name]
 
     with tab_generator:
         if selected_table:
@@ -1037,6 +1860,13 @@ def main():
                 st.metric("Session Rows", st.session_state['current_session_rows'])
             with status_cols[2]:
                 st.metric("Status", "Running" if st.session_state['running'] else "Stopped")
+            run = st.session_state.get('run')
+            sharded = st.session_state.get('sharded')
+            with status_cols[3]:
+                if sharded is not None:
+                    st.metric("Write Queue", sharded.metrics().get('writer', {}).get('queue_depth', 0))
+                else:
+                    st.metric("Write Queue", run.metrics().get('writer', {}).get('queue_depth', 0) if run else 0)
             
             # Control Buttons
             control_cols = st.columns(3)
@@ -1044,14 +1874,29 @@ def main():
                 if control_cols[0].button("▶️ Start", use_container_width=True):
                     st.session_state['machine_configs'] = machine_configs
                     st.session_state['running'] = True
-                    st.session_state['last_batch_time'] = time_module.time()
                     st.session_state['current_session_rows'] = 0
-                    st.session_state['current_measure_values'] = {}
+                    st.session_state['fleet'] = None
+                    if st.session_state['config'].get('shards', 1) > 1:
+                        start_sharded(columns)
+                    else:
+                        start_run(columns)
             else:
                 if control_cols[0].button("⏹️ Stop", use_container_width=True):
                     st.session_state['running'] = False
+                    stop_run()
+                    stop_sharded()
                     st.rerun()
 
+            writer_metrics()
+
+            sharded_metrics()
+
+            scheduler_metrics()
+
+            stage_timings()
+
+            headless_status()
+
             
             
             # Out-of-Range Settings
@@ -1085,6 +1930,7 @@ def main():
                                         )
                                         if new_value != measure_settings['percent_outside']:
                                             st.session_state['machine_configs'][machine_name]['settings'][measure]['percent_outside'] = new_value
+                                            update_fleet_setting(get_fleet(), machine_name, measure, 'percent_outside', new_value)
                                     col_idx += 1
                         
                         if not has_random_measures:
@@ -1093,6 +1939,7 @@ def main():
                     with tabs[1]:  # Additive Mode tab
                         st.header("Increment Settings")
                         has_additive_measures = False
+                        current_measure_values = fleet_measure_values(get_fleet())
                         
                         for machine_name in st.session_state['machine_configs']:
                             additive_measures = [m for m, s in st.session_state['machine_configs'][machine_name]['settings'].items() 
@@ -1132,10 +1979,11 @@ def main():
                                         
                                         if new_increment != current_increment:
                                             st.session_state['machine_configs'][machine_name]['settings'][measure]['increment'] = new_increment
+                                            update_fleet_setting(get_fleet(), machine_name, measure, 'increment', new_increment)
                                             
                                         # Display current value
                                         measure_key = f"{machine_name}_{measure}"
-                                        current_val = st.session_state['current_measure_values'].get(measure_key, "N/A")
+                                        current_val = current_measure_values.get(measure_key, "N/A")
                                         st.text(f"Current value: {current_val}")
                                     col_idx += 1
                         
@@ -1150,6 +1998,31 @@ def main():
                 'timestamp_data_type': timestamp_data_type if timestamp_column else None,
                 'timestamp_mode': timestamp_mode if timestamp_column else None,
                 'write_frequency': write_frequency,
+                'rate_mode': rate_mode,
+                'target_rate': target_rate,
+                'time_scale': time_scale if timestamp_column else 1.0,
+                'missed_deadline_policy': missed_deadline_policy,
+                'write_policy': write_policy,
+                'write_queue_size': write_queue_size,
+                'write_retries': write_retries,
+                'retry_backoff_seconds': retry_backoff_seconds,
+                'dead_letter_dir': dead_letter_dir or None,
+                'exactly_once': exactly_once,
+                'sink': sink,
+                'stage_name': stage_name or None,
+                'simulated_rows_per_second': simulated_rows_per_second,
+                'simulated_latency_seconds': simulated_latency_seconds,
+                'simulated_error_rate': simulated_error_rate,
+                'output_dir': output_dir,
+                'rotate_mb': rotate_mb,
+                'rotate_seconds': rotate_seconds,
+                'preview_seconds': preview_seconds,
+                'seed': seed,
+                'shards': shards,
+                'compact_dtypes': compact_dtypes,
+                'flush_rows': flush_rows,
+                'flush_mb': flush_mb,
+                'flush_seconds': flush_seconds,
                 'selected_db': selected_db,
                 'selected_schema': selected_schema,
                 'selected_table': selected_table,
@@ -1158,108 +2031,74 @@ def main():
                 'current_timestamp': st.session_state.get('current_timestamp')
             })
 
-            # Data generation logic
-            if st.session_state['running']:
-                current_time = time_module.time()
-                
-                if current_time - st.session_state['last_batch_time'] >= st.session_state['config']['write_frequency']:
-                    # Handle timestamp increment
-                    if st.session_state['config'].get('timestamp_column'):
-                        current_mode = st.session_state['config'].get('timestamp_mode')
-                        write_frequency = st.session_state['config']['write_frequency']
-                        
-                        if current_mode == 'Current':
-                            st.session_state['current_timestamp'] = datetime.now()
-                        elif current_mode == 'Custom':
-                            try:
-                                current_ts = st.session_state['current_timestamp']
-                                if isinstance(current_ts, str):
-                                    current_ts = datetime.fromisoformat(current_ts)
-                                
-                                # Increment timestamp
-                                new_ts = current_ts + timedelta(seconds=write_frequency)
-                                
-                                # Update timestamp state
-                                st.session_state['current_timestamp'] = new_ts
-                                st.session_state['config']['current_timestamp'] = new_ts
-                                
-                            except Exception as e:
-                                st.error(f"Error incrementing timestamp: {e}")
-                                st.error("Current timestamp state:", st.session_state.get('current_timestamp'))
-                                st.session_state['running'] = False
-                            
-                            # Update all timestamp-related state atomically
-                            st.session_state['current_timestamp'] = new_ts
-                            st.session_state['selected_date'] = new_ts.date()
-                            st.session_state['selected_hour'] = new_ts.hour
-                            st.session_state['selected_minute'] = new_ts.minute
-                            st.session_state['config']['current_timestamp'] = new_ts
-                            st.session_state['config']['timestamp_mode'] = 'Custom'  # Ensure mode stays Custom
-                        
-                    if st.session_state.get('current_timestamp') and st.sidebar.checkbox("Show Timestamp Debug", value=False, key="timestamp_debug_checkbox"):
-                        st.sidebar.write("Current Timestamp:", st.session_state['current_timestamp'])
+            if not st.session_state['running']:
+                scenario_controls()
+                backfill_controls(columns)
+                load_test_controls(columns)
+                replay_controls(columns)
+
+            # Sharded runs generate in worker processes; roll their progress up into the row metrics
+            if st.session_state['running'] and st.session_state.get('sharded') is not None:
+                metrics = st.session_state['sharded'].metrics()
+                new_rows = metrics['total_rows'] - st.session_state['sharded_rows']
+                st.session_state['sharded_rows'] = metrics['total_rows']
+                st.session_state['total_rows_generated'] += new_rows
+                st.session_state['current_session_rows'] += new_rows
+                if metrics['errors'] or metrics['failed_shards']:
+                    st.error(f"Error writing to Snowflake: {metrics['last_error']}")
+                    st.session_state['running'] = False
+                    stop_sharded()
+                elif not metrics['alive']:
+                    st.session_state['running'] = False
+                    stop_sharded()
 
-                    # Generate batch rows
-                    batch_rows = []
-                    for machine_name in st.session_state['config']['machine_names']:
-                        machine_config = st.session_state['machine_configs'][machine_name]
-                        
-                        # Initialize row data
-                        row_data = {col: None for col in columns}
-                        
-                        if st.session_state['config']['machine_name_column']:
-                            row_data[st.session_state['config']['machine_name_column']] = machine_name
-                        
-                        if st.session_state['config']['batch_id_column']:
-                            row_data[st.session_state['config']['batch_id_column']] = st.session_state['config']['batch_id']
-                        
-                        if st.session_state['config']['timestamp_column']:
-                            row_data[st.session_state['config']['timestamp_column']] = format_timestamp_for_snowflake(
-                                st.session_state['current_timestamp'],
-                                st.session_state['config']['timestamp_data_type']
-                            )
-                        
-                        for measure in machine_config['measure_columns']:
-                            settings = machine_config['settings'].get(measure, {})
-                            if settings.get('include', False):
-                                measure_key = f"{machine_name}_{measure}"
-                                
-                                if settings['mode'] == 'additive':
-                                    if measure_key not in st.session_state['current_measure_values']:
-                                        st.session_state['current_measure_values'][measure_key] = settings['initial_value']
-                                    
-                                    current_value = st.session_state['current_measure_values'][measure_key]
-                                    new_value = generate_measure_value(settings, settings['data_type'], current_value)
-                                    row_data[measure] = new_value
-                                    st.session_state['current_measure_values'][measure_key] = new_value
-                                else:
-                                    row_data[measure] = generate_measure_value(settings, settings['data_type'])
-                        
-                        batch_rows.append(row_data)
-                        st.session_state['total_rows_generated'] += 1
-                        st.session_state['current_session_rows'] += 1
+                time_module.sleep(RUN_REFRESH_SECONDS)
+                if st.session_state['running']:
+                    st.rerun()
 
-                    if batch_rows:
-                        df = pd.DataFrame(batch_rows)
-                        try:
-                            session = snowflake.snowpark.context.get_active_session()
-                            success = write_to_snowflake(
-                                session, 
-                                df, 
-                                st.session_state['config']['selected_db'], 
-                                st.session_state['config']['selected_schema'], 
-                                st.session_state['config']['selected_table']
-                            )
-                            if not success:
-                                st.session_state['running'] = False
-                        except Exception as e:
-                            st.error(f"Failed to connect to Snowflake: {str(e)}")
-                            st.session_state['running'] = False
-                    
-                    st.session_state['last_batch_time'] = time_module.time()
+            # The background run generates and writes; the script only refreshes its progress at a fixed pace
+            elif st.session_state['running']:
+                run = st.session_state.get('run')
+                if run is None:
+                    start_run(columns)
+                    run = st.session_state['run']
+                metrics = run.metrics()
+                new_rows = metrics['total_rows'] - st.session_state.get('run_rows', 0)
+                st.session_state['run_rows'] = metrics['total_rows']
+                st.session_state['total_rows_generated'] += new_rows
+                st.session_state['current_session_rows'] += new_rows
+
+                if metrics.get('last_timestamp') is not None:
+                    st.session_state['current_timestamp'] = metrics['last_timestamp']
+                    if st.session_state['config'].get('timestamp_mode') == 'Custom':
+                        # The timestamp inputs follow the run, so Stop then Start carries on from there
+                        new_ts = pd.Timestamp(metrics['last_timestamp']).to_pydatetime()
+                        st.session_state['current_timestamp'] = new_ts
+                        st.session_state['selected_date'] = new_ts.date()
+                        st.session_state['selected_hour'] = new_ts.hour
+                        st.session_state['selected_minute'] = new_ts.minute
+                        st.session_state['config']['current_timestamp'] = new_ts
+                if st.session_state.get('current_timestamp') and st.sidebar.checkbox("Show Timestamp Debug", value=False, key="timestamp_debug_checkbox"):
+                    st.sidebar.write("Current Timestamp:", st.session_state['current_timestamp'])
+
+                if run.last_batch is not None and len(run.last_batch):
+                    preview_batch(
+                        run.last_batch,
+                        st.session_state['config']['selected_db'],
+                        st.session_state['config']['selected_schema'],
+                        st.session_state['config']['selected_table']
+                    )
 
-                time_module.sleep(0.1)
-                
+                # Writes are retried and then dead-lettered, so only a batch that couldn't be saved anywhere stops the run
+                if metrics['state'] == 'Failed':
+                    st.error(f"Error writing to Snowflake: {metrics['last_error']}")
+                    st.session_state['running'] = False
+                    stop_run()
+                elif not run.running:
+                    st.session_state['running'] = False
+                    stop_run()
+
+                time_module.sleep(RUN_REFRESH_SECONDS)
                 if st.session_state['running']:
                     st.rerun()
 